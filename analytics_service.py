@@ -1,108 +1,85 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
-from database import Session, User, Property, Booking, Rating
-from sqlalchemy import func, extract
+from database import ReadSession, User, Property, Booking, Rating, UserActivity
+from sqlalchemy import select, func
+from user_cache import user_cache
+from market_trends import market_trends
+from stats_service import (
+    StatsService, TOTAL, USERS, USERS_NEW, PROPERTIES, PROPERTIES_NEW,
+    ACTIVE_PROPERTIES, ACTIVE_PRICE_SUM, ACTIVE_PRICE_COUNT
+)
 
 class AnalyticsService:
     @staticmethod
-    def get_dashboard_stats():
-        """Получает статистику для дашборда"""
-        session = Session()
-        try:
-            today = datetime.now().date()
-            week_ago = today - timedelta(days=7)
-            month_ago = today - timedelta(days=30)
-            
-            # Основная статистика
-            total_users = session.query(User).count()
-            total_properties = session.query(Property).count()
-            active_properties = session.query(Property).filter(Property.status == 'active').count()
-            
-            # Статистика за неделю
-            new_users_week = session.query(User).filter(User.created_at >= week_ago).count()
-            new_properties_week = session.query(Property).filter(Property.created_at >= week_ago).count()
-            
-            # Статистика по ролям
-            roles_stats = session.query(
-                User.role,
-                func.count(User.id)
-            ).group_by(User.role).all()
-            
-            # Популярные районы
-            popular_districts = session.query(
-                Property.district,
-                func.count(Property.id)
-            ).filter(Property.status == 'active').group_by(Property.district).order_by(
-                func.count(Property.id).desc()
-            ).limit(10).all()
-            
-            # Статистика цен
-            avg_price = session.query(func.avg(Property.price_uzs)).filter(
-                Property.status == 'active'
-            ).scalar() or 0
-            
-            return {
-                'total_users': total_users,
-                'total_properties': total_properties,
-                'active_properties': active_properties,
-                'new_users_week': new_users_week,
-                'new_properties_week': new_properties_week,
-                'roles_stats': dict(roles_stats),
-                'popular_districts': dict(popular_districts),
-                'avg_price': avg_price
+    async def get_dashboard_stats():
+        """Получает статистику для дашборда из сводки daily_stats"""
+        today = datetime.now().date()
+        week_ago = (today - timedelta(days=7)).isoformat()
+
+        totals = defaultdict(dict)
+        new_users_week = new_properties_week = 0
+        for period, metric, dimension, value in await StatsService.get_rows(since=week_ago):
+            if period == TOTAL:
+                totals[metric][dimension] = value
+            elif metric == USERS_NEW:
+                new_users_week += value
+            elif metric == PROPERTIES_NEW:
+                new_properties_week += value
+
+        # Статистика по ролям (None - пользователи, еще не выбравшие роль)
+        roles_stats = {role or None: int(count) for role, count in totals[USERS].items() if count}
+
+        # Популярные районы
+        districts = sorted(
+            ((district or None, int(count)) for district, count in totals[ACTIVE_PROPERTIES].items() if count),
+            key=lambda item: item[1], reverse=True
+        )[:10]
+
+        # Статистика цен
+        price_count = totals[ACTIVE_PRICE_COUNT].get('', 0)
+        avg_price = totals[ACTIVE_PRICE_SUM].get('', 0) / price_count if price_count else 0
+
+        return {
+            'total_users': int(sum(totals[USERS].values())),
+            'total_properties': int(totals[PROPERTIES].get('', 0)),
+            'active_properties': int(sum(totals[ACTIVE_PROPERTIES].values())),
+            'new_users_week': int(new_users_week),
+            'new_properties_week': int(new_properties_week),
+            'roles_stats': roles_stats,
+            'popular_districts': dict(districts),
+            'avg_price': avg_price,
+            'user_cache': {
+                **user_cache.stats,
+                'size': len(user_cache),
+                'hit_rate': round(user_cache.hit_rate(), 3)
             }
-            
-        finally:
-            session.close()
-    
+        }
+
     @staticmethod
-    def get_market_trends(district=None, property_type=None):
-        """Анализирует рыночные тренды"""
-        session = Session()
-        try:
-            # Анализ цен по месяцам
-            price_trends = session.query(
-                extract('year', Property.created_at).label('year'),
-                extract('month', Property.created_at).label('month'),
-                func.avg(Property.price_uzs).label('avg_price'),
-                func.count(Property.id).label('count')
-            ).filter(Property.status == 'active')
-            
-            if district:
-                price_trends = price_trends.filter(Property.district == district)
-            if property_type:
-                price_trends = price_trends.filter(Property.property_type == property_type)
-            
-            price_trends = price_trends.group_by('year', 'month').order_by('year', 'month').all()
-            
-            return [
-                {
-                    'period': f"{int(trend.month)}/{int(trend.year)}",
-                    'avg_price': trend.avg_price,
-                    'count': trend.count
-                }
-                for trend in price_trends
-            ]
-            
-        finally:
-            session.close()
-    
+    async def get_market_trends(district=None, property_type=None, rooms=None):
+        """Анализирует рыночные тренды: по месяцам объем, средняя и медианная цена,
+        p25/p75 и медианная цена за м² (из снимка market_trends)"""
+        return await market_trends.get_trends(district or None, property_type or None, rooms)
+
+    @staticmethod
+    async def get_market_segments():
+        """Рыночные тренды по месяцам для каждой пары район/тип"""
+        return await market_trends.get_segments()
+
     @staticmethod
-    def get_user_activity(user_id, days=30):
+    async def get_user_activity(user_id, days=30):
         """Анализирует активность пользователя"""
-        session = Session()
-        try:
+        async with ReadSession() as session:
             start_date = datetime.now() - timedelta(days=days)
-            
+
             # Статистика действий пользователя
-            activities = session.query(
-                UserActivity.activity_type,
-                func.count(UserActivity.id)
-            ).filter(
-                UserActivity.user_id == user_id,
-                UserActivity.created_at >= start_date
-            ).group_by(UserActivity.activity_type).all()
-            
+            activities = (await session.execute(
+                select(UserActivity.activity_type, func.count(UserActivity.id))
+                .where(
+                    UserActivity.user_id == user_id,
+                    UserActivity.created_at >= start_date
+                )
+                .group_by(UserActivity.activity_type)
+            )).all()
+
             return dict(activities)
-            
-        finally:
-            session.close()
@@ -0,0 +1,137 @@
+"""Бенчмарк полнотекстового поиска: FTS5 против LIKE на 100k объявлений.
+
+Запуск из корня репозитория:
+    python -m benchmarks.fts [--listings 100000]
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, insert, or_, select, text
+
+from database import Base, Property
+from fulltext import fts_query
+from migrations import property_fulltext, property_search_text
+from search_service import FTS_RANK_DIGITS, FTS_WEIGHTS
+
+DISTRICTS = ["Центр", "Старгород", "Гидропарк", "Северный", "Южный",
+             "Восточный", "Западный", "Промзона", "Кирзавод", "Текстильщик"]
+TYPES = ["apartment", "house", "office", "commercial", "rent", "new_building"]
+STATUSES = ["active"] * 6 + ["sold", "archived", "suspicious"]
+
+PHRASES = [
+    "евроремонт", "свежий ремонт", "рядом школа и детский сад", "вид на парк", "мебель и техника",
+    "тихий двор", "собственник", "торг уместен", "новостройка", "кирпичный дом", "большой балкон",
+    "yangi ta'mir", "maktab va bog'cha yonida", "mebel bilan", "hovli keng", "uy egasidan",
+    "янги уй", "ҳовлида боғ", "metro yaqin", "renovated", "close to the park", "furnished",
+    "quiet street", "parking space", "автостоянка", "кондиционер", "bozor yonida", "ikki qavatli",
+]
+STREETS = ["ул. Навои", "ул. Амира Темура", "ул. Мустакиллик", "Bobur ko'chasi", "Yoshlik ko'chasi",
+           "ул. Гагарина", "мкр. Северный", "Gulzor mahallasi", "ул. Ташкентская", "Chirchiq ko'chasi"]
+
+# Запросы: (слова, фильтровать ли по району и цене)
+QUERIES = [
+    ("ремонт", False), ("парк", False), ("боғча", False), ("mebel", False), ("park", False),
+    ("садик", False), ("янги уй", False), ("навои", False), ("ремонт парк", False),
+    ("ремонт", True), ("mebel", True), ("тихий двор", True),
+]
+
+
+def populate(conn, listings: int, rnd: random.Random):
+    """Заполняет базу объявлениями с описаниями на русском, узбекском и английском"""
+    conn.execute(insert(Property), [
+        {
+            'user_id': 10_000 + rnd.randrange(listings // 5),
+            'property_type': rnd.choice(TYPES),
+            'district': rnd.choice(DISTRICTS),
+            'address': f"{rnd.choice(STREETS)}, {rnd.randint(1, 120)}",
+            'price_uzs': rnd.randrange(50, 2000) * 1_000_000.0,
+            'rooms': rnd.randint(1, 6),
+            'area': rnd.uniform(20, 250),
+            'description': ', '.join(rnd.sample(PHRASES, rnd.randint(3, 8))),
+            'status': rnd.choice(STATUSES),
+        }
+        for _ in range(listings)
+    ])
+
+
+def fts_statement(query: str, filtered: bool):
+    """Запрос в том виде, в каком его выполняет SearchService.search_text"""
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    sql = (
+        f"WITH matches AS MATERIALIZED (SELECT rowid AS id, bm25(property_fts, {weights}) AS score "
+        "FROM property_fts WHERE property_fts MATCH :match), "
+        f"ranked AS (SELECT id, round(1 - score / (SELECT min(score) FROM matches), {FTS_RANK_DIGITS}) AS rank "
+        "FROM matches) "
+        "SELECT properties.* FROM properties JOIN ranked ON ranked.id = properties.id "
+        "WHERE properties.status = 'active'"
+    )
+    if filtered:
+        sql += " AND properties.district = 'Центр' AND properties.price_uzs BETWEEN 300000000 AND 900000000"
+    sql += " ORDER BY ranked.rank, properties.id LIMIT 11"
+    return text(sql).bindparams(match=fts_query(query))
+
+
+def like_statement(query: str, filtered: bool):
+    """Тот же поиск через LIKE '%слово%' по исходному тексту"""
+    conditions = [Property.status == 'active']
+    for word in query.split():
+        pattern = f'%{word}%'
+        conditions.append(or_(Property.description.like(pattern), Property.address.like(pattern)))
+    if filtered:
+        conditions += [Property.district == 'Центр', Property.price_uzs.between(300_000_000, 900_000_000)]
+    return select(Property).where(*conditions).order_by(Property.id).limit(11)
+
+
+def measure(conn, build, repeat: int):
+    """Средняя задержка каждого запроса в миллисекундах"""
+    results = {}
+    for query, filtered in QUERIES:
+        statement = build(query, filtered)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(statement).all()
+        results[(query, filtered)] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    engine = create_engine('sqlite://')
+
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        populate(conn, args.listings, rnd)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        property_fulltext(conn)
+        property_search_text(conn)
+    print(f"FTS index built in {time.perf_counter() - started:.1f} s")
+
+    with engine.connect() as conn:
+        like = measure(conn, like_statement, args.repeat)
+        fts = measure(conn, fts_statement, args.repeat)
+        # LIKE останавливается на первых 11 строках, FTS5 ранжирует все совпадения
+        matches = {
+            query: conn.scalar(text("SELECT count(*) FROM property_fts WHERE property_fts MATCH :match")
+                               .bindparams(match=fts_query(query)))
+            for query, _ in QUERIES
+        }
+
+    print(f"{'query':<28}{'matches':>9}{'LIKE, ms':>10}{'FTS5, ms':>10}{'speedup':>10}")
+    for query, filtered in QUERIES:
+        name = query + (' +filters' if filtered else '')
+        like_ms, fts_ms = like[(query, filtered)], fts[(query, filtered)]
+        speedup = like_ms / fts_ms if fts_ms else float('inf')
+        print(f"{name:<28}{matches[query]:>9}{like_ms:>10.3f}{fts_ms:>10.3f}{speedup:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Бенчмарк поиска по координатам: сетка против полного перебора на 100k объявлений.
+
+Запуск из корня репозитория:
+    python -m benchmarks.geo [--listings 100000]
+"""
+import argparse
+import random
+import time
+
+from config import GEO_DISTRICTS_FILE
+from geo import DistrictMap, distance_m
+from geo_index import GeoIndex
+
+# Рамка Чирчика
+SOUTH, WEST, NORTH, EAST = 41.43, 69.53, 41.52, 69.64
+RADII_M = (300, 1000, 3000)
+
+
+def scan(points, latitude: float, longitude: float, radius_m: float, limit: int):
+    """Поиск в радиусе без индекса: расстояние до каждого объявления"""
+    found = sorted(
+        (distance, property_id)
+        for property_id, (point_latitude, point_longitude) in points.items()
+        for distance in (distance_m(latitude, longitude, point_latitude, point_longitude),)
+        if distance <= radius_m
+    )
+    return [property_id for _, property_id in found[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    points = {
+        property_id: (rnd.uniform(SOUTH, NORTH), rnd.uniform(WEST, EAST))
+        for property_id in range(1, args.listings + 1)
+    }
+    index = GeoIndex()
+    started = time.perf_counter()
+    for property_id, (latitude, longitude) in points.items():
+        index._add(property_id, latitude, longitude)
+    print(f"Grid built in {time.perf_counter() - started:.2f} s")
+
+    centers = [(rnd.uniform(SOUTH, NORTH), rnd.uniform(WEST, EAST)) for _ in range(args.repeat)]
+    print(f"{'radius, m':<12}{'found':>8}{'scan, ms':>10}{'grid, ms':>10}{'speedup':>10}")
+    for radius in RADII_M:
+        started = time.perf_counter()
+        expected = [scan(points, latitude, longitude, radius, 10) for latitude, longitude in centers]
+        scan_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+        started = time.perf_counter()
+        results = [index.nearby(latitude, longitude, radius, limit=10) for latitude, longitude in centers]
+        grid_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+        assert [ids for ids, _, _ in results] == expected
+        found = sum(total for _, total, _ in results) // args.repeat
+        print(f"{radius:<12}{found:>8}{scan_ms:>10.3f}{grid_ms:>10.3f}{scan_ms / grid_ms:>9.1f}x")
+
+    districts = DistrictMap.from_file(GEO_DISTRICTS_FILE)
+    sample = list(points.values())[:10_000]
+    started = time.perf_counter()
+    for latitude, longitude in sample:
+        districts.district_of(latitude, longitude)
+    print(f"District lookup: {(time.perf_counter() - started) / len(sample) * 1e6:.1f} us per point")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Бенчмарк индексов: задержка горячих запросов на 100k объявлений до и после.
+
+Запуск из корня репозитория:
+    python -m benchmarks.indexes [--listings 100000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, func, and_, insert, text
+
+from database import (
+    Base, User, Property, Favorite, Subscription, Rating, ChatMessage, Booking
+)
+
+DISTRICTS = ["Центр", "Старгород", "Гидропарк", "Северный", "Южный",
+             "Восточный", "Западный", "Промзона", "Кирзавод", "Текстильщик"]
+TYPES = ["apartment", "house", "office", "commercial", "rent", "new_building"]
+STATUSES = ["active"] * 6 + ["sold", "archived", "suspicious"]
+
+
+def populate(conn, listings: int, rnd: random.Random):
+    """Заполняет базу синтетическими данными"""
+    now = datetime.now()
+    users = max(1000, listings // 5)
+
+    conn.execute(insert(User), [
+        {'telegram_id': 10_000 + i, 'full_name': f'user{i}', 'role': rnd.choice(['seller', 'buyer', 'realtor'])}
+        for i in range(users)
+    ])
+    conn.execute(insert(Property), [
+        {
+            'user_id': 10_000 + rnd.randrange(users),
+            'property_type': rnd.choice(TYPES),
+            'district': rnd.choice(DISTRICTS),
+            'price_uzs': rnd.randrange(50, 2000) * 1_000_000.0,
+            'rooms': rnd.randint(1, 6),
+            'area': rnd.uniform(20, 250),
+            'status': rnd.choice(STATUSES),
+            'created_at': now - timedelta(minutes=rnd.randrange(365 * 24 * 60)),
+        }
+        for _ in range(listings)
+    ])
+    conn.execute(insert(Favorite), [
+        {'user_id': 10_000 + rnd.randrange(users), 'property_id': rnd.randrange(1, listings)}
+        for _ in range(listings)
+    ])
+    conn.execute(insert(Subscription), [
+        {'user_id': 10_000 + i, 'role': 'realtor', 'end_date': now + timedelta(days=rnd.randint(-60, 60)),
+         'is_active': rnd.random() < 0.5}
+        for i in range(0, users, 3)
+    ])
+    conn.execute(insert(Rating), [
+        {'target_user_id': 10_000 + rnd.randrange(users), 'author_user_id': 10_000 + rnd.randrange(users),
+         'rating': rnd.randint(1, 5)}
+        for _ in range(listings // 2)
+    ])
+    conn.execute(insert(ChatMessage), [
+        {'chat_id': rnd.randrange(listings // 10), 'sender_id': 10_000 + rnd.randrange(users),
+         'message': 'hi', 'sent_at': now - timedelta(seconds=rnd.randrange(10 ** 7))}
+        for _ in range(listings)
+    ])
+    conn.execute(insert(Booking), [
+        {'property_id': rnd.randrange(1, listings), 'user_id': 10_000 + rnd.randrange(users),
+         'check_in': now + timedelta(days=d), 'check_out': now + timedelta(days=d + 3),
+         'status': rnd.choice(['pending', 'confirmed'])}
+        for d in (rnd.randrange(365) for _ in range(listings // 5))
+    ])
+    return users
+
+
+def hot_queries(users: int, listings: int, rnd: random.Random):
+    """Запросы в том виде, в каком их выполняют сервисы"""
+    now = datetime.now()
+    return {
+        'user by telegram_id': lambda: select(User).where(User.telegram_id == 10_000 + rnd.randrange(users)),
+        'search type+district+price': lambda: select(Property).where(
+            Property.status == 'active',
+            Property.property_type == rnd.choice(TYPES),
+            Property.district == rnd.choice(DISTRICTS),
+            Property.price_uzs >= 300_000_000,
+            Property.price_uzs <= 600_000_000,
+        ).order_by(Property.created_at.desc()).limit(10),
+        'saved search new listings': lambda: select(Property).where(
+            Property.status == 'active',
+            Property.created_at > now - timedelta(hours=6),
+        ).order_by(Property.created_at.desc()).limit(10),
+        'user listings (24h)': lambda: select(func.count(Property.id)).where(
+            Property.user_id == 10_000 + rnd.randrange(users),
+            Property.created_at >= now - timedelta(days=1),
+        ),
+        'favorites of property': lambda: select(Favorite).where(Favorite.property_id == rnd.randrange(1, listings)),
+        'active subscription': lambda: select(Subscription).where(
+            Subscription.user_id == 10_000 + rnd.randrange(users),
+            Subscription.is_active == True,
+        ),
+        'rating distribution': lambda: select(Rating.rating, func.count(Rating.id)).where(
+            Rating.target_user_id == 10_000 + rnd.randrange(users)
+        ).group_by(Rating.rating),
+        'chat history': lambda: select(ChatMessage).where(
+            ChatMessage.chat_id == rnd.randrange(listings // 10)
+        ).order_by(ChatMessage.sent_at.desc()).limit(50),
+        'booking conflicts': lambda: select(func.count(Booking.id)).where(
+            Booking.property_id == rnd.randrange(1, listings),
+            Booking.status == 'confirmed',
+            and_(Booking.check_in < now + timedelta(days=40), Booking.check_out > now + timedelta(days=37)),
+        ),
+    }
+
+
+def measure(conn, queries, repeat: int):
+    """Средняя задержка каждого запроса в миллисекундах"""
+    results = {}
+    for name, build in queries.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(build()).all()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    engine = create_engine('sqlite://')
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        for index in indexes:
+            index.drop(conn)
+        users = populate(conn, args.listings, rnd)
+
+    queries = hot_queries(users, args.listings, rnd)
+    with engine.connect() as conn:
+        before = measure(conn, queries, args.repeat)
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(conn)
+        conn.execute(text('ANALYZE'))
+
+    with engine.connect() as conn:
+        after = measure(conn, queries, args.repeat)
+
+    print(f"{'query':<30}{'before, ms':>12}{'after, ms':>12}{'speedup':>10}")
+    for name in queries:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<30}{before[name]:>12.3f}{after[name]:>12.3f}{speedup:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
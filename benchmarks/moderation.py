@@ -0,0 +1,110 @@
+"""Бенчмарк текстовой модерации: пропускная способность на синтетических описаниях.
+
+Сравнивает:
+- legacy: прежняя проверка (lower, цикл по четырем словам, regex при каждом вызове);
+- naive: те же правила, что у движка, поиском каждого шаблона в тексте;
+- engine: выражение по дереву шаблонов (ModerationEngine), по одному описанию;
+- batch: то же выражение, вся пачка одним проходом (check_many).
+
+С --extra-rules к правилам добавляются синтетические шаблоны: время naive
+растет с числом правил, время движка почти не меняется. Проверяет также,
+что batch и engine находят одно и то же.
+
+Запуск из корня репозитория:
+    python -m benchmarks.moderation [--listings 20000] [--repeat 3] [--extra-rules 1000]
+"""
+import argparse
+import random
+import re
+import time
+
+from moderation_engine import ModerationEngine, RULES, PHONE_RE
+
+LETTERS = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+
+FILLER = {
+    'ru': "квартира в хорошем состоянии рядом школа детский сад и остановка ремонт мебель техника "
+          "балкон застеклен тихий двор парковка документы готовы собственник".split(),
+    'uz': "kvartira yaxshi holatda yaqinida maktab bog'cha va bekat ta'mir mebel texnika "
+          "balkon oynalangan tinch hovli avtoturargoh hujjatlar tayyor".split(),
+    'en': "apartment in good condition near school kindergarten and bus stop renovated furniture "
+          "appliances glazed balcony quiet yard parking documents ready owner".split(),
+}
+
+
+def make_descriptions(count: int, rnd: random.Random):
+    """Описания на трех языках; примерно у трети есть спам, контакты или ссылки"""
+    rule_words = [word.rstrip('*') for words in RULES.values() for word in words]
+    descriptions = []
+    for _ in range(count):
+        words = [rnd.choice(FILLER[rnd.choice(list(FILLER))]) for _ in range(rnd.randint(20, 80))]
+        if rnd.random() < 0.33:
+            for _ in range(rnd.randint(1, 4)):
+                words.insert(rnd.randrange(len(words)), rnd.choice(rule_words))
+        if rnd.random() < 0.1:
+            words.append(f"+998 9{rnd.randint(0, 9)} {rnd.randint(100, 999)} {rnd.randint(10, 99)} {rnd.randint(10, 99)}")
+        descriptions.append(' '.join(words).capitalize())
+    return descriptions
+
+
+def legacy_check(description: str) -> int:
+    """Прежняя проверка описания из ModerationService.auto_moderate_property"""
+    penalty = 0
+    text = description.lower()
+    spam_keywords = ['купить', 'продать', 'срочно', 'недорого']
+    if sum(1 for keyword in spam_keywords if keyword in text) > 3:
+        penalty += 20
+    if re.search(r'[\+\(]?[1-9][0-9 .\-\(\)]{8,}[0-9]', description):
+        penalty += 15
+    return penalty
+
+
+def naive_check(description: str, patterns) -> int:
+    text = description.lower()
+    hits = sum(1 for pattern in patterns if pattern in text)
+    return hits + bool(PHONE_RE.search(description))
+
+
+def measure(name: str, run, count: int, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<8}{count / best:>12,.0f} listings/s  ({best * 1000:.0f} ms)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--extra-rules', type=int, default=0, help='синтетических шаблонов сверх RULES')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    descriptions = make_descriptions(args.listings, rnd)
+    rules = {category: list(words) for category, words in RULES.items()}
+    rules['spam'] += [''.join(rnd.choice(LETTERS) for _ in range(rnd.randint(5, 10))) for _ in range(args.extra_rules)]
+
+    started = time.perf_counter()
+    engine = ModerationEngine(rules)
+    print(f"{sum(map(len, rules.values()))} rules, matcher built in {(time.perf_counter() - started) * 1000:.1f} ms; "
+          f"{args.listings} descriptions, {sum(map(len, descriptions)) / len(descriptions):.0f} chars avg")
+
+    patterns = [word.rstrip('*') for words in rules.values() for word in words]
+    measure('legacy', lambda: [legacy_check(text) for text in descriptions], args.listings, args.repeat)
+    measure('naive', lambda: [naive_check(text, patterns) for text in descriptions], args.listings, args.repeat)
+    single = measure('engine', lambda: [engine.check_text(text) for text in descriptions], args.listings, args.repeat)
+    batch = measure('batch', lambda: engine.check_many(descriptions), args.listings, args.repeat)
+    print(f"batch vs engine: {single / batch:.2f}x")
+
+    results = engine.check_many(descriptions)
+    assert results == [engine.check_text(text) for text in descriptions], 'batch и одиночная проверка расходятся'
+    flagged = sum(1 for penalty, _ in results if penalty)
+    print(f"flagged {flagged} of {args.listings} ({flagged / args.listings:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Фейковый клиент Telegram для режима webhook: задержка ответа и пропускная способность.
+
+Без --url поднимает в процессе WebhookServer с планировщиком UpdateScheduler
+и обработчиком, имитирующим работу с БД и API (--handler-ms), и сравнивает
+один слот (последовательная обработка) с пулом слотов. Проверяет также отказ
+без секрета и порядок обновлений одного пользователя, а под перегрузкой -
+задержку действий администратора и отбрасывание пагинации.
+
+С --url шлет обновления на уже запущенный бот (BOT_MODE=webhook).
+
+Запуск из корня репозитория:
+    python -m benchmarks.webhook [--updates 2000] [--users 200] [--concurrency 16] [--handler-ms 20]
+    python -m benchmarks.webhook --url http://127.0.0.1:8080/webhook --secret SECRET
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:fake-token-for-benchmark')
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+
+from middlewares import UpdateScheduler
+from pagination import cursor_callback, encode_cursor
+from webhook import WebhookServer, SECRET_HEADER
+
+SECRET = 'benchmark-secret'
+# Кнопка "Вперед" списка результатов поиска - в том виде, в каком ее шлют списки
+NEXT_PAGE = cursor_callback('search', encode_cursor((1_700_000_000, 42)))
+# Администраторы - отдельные пользователи, чтобы их действия не ждали друг друга
+ADMIN_IDS = [10 ** 6 + n for n in range(10)]
+
+# Предупреждения о долгом ожидании в очереди здесь ожидаемы
+logging.getLogger('webhook').setLevel(logging.ERROR)
+
+
+class FakeSession(AiohttpSession):
+    """Сессия без сети: ответы на отброшенные нажатия не уходят в Telegram"""
+
+    def __init__(self):
+        super().__init__()
+        # Запросы к API: здесь только answerCallbackQuery
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        return True
+
+
+def make_user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'language_code': 'ru'}
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    """Обновление с текстовым сообщением, как его присылает Telegram"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': make_user(user_id),
+            'text': f'message {update_id}',
+        },
+    }
+
+
+def make_callback(update_id: int, user_id: int, data: str) -> dict:
+    """Обновление с нажатием inline-кнопки"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': make_user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+        },
+    }
+
+
+async def post_updates(url: str, secret: str, updates: int, users: int, concurrency: int = 100, payloads=None):
+    """Отправляет обновления, возвращает задержки ответов (мс) и коды ответов"""
+    payloads = payloads or [make_update(update_id, update_id % users + 2) for update_id in range(1, updates + 1)]
+    latencies = []
+    statuses = defaultdict(int)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as client:
+        async def post(payload):
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.post(url, json=payload, headers={SECRET_HEADER: secret}) as response:
+                    statuses[response.status] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(post(payload) for payload in payloads))
+    return latencies, dict(statuses)
+
+
+def report(name: str, latencies, statuses, elapsed: float, processed: int):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<14}{processed / elapsed:>8.0f} upd/s  "
+          f"ack p50={statistics.median(latencies):6.1f}ms p99={p99:6.1f}ms  {statuses}")
+
+
+async def start_server(concurrency: int, handler_ms: float, max_pending: int, shed_threshold: int):
+    """Поднимает WebhookServer на свободном порту, возвращает (server, runner, url, done)"""
+    bot = Bot(os.environ['TELEGRAM_TOKEN'], session=FakeSession())
+    dp = Dispatcher()
+    scheduler = UpdateScheduler(concurrency=concurrency, shed_threshold=shed_threshold, admin_ids=ADMIN_IDS)
+    dp.update.outer_middleware(scheduler)
+    # update_id -> время завершения обработки; порядок обработки по пользователям
+    done = {'finished': {}, 'seen': defaultdict(list), 'scheduler': scheduler}
+
+    @dp.message()
+    async def on_message(message: types.Message):
+        await asyncio.sleep(handler_ms / 1000)
+        done['seen'][message.from_user.id].append(message.message_id)
+        done['finished'][message.message_id] = time.perf_counter()
+
+    @dp.callback_query()
+    async def on_callback(callback: types.CallbackQuery):
+        await asyncio.sleep(handler_ms / 1000)
+        done['finished'][int(callback.id)] = time.perf_counter()
+
+    server = WebhookServer(dp, bot, secret=SECRET, max_pending=max_pending)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    url = f'http://127.0.0.1:{runner.addresses[0][1]}/webhook'
+    return server, runner, url, done
+
+
+async def stop_server(server, runner):
+    await runner.cleanup()
+    await server.drain()
+    await server.bot.session.close()
+
+
+async def run_local(updates: int, users: int, concurrency: int, handler_ms: float):
+    results = {}
+
+    for name, slots in (('1 slot', 1), (f'{concurrency} slots', concurrency)):
+        server, runner, url, done = await start_server(slots, handler_ms, updates, updates)
+
+        async with aiohttp.ClientSession() as client:
+            async with client.post(url, json=make_update(0, 2)) as response:
+                assert response.status == 401, 'запрос без секрета должен отклоняться'
+            async with client.get(url.replace('/webhook', '/readyz')) as response:
+                assert response.status == 200
+
+        started = time.perf_counter()
+        latencies, statuses = await post_updates(url, SECRET, updates, users)
+        await server.drain()
+        elapsed = time.perf_counter() - started
+
+        ordered = all(ids == sorted(ids) for ids in done['seen'].values())
+        report(name, latencies, statuses, elapsed, server.stats['processed'])
+        print(f"{'':<14}per-user order preserved: {ordered}")
+        results[slots] = elapsed
+        await stop_server(server, runner)
+
+    print(f"speedup: {results[1] / results[concurrency]:.1f}x")
+
+    # Перегрузка: пока очередь короткая - повторные нажатия "Вперед" (отбрасываются
+    # как дубликаты), затем поток сообщений и нажатий пагинации (отбрасываются
+    # под перегрузкой), затем одновременно действия администратора и сообщения
+    # новых пользователей
+    server, runner, url, done = await start_server(concurrency, handler_ms, updates * 2, updates // 4)
+    taps = [
+        make_callback(updates * 4 + user * 3 + tap, user + 2, NEXT_PAGE)
+        for user in range(min(users, 20)) for tap in range(3)
+    ]
+    await post_updates(url, SECRET, len(taps), users, payloads=taps)
+    flood = [make_update(update_id, update_id % users + 2) for update_id in range(1, updates + 1)]
+    flood += [make_callback(updates + n, n % users + 2, NEXT_PAGE) for n in range(1, updates // 2)]
+    await post_updates(url, SECRET, len(flood), users, payloads=flood)
+
+    admin_ids = list(range(updates * 2, updates * 2 + 10))
+    probe_ids = list(range(updates * 3, updates * 3 + 10))
+    probes = [make_callback(update_id, admin_id, 'admin_stats') for update_id, admin_id in zip(admin_ids, ADMIN_IDS)]
+    probes += [make_update(update_id, users + 10 + update_id) for update_id in probe_ids]
+    sent_at = time.perf_counter()
+    await post_updates(url, SECRET, len(probes), users, payloads=probes)
+    await server.drain()
+
+    finished = done['finished']
+    admin = [finished[update_id] - sent_at for update_id in admin_ids]
+    normal = [finished[update_id] - sent_at for update_id in probe_ids]
+    stats = done['scheduler'].stats
+    print(f"overload: admin actions done in p50={statistics.median(admin) * 1000:.0f}ms, "
+          f"regular messages p50={statistics.median(normal) * 1000:.0f}ms; {stats}")
+    assert stats['shed'] > 0, 'под перегрузкой нажатия пагинации должны отбрасываться'
+    assert stats['duplicates'] > 0, 'повторные нажатия пагинации должны отбрасываться'
+    assert server.bot.session.calls == stats['shed'] + stats['duplicates'], \
+        'на каждое отброшенное нажатие должен уйти ответ'
+    await stop_server(server, runner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--handler-ms', type=float, default=20)
+    parser.add_argument('--url', help='адрес работающего бота в режиме webhook')
+    parser.add_argument('--secret', default=SECRET)
+    args = parser.parse_args()
+
+    if args.url:
+        async def remote():
+            started = time.perf_counter()
+            latencies, statuses = await post_updates(args.url, args.secret, args.updates, args.users)
+            report('remote', latencies, statuses, time.perf_counter() - started, len(latencies))
+        asyncio.run(remote())
+    else:
+        asyncio.run(run_local(args.updates, args.users, args.concurrency, args.handler_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Бенчмарк группового коммита: записи в секунду при конкурентных писателях.
+
+Сравнивает отдельный коммит на каждую запись с очередью write_queue.
+Запуск из корня репозитория:
+    python -m benchmarks.write_queue [--writers 50] [--writes 40]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import database
+from database import ChatMessage, Database, Session
+from write_queue import WriteQueue
+
+
+def make_message(writer: int, n: int) -> ChatMessage:
+    return ChatMessage(chat_id=writer, sender_id=writer, message=f"message {n}", sent_at=datetime.now())
+
+
+async def per_write_commit(writers: int, writes: int):
+    """Каждая запись в своей сессии и транзакции"""
+    errors = 0
+
+    async def writer(w):
+        nonlocal errors
+        for n in range(writes):
+            try:
+                async with Session() as session:
+                    session.add(make_message(w, n))
+                    await session.commit()
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(writer(w) for w in range(writers)))
+    return errors
+
+
+async def group_commit(queue: WriteQueue, writers: int, writes: int):
+    """Все записи через очередь с групповым коммитом"""
+    errors = 0
+
+    async def writer(w):
+        nonlocal errors
+        for n in range(writes):
+            async def job(session, n=n):
+                session.add(make_message(w, n))
+            try:
+                await queue.submit(job)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(writer(w) for w in range(writers)))
+    await queue.stop()
+    return errors
+
+
+async def run(writers: int, writes: int):
+    total = writers * writes
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        db = Database()
+        await db.migrate()
+
+        started = time.perf_counter()
+        errors = await per_write_commit(writers, writes)
+        single = time.perf_counter() - started
+        print(f"{'commit per write':<20}{total / single:>10.0f} writes/s  {total:>6} commits  errors={errors}")
+
+        queue = WriteQueue()
+        started = time.perf_counter()
+        errors = await group_commit(queue, writers, writes)
+        grouped = time.perf_counter() - started
+        print(f"{'group commit':<20}{total / grouped:>10.0f} writes/s  {queue.stats['batches']:>6} commits  errors={errors}")
+        print(f"speedup: {single / grouped:.1f}x")
+
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=50)
+    parser.add_argument('--writes', type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(run(args.writers, args.writes))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,48 @@
 from datetime import datetime, timedelta
-from database import Session, Booking, Property, User
-from sqlalchemy import and_
+from database import ReadSession, Booking, Property, User
+from write_queue import run_write
+from sqlalchemy import and_, select, func
 from locales import get_text
 
 class BookingService:
     @staticmethod
-    def check_availability(property_id, check_in, check_out):
+    async def check_availability(property_id, check_in, check_out, session=None):
         """Проверяет доступность объекта на даты"""
-        session = Session()
-        try:
-            conflicting_bookings = session.query(Booking).filter(
-                Booking.property_id == property_id,
-                Booking.status == 'confirmed',
-                and_(
-                    Booking.check_in < check_out,
-                    Booking.check_out > check_in
-                )
-            ).count()
-            
-            return conflicting_bookings == 0
-        finally:
-            session.close()
-    
+        query = select(func.count(Booking.id)).where(
+            Booking.property_id == property_id,
+            Booking.status == 'confirmed',
+            and_(
+                Booking.check_in < check_out,
+                Booking.check_out > check_in
+            )
+        )
+
+        if session is not None:
+            conflicting_bookings = await session.scalar(query)
+        else:
+            async with ReadSession() as session:
+                conflicting_bookings = await session.scalar(query)
+
+        return conflicting_bookings == 0
+
     @staticmethod
-    def create_booking(property_id, user_id, check_in, check_out, guests=1):
+    async def create_booking(property_id, user_id, check_in, check_out, guests=1):
         """Создает бронирование"""
-        session = Session()
-        try:
-            if not BookingService.check_availability(property_id, check_in, check_out):
+        async def job(session):
+            if not await BookingService.check_availability(property_id, check_in, check_out, session):
                 return False, "Объект недоступен на указанные даты"
-            
-            property_obj = session.query(Property).filter(Property.id == property_id).first()
+
+            property_obj = await session.get(Property, property_id)
             if not property_obj:
                 return False, "Объект не найден"
-            
+
             # Рассчитываем цену
             nights = (check_out - check_in).days
             if nights <= 0:
                 return False, "Неверные даты бронирования"
-            
+
             total_price = property_obj.price_uzs * nights
-            
+
             booking = Booking(
                 property_id=property_id,
                 user_id=user_id,
@@ -51,61 +53,51 @@ class BookingService:
                 status='pending',
                 created_at=datetime.now()
             )
-            
+
             session.add(booking)
-            session.commit()
+            await session.flush()
             return True, booking.id
-            
+
+        try:
+            return await run_write(job)
         except Exception as e:
-            session.rollback()
             return False, str(e)
-        finally:
-            session.close()
-    
+
     @staticmethod
-    def confirm_booking(booking_id, admin_id):
+    async def confirm_booking(booking_id, admin_id):
         """Подтверждает бронирование администратором"""
-        session = Session()
-        try:
-            booking = session.query(Booking).filter(Booking.id == booking_id).first()
+        async def job(session):
+            booking = await session.get(Booking, booking_id)
             if not booking:
                 return False, "Бронирование не найдено"
-            
+
             booking.status = 'confirmed'
             booking.confirmed_at = datetime.now()
             booking.admin_id = admin_id
-            
-            session.commit()
+
             return True, "Бронирование подтверждено"
-            
+
+        try:
+            return await run_write(job)
         except Exception as e:
-            session.rollback()
             return False, str(e)
-        finally:
-            session.close()
-    
+
     @staticmethod
-    def get_user_bookings(user_id):
+    async def get_user_bookings(user_id):
         """Получает бронирования пользователя"""
-        session = Session()
-        try:
-            bookings = session.query(Booking).filter(
-                Booking.user_id == user_id
-            ).order_by(Booking.created_at.desc()).all()
-            
-            return bookings
-        finally:
-            session.close()
-    
+        async with ReadSession() as session:
+            bookings = await session.scalars(
+                select(Booking).where(Booking.user_id == user_id)
+                .order_by(Booking.created_at.desc())
+            )
+            return bookings.all()
+
     @staticmethod
-    def get_property_bookings(property_id):
+    async def get_property_bookings(property_id):
         """Получает бронирования объекта"""
-        session = Session()
-        try:
-            bookings = session.query(Booking).filter(
-                Booking.property_id == property_id
-            ).order_by(Booking.check_in).all()
-            
-            return bookings
-        finally:
-            session.close()
+        async with ReadSession() as session:
+            bookings = await session.scalars(
+                select(Booking).where(Booking.property_id == property_id)
+                .order_by(Booking.check_in)
+            )
+            return bookings.all()
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import select, update
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound
+)
+from database import ReadSession, User, Property, BroadcastJob
+from config import BROADCAST_CONCURRENCY, BROADCAST_CHUNK_SIZE
+from rate_limiter import telegram_limiter
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повторять отправку бессмысленно (бот заблокирован, чат не найден)
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+# Статусы задания, в которых рассылка еще идет
+ACTIVE_STATUSES = ('pending', 'running')
+
+# job_id -> задача рассылки; общий для всех экземпляров сервиса, чтобы отмена
+# из обработчика админа останавливала и задания, возобновленные при запуске
+_tasks = {}
+
+class BroadcastService:
+    """Массовые рассылки с общим лимитом, ограниченной параллельностью и возобновлением"""
+    def __init__(self, bot: Bot, limiter=telegram_limiter, concurrency: int = BROADCAST_CONCURRENCY,
+                 chunk_size: int = BROADCAST_CHUNK_SIZE, max_retries: int = 5):
+        self.bot = bot
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+
+    # ========== ОТПРАВКА ==========
+
+    async def send(self, chat_id: int, text: str, keyboard=None, parse_mode: str = 'HTML') -> bool:
+        """Отправляет одно сообщение с учетом лимита и RetryAfter"""
+        for attempt in range(self.max_retries):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    reply_markup=keyboard,
+                    parse_mode=parse_mode
+                )
+                return True
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать - останавливаем всех отправителей
+                self.limiter.pause(e.retry_after)
+            except PERMANENT_ERRORS as e:
+                logger.info(f"Broadcast to {chat_id} skipped: {e}")
+                return False
+            except Exception as e:
+                logger.warning(f"Broadcast to {chat_id} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+        return False
+
+    async def send_many(self, chat_ids, text: str, keyboard=None, parse_mode: str = 'HTML'):
+        """Отправляет сообщение списку чатов, возвращает (успешно, ошибок)"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(chat_id):
+            async with semaphore:
+                return await self.send(chat_id, text, keyboard, parse_mode)
+
+        results = await asyncio.gather(*(send_one(chat_id) for chat_id in chat_ids))
+        sent = sum(1 for result in results if result)
+        return sent, len(results) - sent
+
+    # ========== ЗАДАНИЯ РАССЫЛКИ ==========
+
+    @staticmethod
+    def segment_query(segment: dict):
+        """Запрос получателей по сегменту: роли, языки, районы объявлений"""
+        segment = segment or {}
+        query = select(User.id, User.telegram_id)
+
+        if segment.get('roles'):
+            query = query.where(User.role.in_(segment['roles']))
+        if segment.get('languages'):
+            query = query.where(User.language.in_(segment['languages']))
+        if segment.get('districts'):
+            query = query.where(User.telegram_id.in_(
+                select(Property.user_id).where(Property.district.in_(segment['districts']))
+            ))
+
+        return query.order_by(User.id)
+
+    async def create_job(self, admin_id: int, message: str, segment: dict = None, parse_mode: str = 'HTML'):
+        """Создает задание рассылки и запускает его"""
+        async def job(session):
+            broadcast = BroadcastJob(
+                admin_id=admin_id,
+                message=message,
+                parse_mode=parse_mode,
+                segment=segment or {},
+                status='pending'
+            )
+            session.add(broadcast)
+            await session.flush()
+            return broadcast.id
+
+        job_id = await run_write(job)
+        self.start(job_id)
+        return job_id
+
+    def start(self, job_id: int):
+        task = _tasks.get(job_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self.run_job(job_id), name=f'broadcast-{job_id}')
+            _tasks[job_id] = task
+        return task
+
+    async def resume_pending(self):
+        """Продолжает рассылки, прерванные перезапуском бота"""
+        async with ReadSession() as session:
+            job_ids = (await session.scalars(
+                select(BroadcastJob.id).where(BroadcastJob.status.in_(ACTIVE_STATUSES))
+            )).all()
+
+        for job_id in job_ids:
+            self.start(job_id)
+        return list(job_ids)
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отменяет незавершенную рассылку; False, если она уже закончилась"""
+        cancelled = await self._update_job(job_id, ACTIVE_STATUSES, status='cancelled', finished_at=datetime.now())
+        task = _tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        return cancelled
+
+    async def get_job(self, job_id: int):
+        async with ReadSession() as session:
+            return await session.get(BroadcastJob, job_id)
+
+    async def run_job(self, job_id: int):
+        """Выполняет рассылку пачками пользователей, сохраняя курсор после каждой.
+
+        Статус перечитывается перед каждой пачкой: отмененная рассылка
+        останавливается, даже если ее задачу не удалось отменить.
+        """
+        try:
+            await self._run_job(job_id)
+        finally:
+            if _tasks.get(job_id) is asyncio.current_task():
+                del _tasks[job_id]
+
+    async def _run_job(self, job_id: int):
+        broadcast = await self.get_job(job_id)
+        if not broadcast or broadcast.status not in ACTIVE_STATUSES:
+            return
+
+        if not await self._update_job(job_id, ACTIVE_STATUSES, status='running',
+                                      started_at=broadcast.started_at or datetime.now()):
+            return
+        query = self.segment_query(broadcast.segment)
+        cursor = broadcast.last_user_id or 0
+
+        while True:
+            async with ReadSession() as session:
+                status = await session.scalar(select(BroadcastJob.status).where(BroadcastJob.id == job_id))
+                if status != 'running':
+                    logger.info(f"Broadcast {job_id} stopped: status {status}")
+                    return
+                rows = (await session.execute(
+                    query.where(User.id > cursor).limit(self.chunk_size)
+                )).all()
+
+            if not rows:
+                break
+
+            sent, failed = await self.send_many(
+                [row.telegram_id for row in rows], broadcast.message, parse_mode=broadcast.parse_mode
+            )
+            cursor = rows[-1].id
+
+            async def save_progress(session, cursor=cursor, sent=sent, failed=failed):
+                await session.execute(
+                    update(BroadcastJob).where(BroadcastJob.id == job_id).values(
+                        last_user_id=cursor,
+                        sent=BroadcastJob.sent + sent,
+                        failed=BroadcastJob.failed + failed
+                    )
+                )
+
+            await run_write(save_progress)
+
+        # Отмена во время последней пачки не перезаписывается
+        await self._update_job(job_id, ('running',), status='done', finished_at=datetime.now())
+
+    async def _update_job(self, job_id: int, from_statuses=None, **values) -> bool:
+        """Обновляет задание (только в статусах from_statuses, если заданы); True, если оно изменилось"""
+        async def job(session):
+            statement = update(BroadcastJob).where(BroadcastJob.id == job_id)
+            if from_statuses is not None:
+                statement = statement.where(BroadcastJob.status.in_(from_statuses))
+            result = await session.execute(statement.values(**values))
+            return result.rowcount > 0
+
+        return await run_write(job)
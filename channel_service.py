@@ -0,0 +1,50 @@
+import logging
+
+from sqlalchemy import update
+from aiogram import Bot
+from database import Property
+from events import PROPERTY_CREATED, PROPERTY_STATUS_CHANGED
+from photo_service import PhotoService
+from utils import format_property_message
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+class ChannelService:
+    """Публикация новых объявлений в канал"""
+    def __init__(self, bot: Bot, channel_id):
+        self.bot = bot
+        self.channel_id = channel_id
+
+    def register(self, bus):
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+
+    async def on_property_created(self, property):
+        if property.status == 'active':
+            await self.publish_property(property)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        if new_status == 'active':
+            await self.publish_property(property)
+
+    async def publish_property(self, property_obj):
+        """Публикует объявление в канал один раз (с фото - одной медиагруппой)"""
+        if property_obj.published_in_channel:
+            return False
+
+        try:
+            await PhotoService.send_property(self.bot, self.channel_id, property_obj, format_property_message(property_obj))
+        except Exception as e:
+            logger.exception(f"Failed to publish property {property_obj.id} to channel: {e}")
+            return False
+
+        async def job(session):
+            await session.execute(
+                update(Property).where(Property.id == property_obj.id)
+                .values(published_in_channel=True)
+            )
+
+        await run_write(job)
+        property_obj.published_in_channel = True
+        return True
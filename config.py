@@ -22,3 +22,187 @@ DATABASE_CONFIG = {
 
 # Для простоты используем SQLite если нет PostgreSQL
 USE_SQLITE = os.getenv('USE_SQLITE', 'True').lower() == 'true'
+
+# URL асинхронного подключения SQLAlchemy
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///chirchik_estate.db')
+
+# Профиль настройки SQLite (PRAGMA, применяются к каждому соединению)
+SQLITE_PROFILE = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # Отрицательное значение - размер кэша страниц в КиБ
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# Пул соединений только для чтения (поиск, статистика); запись идет через одно соединение
+SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', '4'))
+
+# Кэш профилей пользователей: число записей и время жизни в секундах
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+
+# Канал для публикации новых объявлений (например, @chirchiq_estate), пусто - не публикуем
+CHANNEL_ID = os.getenv('CHANNEL_ID', '')
+
+# Контакт администратора для пользователей
+ADMIN_CONTACT = os.getenv('ADMIN_CONTACT', '@Jamastik')
+ADMINS = ADMIN_IDS
+
+# ========== РЕЖИМ ЗАПУСКА ==========
+
+# polling - опрос getUpdates, webhook - HTTP-сервер aiohttp
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Публичный адрес, на который Telegram шлет обновления (https://example.com), и путь
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+
+# Адрес, на котором слушает сервер
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Сколько принятых обновлений может ждать обработки, сверх этого отвечаем 503
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', '2000'))
+
+# Планировщик обновлений: одновременно выполняемых обработчиков и число
+# ожидающих, после которого малоценные обновления отбрасываются
+SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', '16'))
+SCHEDULER_SHED_THRESHOLD = int(os.getenv('SCHEDULER_SHED_THRESHOLD', '200'))
+
+# ========== РОЛИ И ПОДПИСКИ ==========
+
+# Роли, для которых нужна платная подписка
+PREMIUM_ROLES = ['realtor', 'agency', 'developer']
+
+# Роли, которые нельзя сменить после активации бесплатного периода
+LOCKED_ROLES = ['realtor', 'agency', 'developer']
+
+# Роли, которым можно ставить оценки
+RATED_ROLES = ['seller', 'realtor', 'agency', 'developer']
+
+# Роли, контакты которых выдаются только через администратора
+RESTRICTED_CONTACT_ROLES = ['realtor', 'agency']
+
+# Длительность бесплатного периода по ролям (в днях)
+FREE_PERIOD_DAYS = {
+    'realtor': 30,
+    'agency': 30,
+    'developer': 30
+}
+
+# Как часто выключать истекшие подписки (секунды)
+SUBSCRIPTION_SWEEP_INTERVAL = int(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', '300'))
+
+# ========== СОСТОЯНИЯ FSM ==========
+
+# Сколько состояний держать в памяти, как часто сбрасывать изменения в БД (секунды)
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '5000'))
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '1'))
+
+# Через сколько секунд без изменений брошенное состояние удаляется
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', str(7 * 24 * 3600)))
+
+# ========== ПОИСК ==========
+
+# Корзин цены и площади в поисковом индексе и как часто перестраивать индекс целиком (секунды)
+SEARCH_RANGE_BINS = int(os.getenv('SEARCH_RANGE_BINS', '128'))
+SEARCH_INDEX_RELOAD_INTERVAL = int(os.getenv('SEARCH_INDEX_RELOAD_INTERVAL', str(6 * 3600)))
+
+# Поиск по координатам: сторона ячейки сетки (метры) и наибольший радиус поиска
+GEO_CELL_SIZE_M = int(os.getenv('GEO_CELL_SIZE_M', '500'))
+GEO_MAX_RADIUS_M = int(os.getenv('GEO_MAX_RADIUS_M', '20000'))
+# Полигоны районов Чирчика (GeoJSON) для определения района по координатам
+GEO_DISTRICTS_FILE = os.getenv(
+    'GEO_DISTRICTS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chirchiq_districts.geojson')
+)
+
+# ========== АНАЛИТИКА И ОЦЕНКА ЦЕН ==========
+
+# Час ночного пересчета сводок статистики дашборда
+STATS_RECONCILE_HOUR = int(os.getenv('STATS_RECONCILE_HOUR', '3'))
+
+# Как часто полностью перечитывать снимок рыночных трендов (секунды)
+MARKET_TRENDS_RELOAD_INTERVAL = int(os.getenv('MARKET_TRENDS_RELOAD_INTERVAL', str(6 * 3600)))
+
+# Оценка цены по аналогам: сколько аналогов брать и сколько минимум нужно для оценки
+ESTIMATOR_NEIGHBORS = int(os.getenv('ESTIMATOR_NEIGHBORS', '10'))
+ESTIMATOR_MIN_COMPARABLES = int(os.getenv('ESTIMATOR_MIN_COMPARABLES', '3'))
+
+# Индекс аналогов перестраивается после изменений не чаще раза в столько секунд
+ESTIMATOR_REBUILD_INTERVAL = float(os.getenv('ESTIMATOR_REBUILD_INTERVAL', '60'))
+
+# ========== РАССЫЛКИ ==========
+
+# Общий лимит исходящих сообщений бота (сообщений в секунду)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+
+# Одновременных запросов при рассылке и размер пачки пользователей из БД
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '500'))
+
+# ========== ОЧЕРЕДЬ УВЕДОМЛЕНИЙ (OUTBOX) ==========
+
+# Число воркеров, отправляющих уведомления из outbox
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))
+
+# Лимит сообщений в один чат (сообщений в секунду)
+OUTBOX_PER_CHAT_RATE = float(os.getenv('OUTBOX_PER_CHAT_RATE', '1'))
+
+# Попыток доставки до перевода уведомления в failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+
+# ========== ОГРАНИЧЕНИЕ ЧАСТОТЫ ДЕЙСТВИЙ ==========
+
+# Лимиты действий пользователя: действие -> (число действий, период в секундах)
+RATE_LIMITS = {
+    'message': (30, 60),            # любые сообщения боту
+    'callback': (60, 60),           # нажатия inline-кнопок
+    'search': (20, 60),             # шаги поиска
+    'property': (60, 600),          # шаги заполнения объявления
+    'property_create': (10, 3600),  # публикация объявлений
+    'notice': (1, 30),              # предупреждения о превышении лимита
+}
+
+# Сколько счетчиков (пользователь, действие) держать в памяти
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '50000'))
+
+# Файл для сохранения счетчиков между перезапусками, пусто - не сохраняем
+RATE_LIMIT_STATE_FILE = os.getenv('RATE_LIMIT_STATE_FILE', '')
+
+# ========== МОДЕРАЦИЯ ==========
+
+# Штрафы правил модерации: категория -> (штраф за каждое разное совпадение, максимум штрафа)
+MODERATION_WEIGHTS = {
+    'spam': (5, 20),            # рекламные слова
+    'contact': (15, 15),        # телефоны и мессенджеры в описании
+    'link': (15, 15),           # ссылки
+    'scam': (35, 35),           # признаки мошенничества (предоплата, без документов)
+    'price_outlier': (25, 25),  # цена далеко от оценки по аналогам
+    'duplicate': (35, 35),      # повтор уже опубликованного объявления
+}
+
+# Минимальный балл (из 100) для прохождения автоматической модерации
+MODERATION_PASS_SCORE = int(os.getenv('MODERATION_PASS_SCORE', '70'))
+
+# Как часто проверять объявления в статусе pending (секунды) и сколько за один проход
+MODERATION_INTERVAL = int(os.getenv('MODERATION_INTERVAL', '60'))
+MODERATION_BATCH_SIZE = int(os.getenv('MODERATION_BATCH_SIZE', '1000'))
+
+# Дубликаты: минимальное сходство текстов (0..1) и допуски по площади и цене (доля)
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.7'))
+DUPLICATE_AREA_TOLERANCE = float(os.getenv('DUPLICATE_AREA_TOLERANCE', '0.05'))
+DUPLICATE_PRICE_TOLERANCE = float(os.getenv('DUPLICATE_PRICE_TOLERANCE', '0.2'))
+
+# Сколько объявлений за раз обрабатывает досчет отпечатков
+DUPLICATE_BACKFILL_BATCH = int(os.getenv('DUPLICATE_BACKFILL_BATCH', '500'))
+
+# ========== ФОТО ОБЪЯВЛЕНИЙ ==========
+
+# Фото в одном объявлении (не больше 10 - предел медиагруппы Telegram)
+MAX_PROPERTY_PHOTOS = min(int(os.getenv('MAX_PROPERTY_PHOTOS', '10')), 10)
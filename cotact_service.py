@@ -1,21 +1,24 @@
-from database import Session, User, Property, ContactRequest
+from datetime import datetime
+from sqlalchemy import select
+from database import ReadSession, User, Property, ContactRequest
 from config import RESTRICTED_CONTACT_ROLES, ADMINS, ADMIN_CONTACT
 from locales import get_text
+from write_queue import run_write
+from user_cache import user_cache
+from pagination import PAGE_SIZE, keyset_page
 
 class ContactService:
     @staticmethod
-    def can_show_contact(property_owner_id: int, requester_id: int, lang: str = 'ru'):
+    async def can_show_contact(property_owner_id: int, requester_id: int, lang: str = 'ru'):
         """Можно ли показывать контактные данные"""
-        session = Session()
-        
         try:
-            property_owner = session.query(User).filter(User.telegram_id == property_owner_id).first()
+            property_owner = await user_cache.get(property_owner_id)
             
             if not property_owner:
                 return False, get_text("user_not_found", lang)
             
             # Если владелец не входит в ограниченные роли, показываем контакт
-            if property_owner.role not in RESTRICTED_CONTACT_ROLES:
+            if property_owner['role'] not in RESTRICTED_CONTACT_ROLES:
                 return True, ""
             
             # Если запрашивающий - администратор, показываем контакт
@@ -27,30 +30,26 @@ class ContactService:
             
         except Exception as e:
             return False, f"Error: {str(e)}"
-        finally:
-            session.close()
     
     @staticmethod
-    def request_contact(requester_id: int, target_user_id: int, property_id: int, lang: str = 'ru'):
+    async def request_contact(requester_id: int, target_user_id: int, property_id: int, lang: str = 'ru'):
         """Запросить контакт через администратора"""
-        session = Session()
-        
-        try:
+        async def job(session):
             # Проверяем существование пользователей и объекта
-            requester = session.query(User).filter(User.telegram_id == requester_id).first()
-            target_user = session.query(User).filter(User.telegram_id == target_user_id).first()
-            property_obj = session.query(Property).filter(Property.id == property_id).first()
+            requester = await session.scalar(select(User).where(User.telegram_id == requester_id))
+            target_user = await session.scalar(select(User).where(User.telegram_id == target_user_id))
+            property_obj = await session.get(Property, property_id)
             
             if not requester or not target_user or not property_obj:
                 return False, get_text("request_data_invalid", lang)
             
             # Проверяем, не отправлен ли уже запрос
-            existing_request = session.query(ContactRequest).filter(
+            existing_request = await session.scalar(select(ContactRequest).where(
                 ContactRequest.requester_id == requester_id,
                 ContactRequest.target_user_id == target_user_id,
                 ContactRequest.property_id == property_id,
                 ContactRequest.status == 'pending'
-            ).first()
+            ))
             
             if existing_request:
                 return False, get_text("contact_request_pending", lang)
@@ -63,79 +62,52 @@ class ContactService:
             )
             
             session.add(contact_request)
-            session.commit()
             
             return True, get_text("contact_request_sent", lang)
-            
+        
+        try:
+            return await run_write(job)
         except Exception as e:
-            session.rollback()
             return False, f"Error: {str(e)}"
-        finally:
-            session.close()
     
     @staticmethod
-    def get_pending_requests():
-        """Получить все pending запросы на контакт"""
-        session = Session()
-        
+    async def get_pending_requests(cursor: str = None, limit: int = PAGE_SIZE):
+        """Страница pending запросов на контакт, новые первыми: (запросы, курсор следующей страницы, ошибка)"""
         try:
-            requests = session.query(ContactRequest).filter(
-                ContactRequest.status == 'pending'
-            ).order_by(ContactRequest.created_at.desc()).all()
-            
-            return requests, None
-            
+            requests, next_cursor = await keyset_page(
+                select(ContactRequest).where(ContactRequest.status == 'pending'),
+                [ContactRequest.created_at, ContactRequest.id], cursor, limit
+            )
+            return requests, next_cursor, None
+
         except Exception as e:
-            return None, f"Error: {str(e)}"
-        finally:
-            session.close()
+            return None, None, f"Error: {str(e)}"
     
     @staticmethod
-    def approve_contact_request(request_id: int, admin_id: int, lang: str = 'ru'):
+    async def approve_contact_request(request_id: int, admin_id: int, lang: str = 'ru'):
         """Одобрить запрос на контакт"""
-        session = Session()
-        
-        try:
-            contact_request = session.query(ContactRequest).filter(ContactRequest.id == request_id).first()
-            
-            if not contact_request:
-                return False, get_text("request_not_found", lang)
-            
-            contact_request.status = 'approved'
-            contact_request.admin_id = admin_id
-            contact_request.processed_at = datetime.now()
-            
-            session.commit()
-            
-            return True, get_text("contact_request_approved", lang)
-            
-        except Exception as e:
-            session.rollback()
-            return False, f"Error: {str(e)}"
-        finally:
-            session.close()
+        return await ContactService._process_contact_request(request_id, admin_id, 'approved', "contact_request_approved", lang)
     
     @staticmethod
-    def reject_contact_request(request_id: int, admin_id: int, lang: str = 'ru'):
+    async def reject_contact_request(request_id: int, admin_id: int, lang: str = 'ru'):
         """Отклонить запрос на контакт"""
-        session = Session()
-        
-        try:
-            contact_request = session.query(ContactRequest).filter(ContactRequest.id == request_id).first()
+        return await ContactService._process_contact_request(request_id, admin_id, 'rejected', "contact_request_rejected", lang)
+    
+    @staticmethod
+    async def _process_contact_request(request_id: int, admin_id: int, status: str, text_key: str, lang: str):
+        async def job(session):
+            contact_request = await session.get(ContactRequest, request_id)
             
             if not contact_request:
                 return False, get_text("request_not_found", lang)
             
-            contact_request.status = 'rejected'
+            contact_request.status = status
             contact_request.admin_id = admin_id
             contact_request.processed_at = datetime.now()
             
-            session.commit()
-            
-            return True, get_text("contact_request_rejected", lang)
-            
+            return True, get_text(text_key, lang)
+        
+        try:
+            return await run_write(job)
         except Exception as e:
-            session.rollback()
             return False, f"Error: {str(e)}"
-        finally:
-            session.close()
@@ -1,16 +1,25 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text, JSON, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (
+    Column, Integer, String, Float, Boolean, DateTime, Text, JSON, LargeBinary, Index,
+    event, func, inspect, select, text, update
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
 from datetime import datetime, timedelta
 import json
 
+from config import DATABASE_URL, SQLITE_PROFILE, SQLITE_READ_POOL_SIZE
+from events import bus, USER_CREATED, USER_ROLE_CHANGED
+from fulltext import index_text
+
 Base = declarative_base()
 
 class User(Base):
-    _tablename_ = 'users'
+    __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True)
+    telegram_id = Column(Integer, unique=True, index=True)
     username = Column(String(100))
     full_name = Column(String(200))
     phone = Column(String(20))
@@ -35,8 +44,20 @@ class User(Base):
     last_active = Column(DateTime, default=datetime.now)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_users_role', 'role'),
+        Index('ix_users_created_at', 'created_at'),
+        Index('ix_users_last_active', 'last_active'),
+    )
+
+def _search_text(source: str):
+    """Значение по умолчанию: нормализованный для полнотекстового индекса текст колонки source"""
+    def default(context):
+        return index_text(context.get_current_parameters().get(source))
+    return default
+
 class Property(Base):
-    _tablename_ = 'properties'
+    __tablename__ = 'properties'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -44,13 +65,19 @@ class Property(Base):
     property_type = Column(String(50))
     district = Column(String(100))
     address = Column(String(300))
+    # Координаты из геопозиции Telegram (необязательные)
+    latitude = Column(Float)
+    longitude = Column(Float)
     price_uzs = Column(Float)
     price_usd = Column(Float)
     currency = Column(String(3), default='UZS')
     rooms = Column(Integer)
     area = Column(Float)
     description = Column(Text)
-    photos = Column(Text)
+    photos = Column(Text)  # устарело: фото хранятся в property_photos (photo_service)
+    # Описание и адрес в нормализованном виде (fulltext.index_text); триггеры копируют их в property_fts
+    search_description = Column(Text, default=_search_text('description'))
+    search_address = Column(Text, default=_search_text('address'))
     status = Column(String(20), default='active')
     created_at = Column(DateTime, default=datetime.now)
     published_in_channel = Column(Boolean, default=False)
@@ -66,16 +93,45 @@ class Property(Base):
     available_from = Column(DateTime)
     available_to = Column(DateTime)
 
+    __table_args__ = (
+        # Поиск и сохраненные поиски: только активные объявления (частичные индексы)
+        Index('ix_properties_active_type_district_price', 'property_type', 'district', 'price_uzs',
+              sqlite_where=text("status = 'active'")),
+        Index('ix_properties_active_district_price', 'district', 'price_uzs',
+              sqlite_where=text("status = 'active'")),
+        Index('ix_properties_active_created_at', 'created_at',
+              sqlite_where=text("status = 'active'")),
+        # Объявления пользователя и антиспам-проверка за сутки
+        Index('ix_properties_user_created_at', 'user_id', 'created_at'),
+        # Статистика по статусам и районам
+        Index('ix_properties_status_district', 'status', 'district'),
+        Index('ix_properties_created_at', 'created_at'),
+    )
+
+@event.listens_for(Property, 'before_update')
+def _update_search_text(mapper, connection, target):
+    """Пересчитывает нормализованный текст при изменении описания или адреса"""
+    state = inspect(target)
+    if state.attrs.description.history.has_changes():
+        target.search_description = index_text(target.description)
+    if state.attrs.address.history.has_changes():
+        target.search_address = index_text(target.address)
+
 class Favorite(Base):
-    _tablename_ = 'favorites'
+    __tablename__ = 'favorites'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     property_id = Column(Integer)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_favorites_user_property', 'user_id', 'property_id'),
+        Index('ix_favorites_property', 'property_id'),
+    )
+
 class Subscription(Base):
-    _tablename_ = 'subscriptions'
+    __tablename__ = 'subscriptions'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -87,8 +143,14 @@ class Subscription(Base):
     payment_confirmed = Column(Boolean, default=False)
     admin_id = Column(Integer)  # Админ, подтвердивший оплату
 
+    __table_args__ = (
+        Index('ix_subscriptions_user_active', 'user_id', 'is_active'),
+        Index('ix_subscriptions_active_end_date', 'end_date',
+              sqlite_where=text("is_active = 1")),
+    )
+
 class Rating(Base):
-    _tablename_ = 'ratings'
+    __tablename__ = 'ratings'
     
     id = Column(Integer, primary_key=True)
     target_user_id = Column(Integer)
@@ -97,8 +159,13 @@ class Rating(Base):
     comment = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_ratings_target_author', 'target_user_id', 'author_user_id'),
+        Index('ix_ratings_target_rating', 'target_user_id', 'rating'),
+    )
+
 class ContactRequest(Base):
-    _tablename_ = 'contact_requests'
+    __tablename__ = 'contact_requests'
     
     id = Column(Integer, primary_key=True)
     requester_id = Column(Integer)
@@ -109,8 +176,13 @@ class ContactRequest(Base):
     created_at = Column(DateTime, default=datetime.now)
     processed_at = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_contact_requests_status_created_at', 'status', 'created_at'),
+        Index('ix_contact_requests_requester_target', 'requester_id', 'target_user_id', 'property_id'),
+    )
+
 class SavedSearch(Base):
-    _tablename_ = 'saved_searches'
+    __tablename__ = 'saved_searches'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -120,8 +192,13 @@ class SavedSearch(Base):
     created_at = Column(DateTime, default=datetime.now)
     last_notified = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_saved_searches_user', 'user_id'),
+        Index('ix_saved_searches_active', 'is_active'),
+    )
+
 class Chat(Base):
-    _tablename_ = 'chats'
+    __tablename__ = 'chats'
     
     id = Column(Integer, primary_key=True)
     user1_id = Column(Integer)
@@ -131,8 +208,16 @@ class Chat(Base):
     is_active = Column(Boolean, default=True)
     last_message_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_chats_user1_user2_property', 'user1_id', 'user2_id', 'property_id'),
+        Index('ix_chats_user2', 'user2_id'),
+        # Список чатов пользователя по последнему сообщению (курсорная пагинация)
+        Index('ix_chats_user1_last_message_at', 'user1_id', 'last_message_at'),
+        Index('ix_chats_user2_last_message_at', 'user2_id', 'last_message_at'),
+    )
+
 class ChatMessage(Base):
-    _tablename_ = 'chat_messages'
+    __tablename__ = 'chat_messages'
     
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer)
@@ -141,8 +226,12 @@ class ChatMessage(Base):
     sent_at = Column(DateTime, default=datetime.now)
     is_read = Column(Boolean, default=False)
 
+    __table_args__ = (
+        Index('ix_chat_messages_chat_sent_at', 'chat_id', 'sent_at'),
+    )
+
 class Booking(Base):
-    _tablename_ = 'bookings'
+    __tablename__ = 'bookings'
     
     id = Column(Integer, primary_key=True)
     property_id = Column(Integer)
@@ -156,8 +245,13 @@ class Booking(Base):
     confirmed_at = Column(DateTime)
     admin_id = Column(Integer)
 
+    __table_args__ = (
+        Index('ix_bookings_property_status_check_in', 'property_id', 'status', 'check_in'),
+        Index('ix_bookings_user_created_at', 'user_id', 'created_at'),
+    )
+
 class Badge(Base):
-    _tablename_ = 'badges'
+    __tablename__ = 'badges'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -167,8 +261,12 @@ class Badge(Base):
     awarded_at = Column(DateTime, default=datetime.now)
     is_active = Column(Boolean, default=True)
 
+    __table_args__ = (
+        Index('ix_badges_user_type', 'user_id', 'badge_type'),
+    )
+
 class UserActivity(Base):
-    _tablename_ = 'user_activities'
+    __tablename__ = 'user_activities'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -177,8 +275,12 @@ class UserActivity(Base):
     details = Column(JSON)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_user_activities_user_created_at', 'user_id', 'created_at'),
+    )
+
 class AdminLog(Base):
-    _tablename_ = 'admin_logs'
+    __tablename__ = 'admin_logs'
     
     id = Column(Integer, primary_key=True)
     admin_id = Column(Integer)
@@ -187,10 +289,378 @@ class AdminLog(Base):
     details = Column(JSON)
     created_at = Column(DateTime, default=datetime.now)
 
+
+class BroadcastJob(Base):
+    __tablename__ = 'broadcast_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(Integer)
+    message = Column(Text)
+    parse_mode = Column(String(20), default='HTML')
+    segment = Column(JSON)  # roles, languages, districts
+    status = Column(String(20), default='pending')  # pending, running, done, cancelled
+    # Курсор по users.id: рассылка продолжается с него после перезапуска
+    last_user_id = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_broadcast_jobs_status', 'status'),
+    )
+
+class NotificationOutbox(Base):
+    __tablename__ = 'notification_outbox'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer)
+    message_text = Column(Text)
+    parse_mode = Column(String(20), default='HTML')
+    reply_markup = Column(JSON)
+    # Ключ идемпотентности: одно и то же уведомление не ставится в очередь дважды
+    dedupe_key = Column(String(200), unique=True)
+    status = Column(String(20), default='pending')  # pending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_notification_outbox_pending', 'next_attempt_at', 'id',
+              sqlite_where=text("status = 'pending'")),
+        # Первое неотправленное уведомление каждого чата
+        Index('ix_notification_outbox_pending_chat', 'chat_id', 'id',
+              sqlite_where=text("status = 'pending'")),
+        Index('ix_notification_outbox_status_sent_at', 'status', 'sent_at'),
+    )
+
+class DailyStat(Base):
+    __tablename__ = 'daily_stats'
+    
+    # 'YYYY-MM-DD' для дневных метрик, 'total' для текущих итогов
+    period = Column(String(10), primary_key=True)
+    metric = Column(String(50), primary_key=True)
+    # Разрез метрики (роль, район), '' - без разреза
+    dimension = Column(String(100), primary_key=True, default='')
+    value = Column(Float, default=0)
+
+class FSMState(Base):
+    __tablename__ = 'fsm_states'
+    
+    # Ключ хранилища FSM: fsm:<bot>:<chat>[:<thread>]:<user>:<destiny>
+    key = Column(String(200), primary_key=True)
+    state = Column(String(200))
+    data = Column(JSON, default=dict)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_fsm_states_updated_at', 'updated_at'),
+    )
+
+class PropertyFingerprint(Base):
+    __tablename__ = 'property_fingerprints'
+    
+    # MinHash-подпись текста объявления для поиска дубликатов (duplicate_index)
+    property_id = Column(Integer, primary_key=True)
+    signature = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.now)
+
+class Photo(Base):
+    __tablename__ = 'photos'
+
+    # Фото хранится один раз, сколько бы объявлений его ни использовали
+    file_unique_id = Column(String(100), primary_key=True)
+    file_id = Column(String(200))  # последний полученный file_id для отправки
+    created_at = Column(DateTime, default=datetime.now)
+
+class PropertyPhoto(Base):
+    __tablename__ = 'property_photos'
+
+    property_id = Column(Integer, primary_key=True)
+    position = Column(Integer, primary_key=True)
+    file_unique_id = Column(String(100))
+
+    __table_args__ = (
+        Index('ix_property_photos_property_file', 'property_id', 'file_unique_id', unique=True),
+        # Другие объявления с тем же фото
+        Index('ix_property_photos_file', 'file_unique_id'),
+    )
+
 # Инициализация БД
-engine = create_engine('sqlite:///chirchik_estate.db')
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Движки создаются лениво: импорт модуля не трогает диск,
+# схема создается и обновляется явным шагом Database.migrate() при запуске.
+# Запись идет через один движок с единственным соединением, чтение - через
+# отдельный пул соединений с query_only: в режиме WAL читатели не ждут писателя.
+_engine = None
+_read_engine = None
+
+# PRAGMA, которые сохраняются в файле БД и выставляются только пишущим соединением
+_WRITER_ONLY_PRAGMAS = ('journal_mode',)
+
+def _is_memory_database(url) -> bool:
+    return url.database in (None, '', ':memory:') or 'mode=memory' in str(url)
+
+def _apply_sqlite_profile(sync_engine, read_only: bool):
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Транзакциями управляет SQLAlchemy (BEGIN ниже), а не драйвер,
+        # иначе pysqlite выполняет DDL вне транзакции
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PROFILE.items():
+            if read_only and name in _WRITER_ONLY_PRAGMAS:
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    @event.listens_for(sync_engine, "begin")
+    def on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+def _create_engine(read_only: bool = False):
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() != 'sqlite':
+        return create_async_engine(url, pool_pre_ping=True)
+
+    pool_size = SQLITE_READ_POOL_SIZE if read_only else 1
+    engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    _apply_sqlite_profile(engine.sync_engine, read_only)
+    return engine
+
+def get_engine():
+    """Движок для записи (одно соединение)"""
+    global _engine
+    if _engine is None:
+        _engine = _create_engine()
+    return _engine
+
+def get_read_engine():
+    """Движок для чтения (пул соединений только для чтения)"""
+    global _read_engine
+    if _read_engine is None:
+        url = make_url(DATABASE_URL)
+        if url.get_backend_name() != 'sqlite' or _is_memory_database(url):
+            # Базу в памяти не разделить между соединениями - читаем через писателя
+            _read_engine = get_engine()
+        else:
+            _read_engine = _create_engine(read_only=True)
+    return _read_engine
+
+def configure_database(url: str):
+    """Переключает БД (например, для тестов или утилит) до первого обращения"""
+    global DATABASE_URL, _engine, _read_engine
+    DATABASE_URL = url
+    _engine = None
+    _read_engine = None
+
+async def dispose_engines():
+    """Закрывает соединения при остановке бота"""
+    if _read_engine is not None and _read_engine is not _engine:
+        await _read_engine.dispose()
+    if _engine is not None:
+        await _engine.dispose()
+
+class LazySession(AsyncSession):
+    """Сессия записи, привязанная к движку, который создается при первом обращении"""
+    def __init__(self, *args, **kwargs):
+        if kwargs.get('bind') is None:
+            kwargs['bind'] = get_engine()
+        super().__init__(*args, **kwargs)
+
+class LazyReadSession(AsyncSession):
+    """Сессия только для чтения"""
+    def __init__(self, *args, **kwargs):
+        if kwargs.get('bind') is None:
+            kwargs['bind'] = get_read_engine()
+        super().__init__(*args, **kwargs)
+
+# expire_on_commit=False: сервисы возвращают ORM-объекты после закрытия сессии
+Session = async_sessionmaker(class_=LazySession, expire_on_commit=False)
+ReadSession = async_sessionmaker(class_=LazyReadSession, expire_on_commit=False)
 
 def get_session():
-    return Session()
+    return Session()
+
+def to_dict(obj):
+    """Преобразует ORM-объект в словарь"""
+    if obj is None:
+        return None
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+
+class Database:
+    """Асинхронный фасад над БД, используемый обработчиками бота"""
+
+    async def migrate(self):
+        """Применяет недостающие миграции схемы"""
+        from migrations import run_migrations
+        return await run_migrations(get_engine())
+
+    async def close(self):
+        from write_queue import write_queue
+        await write_queue.stop()
+        await dispose_engines()
+
+    # ========== ПОЛЬЗОВАТЕЛИ ==========
+
+    async def get_user(self, telegram_id: int):
+        """Профиль пользователя из кэша (язык, роль, валюта, рейтинг...)"""
+        from user_cache import user_cache
+        return await user_cache.get(telegram_id)
+
+    async def get_user_record(self, telegram_id: int):
+        """Полная запись пользователя из БД, в обход кэша"""
+        async with ReadSession() as session:
+            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
+            return to_dict(user)
+
+    async def create_user(self, telegram_id: int, username: str, full_name: str, language: str = 'ru'):
+        from write_queue import run_write
+        from user_cache import user_cache, profile_of
+
+        async def job(session):
+            user = User(
+                telegram_id=telegram_id,
+                username=username,
+                full_name=full_name,
+                language=language
+            )
+            session.add(user)
+            return user
+
+        user = await run_write(job)
+        user_cache.put(telegram_id, profile_of(user))
+        await bus.publish(USER_CREATED, user=user)
+        return to_dict(user)
+
+    async def update_user(self, telegram_id: int, **fields):
+        from write_queue import run_write
+        from user_cache import user_cache
+
+        async def job(session):
+            old_role = None
+            if 'role' in fields:
+                old_role = await session.scalar(select(User.role).where(User.telegram_id == telegram_id))
+            result = await session.execute(
+                update(User).where(User.telegram_id == telegram_id).values(**fields)
+            )
+            return result.rowcount > 0, old_role
+
+        updated, old_role = await run_write(job)
+        # Роль, язык, телефон и т.п. меняются только здесь и в сервисах - сбрасываем кэш
+        user_cache.invalidate(telegram_id)
+        if updated and 'role' in fields and old_role != fields['role']:
+            await bus.publish(USER_ROLE_CHANGED, telegram_id=telegram_id, old_role=old_role, new_role=fields['role'])
+        return updated
+
+    async def get_total_users_count(self) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(select(func.count(User.id)))
+
+    async def get_active_users_count(self, days: int = 7) -> int:
+        since = datetime.now() - timedelta(days=days)
+        async with ReadSession() as session:
+            return await session.scalar(select(func.count(User.id)).where(User.last_active >= since))
+
+    # ========== ПОДПИСКИ ==========
+
+    async def get_user_subscription(self, telegram_id: int):
+        async with ReadSession() as session:
+            subscription = await session.scalar(
+                select(Subscription).where(
+                    Subscription.user_id == telegram_id,
+                    Subscription.is_active == True
+                ).order_by(Subscription.end_date.desc())
+            )
+            return to_dict(subscription)
+
+    async def deactivate_subscription(self, telegram_id: int):
+        from write_queue import run_write
+        from entitlements import entitlements
+
+        async def job(session):
+            await session.execute(
+                update(Subscription).where(
+                    Subscription.user_id == telegram_id,
+                    Subscription.is_active == True
+                ).values(is_active=False)
+            )
+
+        await run_write(job)
+        entitlements.discard(telegram_id)
+
+    # ========== ОБЪЯВЛЕНИЯ ==========
+
+    async def get_user_properties_count(self, telegram_id: int) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(Property.id)).where(Property.user_id == telegram_id)
+            )
+
+    async def get_user_active_properties_count(self, telegram_id: int) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(Property.id)).where(
+                    Property.user_id == telegram_id,
+                    Property.status == 'active'
+                )
+            )
+
+    async def get_total_properties_count(self) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(select(func.count(Property.id)))
+
+    async def get_active_properties_count(self) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(Property.id)).where(Property.status == 'active')
+            )
+
+    async def get_today_properties_count(self) -> int:
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(Property.id)).where(Property.created_at >= today)
+            )
+
+    # ========== ИЗБРАННОЕ, РЕЙТИНГИ, ЗАПРОСЫ ==========
+
+    async def get_user_favorites_count(self, telegram_id: int) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(Favorite.id)).where(Favorite.user_id == telegram_id)
+            )
+
+    async def get_user_rating_stats(self, telegram_id: int):
+        async with ReadSession() as session:
+            rows = await session.execute(
+                select(Rating.rating, func.count(Rating.id))
+                .where(Rating.target_user_id == telegram_id)
+                .group_by(Rating.rating)
+            )
+            distribution = {i: 0 for i in range(1, 6)}
+            for value, count in rows:
+                distribution[value] = count
+            total = sum(distribution.values())
+            average = sum(k * v for k, v in distribution.items()) / total if total else 0
+            return {
+                'rating': round(average, 1),
+                'count': total,
+                'distribution': distribution
+            }
+
+    async def get_pending_contact_requests_count(self) -> int:
+        async with ReadSession() as session:
+            return await session.scalar(
+                select(func.count(ContactRequest.id)).where(ContactRequest.status == 'pending')
+            )
@@ -0,0 +1,238 @@
+"""Поиск дубликатов объявлений (MinHash + LSH).
+
+Агентства и риелторы публикуют одну и ту же квартиру по многу раз с мелкими
+правками. Для каждого объявления считается MinHash-подпись множества пар
+соседних слов описания и адреса (DUPLICATE_PERMUTATIONS значений) и
+хранится в таблице property_fingerprints.
+
+В памяти подписи живых объявлений (active, pending) разложены по корзинам
+LSH: подпись режется на DUPLICATE_BANDS полос, объявления с совпавшей
+полосой - кандидаты. Поиск - несколько обращений к словарю вместо сравнения
+со всеми объявлениями. Кандидат считается дубликатом, если доля совпавших
+значений подписи (оценка сходства Жаккара) не ниже DUPLICATE_THRESHOLD и
+совпадают тип и комнаты, а площадь и цена близки.
+
+PropertyService.create_property проверяет объявление до записи и сразу
+сохраняет дубликат как подозрительный, так что активным он не публикуется;
+объявления на модерации проверяет ModerationService. Новые объявления
+индексируются обработчиком PROPERTY_CREATED, backfill() досчитывает подписи
+для объявлений, созданных до появления индекса.
+"""
+import logging
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import (
+    DUPLICATE_THRESHOLD, DUPLICATE_AREA_TOLERANCE, DUPLICATE_PRICE_TOLERANCE, DUPLICATE_BACKFILL_BATCH
+)
+from database import ReadSession, Property, PropertyFingerprint
+from events import PROPERTY_CREATED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_PERMUTATIONS = 64
+DUPLICATE_BANDS = 16
+# Меньше стольких пар слов текст слишком короткий для сравнения
+MIN_SHINGLES = 5
+# Статусы, среди которых ищутся дубликаты
+LIVE_STATUSES = ('active', 'pending')
+
+_PRIME = (1 << 31) - 1
+_random = np.random.default_rng(20240501)
+_A = _random.integers(1, _PRIME, DUPLICATE_PERMUTATIONS, dtype=np.uint64)
+_B = _random.integers(0, _PRIME, DUPLICATE_PERMUTATIONS, dtype=np.uint64)
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def signature(description, address=None):
+    """MinHash-подпись текста объявления (np.uint32) или None для слишком короткого текста"""
+    words = _WORD_RE.findall(f"{description or ''} {address or ''}".lower().replace('ё', 'е'))
+    shingles = {f"{first} {second}" for first, second in zip(words, words[1:])}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    ) % _PRIME
+    # Перестановки (a*x + b) mod p для всех значений сразу: матрица перестановки x шинглы
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(first, second) -> float:
+    """Оценка сходства Жаккара по двум подписям"""
+    return float(np.count_nonzero(first == second)) / len(first)
+
+
+class DuplicateIndex:
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._rows = DUPLICATE_PERMUTATIONS // DUPLICATE_BANDS
+        # property_id -> (подпись, тип, комнаты, площадь, цена)
+        self._entries = {}
+        # (номер полосы, байты полосы) -> множество property_id
+        self._buckets = {}
+
+    def register(self, bus):
+        """Подписывает индекс на события объявлений"""
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+        bus.subscribe(PROPERTY_PRICE_CHANGED, self.on_property_price_changed)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ========== ИНДЕКС ==========
+
+    def _band_keys(self, sig):
+        return [(band, sig[band * self._rows:(band + 1) * self._rows].tobytes()) for band in range(DUPLICATE_BANDS)]
+
+    def add(self, property_id: int, sig, property_type, rooms, area, price):
+        self.discard(property_id)
+        self._entries[property_id] = (sig, property_type, rooms, area, price)
+        for key in self._band_keys(sig):
+            self._buckets.setdefault(key, set()).add(property_id)
+
+    def discard(self, property_id: int):
+        entry = self._entries.pop(property_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[0]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(property_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def find(self, sig, property_type=None, rooms=None, area=None, price=None, before_id=None):
+        """Дубликаты подписи среди живых объявлений: [(property_id, сходство)] по убыванию сходства.
+
+        С before_id ищутся только более ранние объявления: дубликатом считается
+        повтор, а не оригинал.
+        """
+        candidates = set()
+        for key in self._band_keys(sig):
+            candidates |= self._buckets.get(key, set())
+
+        duplicates = []
+        for property_id in candidates:
+            if before_id is not None and property_id >= before_id:
+                continue
+            other_sig, other_type, other_rooms, other_area, other_price = self._entries[property_id]
+            if not _close_attributes(property_type, rooms, area, price, other_type, other_rooms, other_area, other_price):
+                continue
+            score = similarity(sig, other_sig)
+            if score >= self.threshold:
+                duplicates.append((property_id, score))
+        return sorted(duplicates, key=lambda item: item[1], reverse=True)
+
+    def find_duplicates(self, listing: dict):
+        """Дубликаты объявления (словаря полей; с id - только среди более ранних)"""
+        sig = signature(listing.get('description'), listing.get('address'))
+        if sig is None:
+            return []
+        return self.find(
+            sig, listing.get('property_type'), listing.get('rooms'), listing.get('area'), listing.get('price_uzs'),
+            before_id=listing.get('id')
+        )
+
+    # ========== ЗАГРУЗКА И ДОСЧЕТ ==========
+
+    async def load(self):
+        """Перечитывает подписи живых объявлений"""
+        async with ReadSession() as session:
+            rows = (await session.execute(
+                select(PropertyFingerprint.property_id, PropertyFingerprint.signature, Property.property_type,
+                       Property.rooms, Property.area, Property.price_uzs)
+                .join(Property, Property.id == PropertyFingerprint.property_id)
+                .where(Property.status.in_(LIVE_STATUSES), PropertyFingerprint.signature.is_not(None))
+            )).all()
+
+        self._entries = {}
+        self._buckets = {}
+        for property_id, blob, property_type, rooms, area, price in rows:
+            self.add(property_id, np.frombuffer(blob, dtype=np.uint32), property_type, rooms, area, price)
+        logger.info(f"Duplicate index loaded: {len(self)} listings")
+        return len(self)
+
+    async def backfill(self, batch_size: int = DUPLICATE_BACKFILL_BATCH):
+        """Досчитывает подписи объявлений без отпечатка пачками; возвращает число обработанных"""
+        total = 0
+        last_id = 0
+        while True:
+            async with ReadSession() as session:
+                batch = (await session.scalars(
+                    select(Property)
+                    .outerjoin(PropertyFingerprint, PropertyFingerprint.property_id == Property.id)
+                    .where(PropertyFingerprint.property_id.is_(None), Property.id > last_id)
+                    .order_by(Property.id)
+                    .limit(batch_size)
+                )).all()
+            if not batch:
+                break
+
+            await self._save([(property_obj, signature(property_obj.description, property_obj.address))
+                              for property_obj in batch])
+            total += len(batch)
+            last_id = batch[-1].id
+
+        if total:
+            logger.info(f"Fingerprinted {total} properties")
+        return total
+
+    async def _save(self, items):
+        """Записывает подписи [(объявление, подпись)] и индексирует живые объявления"""
+        rows = [
+            {'property_id': property_obj.id, 'signature': None if sig is None else sig.tobytes()}
+            for property_obj, sig in items
+        ]
+
+        async def job(session):
+            statement = sqlite_insert(PropertyFingerprint).on_conflict_do_nothing(index_elements=['property_id'])
+            await session.execute(statement, rows)
+
+        await run_write(job)
+        for property_obj, sig in items:
+            if sig is not None and property_obj.status in LIVE_STATUSES:
+                self.add(property_obj.id, sig, property_obj.property_type, property_obj.rooms,
+                         property_obj.area, property_obj.price_uzs)
+
+    # ========== СОБЫТИЯ ==========
+
+    async def on_property_created(self, property):
+        await self._save([(property, signature(property.description, property.address))])
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        if new_status not in LIVE_STATUSES:
+            self.discard(property.id)
+        elif property.id not in self._entries:
+            sig = signature(property.description, property.address)
+            if sig is not None:
+                self.add(property.id, sig, property.property_type, property.rooms, property.area, property.price_uzs)
+
+    async def on_property_price_changed(self, property, old_price, new_price):
+        entry = self._entries.get(property.id)
+        if entry is not None:
+            self._entries[property.id] = entry[:4] + (new_price,)
+
+
+def _close_attributes(property_type, rooms, area, price, other_type, other_rooms, other_area, other_price) -> bool:
+    """Тип и комнаты совпадают, площадь и цена отличаются не больше допуска (пропуски не мешают)"""
+    if property_type and other_type and property_type != other_type:
+        return False
+    if rooms is not None and other_rooms is not None and rooms != other_rooms:
+        return False
+    if area and other_area and abs(area - other_area) > DUPLICATE_AREA_TOLERANCE * max(area, other_area):
+        return False
+    if price and other_price and abs(price - other_price) > DUPLICATE_PRICE_TOLERANCE * max(price, other_price):
+        return False
+    return True
+
+
+duplicate_index = DuplicateIndex()
@@ -0,0 +1,115 @@
+"""Кэш прав по подпискам.
+
+Для каждого пользователя с активной подпиской в памяти лежит
+(дата окончания, бесплатный период), поэтому проверка прав на горячем пути -
+поиск в словаре. Истекшие подписки выключает периодический sweep() одним
+UPDATE по частичному индексу ix_subscriptions_active_end_date.
+
+Кэш обновляется сервисами после коммита (refresh_user) и полностью
+перечитывается при каждом проходе sweep().
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from database import ReadSession, Subscription
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+
+class EntitlementCache:
+    def __init__(self):
+        # user_id -> (end_date, is_free_period)
+        self._entries = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Пользователи, обновленные пока шло полное перечитывание
+        self._touched = set()
+
+    async def load(self):
+        """Перечитывает все активные подписки"""
+        self._touched = set()
+        async with ReadSession() as session:
+            rows = (await session.execute(
+                select(Subscription.user_id, Subscription.end_date, Subscription.is_free_period)
+                .where(Subscription.is_active == True)
+                .order_by(Subscription.end_date)
+            )).all()
+
+        # При нескольких активных подписках побеждает самая поздняя
+        entries = {row.user_id: (row.end_date, row.is_free_period) for row in rows}
+
+        # Обновления во время чтения новее прочитанного снимка
+        for user_id in self._touched:
+            if user_id in self._entries:
+                entries[user_id] = self._entries[user_id]
+            else:
+                entries.pop(user_id, None)
+
+        self._entries = entries
+        self._loaded = True
+        return len(self._entries)
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.load()
+
+    async def get(self, user_id: int):
+        """(end_date, is_free_period) активной подписки или None"""
+        await self._ensure_loaded()
+        return self._entries.get(user_id)
+
+    async def is_active(self, user_id: int, now: datetime = None) -> bool:
+        entry = await self.get(user_id)
+        return entry is not None and entry[0] is not None and entry[0] > (now or datetime.now())
+
+    async def refresh_user(self, user_id: int):
+        """Перечитывает подписку пользователя после ее изменения"""
+        async with ReadSession() as session:
+            row = (await session.execute(
+                select(Subscription.end_date, Subscription.is_free_period)
+                .where(Subscription.user_id == user_id, Subscription.is_active == True)
+                .order_by(Subscription.end_date.desc())
+                .limit(1)
+            )).first()
+
+        self._touched.add(user_id)
+        if row is None:
+            self._entries.pop(user_id, None)
+        else:
+            self._entries[user_id] = (row.end_date, row.is_free_period)
+
+    def discard(self, user_id: int):
+        self._touched.add(user_id)
+        self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def sweep(self):
+        """Выключает все истекшие подписки одним запросом и обновляет кэш"""
+        now = datetime.now()
+
+        async def job(session):
+            result = await session.execute(
+                update(Subscription).where(
+                    Subscription.is_active == True,
+                    Subscription.end_date <= now
+                ).values(is_active=False).returning(Subscription.user_id)
+            )
+            return result.scalars().all()
+
+        expired = await run_write(job)
+        await self.load()
+
+        if expired:
+            logger.info(f"Expired {len(expired)} subscriptions")
+        return expired
+
+
+entitlements = EntitlementCache()
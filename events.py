@@ -0,0 +1,61 @@
+"""Внутрипроцессная шина событий.
+
+Сервисы публикуют события после коммита изменений, подписчики
+(уведомления, публикация в канал, кэши) получают их в отдельных задачах,
+поэтому медленный подписчик не задерживает ответ пользователю.
+
+    bus.subscribe(PROPERTY_CREATED, handler)
+    await bus.publish(PROPERTY_CREATED, property=property_obj)
+
+Обработчик - корутинная функция, принимающая данные события как именованные аргументы.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Объявления
+PROPERTY_CREATED = 'property_created'            # property
+PROPERTY_PRICE_CHANGED = 'property_price_changed'  # property, old_price, new_price
+PROPERTY_STATUS_CHANGED = 'property_status_changed'  # property, old_status, new_status
+PROPERTY_LOCATION_CHANGED = 'property_location_changed'  # property
+
+# Пользователи
+USER_CREATED = 'user_created'            # user
+USER_ROLE_CHANGED = 'user_role_changed'  # telegram_id, old_role, new_role
+
+
+class EventBus:
+    def __init__(self):
+        self._handlers = defaultdict(list)
+        self._tasks = set()
+
+    def subscribe(self, event: str, handler):
+        if handler not in self._handlers[event]:
+            self._handlers[event].append(handler)
+
+    def unsubscribe(self, event: str, handler):
+        if handler in self._handlers[event]:
+            self._handlers[event].remove(handler)
+
+    async def publish(self, event: str, **payload):
+        """Запускает обработчики события, не дожидаясь их завершения"""
+        for handler in list(self._handlers[event]):
+            task = asyncio.create_task(self._call(event, handler, payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, event: str, handler, payload: dict):
+        try:
+            await handler(**payload)
+        except Exception as e:
+            logger.exception(f"Event handler {getattr(handler, '__qualname__', handler)} failed on {event}: {e}")
+
+    async def drain(self):
+        """Дожидается завершения запущенных обработчиков (при остановке)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+bus = EventBus()
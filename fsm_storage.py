@@ -0,0 +1,179 @@
+"""Хранилище состояний FSM в SQLite.
+
+Замена MemoryStorage: незаконченные сценарии (объявление, бронирование,
+поиск) переживают перезапуск бота, а память ограничена.
+
+- горячий кэш: LRU последних FSM_CACHE_SIZE ключей;
+- отложенная запись: изменения копятся в памяти и раз в FSM_FLUSH_INTERVAL
+  секунд пишутся одной транзакцией через очередь записи; при остановке
+  (close) сбрасываются сразу;
+- очистка: состояния без изменений дольше FSM_STATE_TTL удаляются, пустые
+  (состояние None и нет данных) удаляются при сбросе.
+
+Данные состояния должны сериализоваться в JSON.
+"""
+import asyncio
+import copy
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_STATE_TTL
+from database import ReadSession, FSMState
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 ttl: int = FSM_STATE_TTL, key_builder: DefaultKeyBuilder = None):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> [state, data]
+        self._cache = OrderedDict()
+        # Измененные, но еще не записанные ключи
+        self._dirty = {}
+        self._flush_task = None
+        self._last_cleanup = datetime.now()
+
+    # ========== ИНТЕРФЕЙС BaseStorage ==========
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        record = await self._get(storage_key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get(self.key_builder.build(key))
+        return record[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        record = await self._get(storage_key)
+        record[1] = copy.copy(data)
+        self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get(self.key_builder.build(key))
+        return copy.copy(record[1])
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    # ========== КЭШ ==========
+
+    async def _get(self, storage_key: str):
+        record = self._dirty.get(storage_key) or self._cache.get(storage_key)
+        if record is not None:
+            if storage_key in self._cache:
+                self._cache.move_to_end(storage_key)
+            return record
+
+        async with ReadSession() as session:
+            row = await session.get(FSMState, storage_key)
+
+        if row is not None and row.updated_at >= datetime.now() - timedelta(seconds=self.ttl):
+            record = [row.state, row.data or {}]
+        else:
+            record = [None, {}]
+
+        # Пока шло чтение, ключ мог измениться
+        current = self._dirty.get(storage_key) or self._cache.get(storage_key)
+        if current is not None:
+            return current
+
+        self._remember(storage_key, record)
+        return record
+
+    def _remember(self, storage_key: str, record):
+        self._cache[storage_key] = record
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > self.cache_size:
+            # Измененные записи остаются в _dirty до сброса, поэтому вытеснять безопасно
+            self._cache.popitem(last=False)
+
+    def _mark_dirty(self, storage_key: str, record):
+        self._dirty[storage_key] = record
+        self._remember(storage_key, record)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(), name='fsm-storage-flush')
+
+    # ========== ЗАПИСЬ ==========
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if datetime.now() - self._last_cleanup > timedelta(hours=1):
+                    await self.cleanup()
+                    self._last_cleanup = datetime.now()
+            except Exception as e:
+                logger.exception(f"FSM storage flush failed: {e}")
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return 0
+
+        batch, self._dirty = self._dirty, {}
+        now = datetime.now()
+        rows = [
+            {'key': key, 'state': state, 'data': data, 'updated_at': now}
+            for key, (state, data) in batch.items()
+            if state is not None or data
+        ]
+        empty = [key for key, (state, data) in batch.items() if state is None and not data]
+
+        async def job(session):
+            if rows:
+                statement = sqlite_insert(FSMState)
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=['key'],
+                        set_={
+                            'state': statement.excluded.state,
+                            'data': statement.excluded.data,
+                            'updated_at': statement.excluded.updated_at,
+                        }
+                    ),
+                    rows
+                )
+            if empty:
+                await session.execute(delete(FSMState).where(FSMState.key.in_(empty)))
+
+        try:
+            await run_write(job)
+        except Exception:
+            # Возвращаем несохраненное, если ключ не успели изменить заново
+            for key, record in batch.items():
+                self._dirty.setdefault(key, record)
+            raise
+        return len(batch)
+
+    async def cleanup(self):
+        """Удаляет состояния, не менявшиеся дольше ttl"""
+        border = datetime.now() - timedelta(seconds=self.ttl)
+
+        async def job(session):
+            result = await session.execute(delete(FSMState).where(FSMState.updated_at < border))
+            return result.rowcount
+
+        removed = await run_write(job)
+        if removed:
+            logger.info(f"Removed {removed} abandoned FSM states")
+        return removed
@@ -0,0 +1,103 @@
+"""Нормализация текста для полнотекстового поиска (FTS5).
+
+Описание и адрес попадают в индекс property_fts уже нормализованными
+(index_text при записи объявления заполняет колонки search_description
+и search_address, триггеры копируют их): нижний регистр, без апострофов
+узбекской латиницы (o'g'il -> ogil), кириллица переведена в латиницу по
+узбекским правилам.
+Так "янги уй" находит "yangi uy", а русские слова находятся и на кириллице,
+и набранные латиницей.
+
+Запрос проходит ту же нормализацию; перед этим у слов срезаются частые
+окончания (русские падежные, узбекские аффиксы) - основа только короче
+слова, поэтому лишнее срезание не теряет совпадений; каждое слово ищется по
+префиксу: "ремонт у парка" -> "remont"* AND "park"*. Предлоги и союзы
+отбрасываются.
+"""
+import re
+
+_APOSTROPHES = ("'", 'ʻ', 'ʼ', '‘', '’', '`', '´')
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # узбекская кириллица
+    'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-яёўқғҳ]')
+
+# Окончания срезаются, только если от слова остается не меньше MIN_STEM букв
+MIN_STEM = 3
+UZ_MIN_STEM = 2
+_RU_ENDINGS = tuple(sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах', 'ях', 'ов', 'ев', 'ом', 'ем',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ой', 'ей', 'ий', 'ый', 'ую', 'юю',
+    'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+), key=len, reverse=True))
+_UZ_ENDINGS = tuple(sorted((
+    'lari', 'lar', 'dagi', 'dan', 'da', 'ga', 'ni', 'ning',
+    'лари', 'лар', 'даги', 'дан', 'да', 'га', 'ни', 'нинг',
+), key=len, reverse=True))
+
+STOP_WORDS = {
+    'в', 'во', 'на', 'у', 'с', 'со', 'к', 'ко', 'и', 'или', 'для', 'от', 'до', 'по', 'за', 'под',
+    'над', 'о', 'об', 'около', 'возле', 'из', 'не',
+    'va', 'bilan', 'uchun', 'yoki', 'ва', 'билан', 'учун',
+    'the', 'a', 'an', 'and', 'or', 'in', 'on', 'at', 'for', 'with', 'of', 'to', 'near',
+}
+
+
+def index_text(text) -> str:
+    """Текст в том виде, в котором он хранится в индексе"""
+    if not text:
+        return ''
+    text = text.lower()
+    for apostrophe in _APOSTROPHES:
+        if apostrophe in text:
+            text = text.replace(apostrophe, '')
+    return text.translate(_TRANSLIT)
+
+
+def _strip(word: str, endings, min_stem: int) -> str:
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= min_stem:
+            return word[:-len(ending)]
+    return word
+
+
+def _stem(word: str) -> str:
+    if _CYRILLIC_RE.search(word):
+        # Русский или узбекский на кириллице: узбекский аффикс срезается, только если
+        # корень длинный (иначе "сада" -> "са"), затем - русское окончание
+        stem = _strip(word, _UZ_ENDINGS, MIN_STEM + 1)
+        return stem if stem != word else _strip(word, _RU_ENDINGS, MIN_STEM)
+    # Узбекские аффиксы идут цепочкой (uy-lar-ni), корни бывают из двух букв
+    return _strip(_strip(word, _UZ_ENDINGS, UZ_MIN_STEM), _UZ_ENDINGS, UZ_MIN_STEM)
+
+
+def query_terms(query: str):
+    """Основы слов запроса в нормализованном виде (без предлогов и однобуквенных)"""
+    text = (query or '').lower()
+    for apostrophe in _APOSTROPHES:
+        text = text.replace(apostrophe, '')
+    terms = []
+    for word in _WORD_RE.findall(text):
+        if word in STOP_WORDS:
+            continue
+        term = _stem(word).translate(_TRANSLIT)
+        if len(term) > 1 and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def fts_query(query: str):
+    """Выражение MATCH для FTS5: все слова запроса по префиксу; None для пустого запроса"""
+    terms = query_terms(query)
+    if not terms:
+        return None
+    # Основы состоят только из букв и цифр, кавычки внутри не встречаются
+    return ' '.join(f'"{term}"*' for term in terms)
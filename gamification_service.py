@@ -1,6 +1,8 @@
 from datetime import datetime
-from database import Session, Badge, User, Property, Rating
+from sqlalchemy import select, func
+from database import ReadSession, Badge, User, Property, Rating
 from locales import get_text
+from write_queue import run_write
 
 class GamificationService:
     BADGES = {
@@ -27,89 +29,76 @@ class GamificationService:
     }
     
     @staticmethod
-    def check_and_award_badges(user_id):
+    async def check_and_award_badges(user_id):
         """Проверяет и награждает пользователя бейджами"""
-        session = Session()
-        try:
-            user = session.query(User).filter(User.telegram_id == user_id).first()
+        async with ReadSession() as session:
+            user = await session.scalar(select(User).where(User.telegram_id == user_id))
             if not user:
                 return []
             
             awarded_badges = []
             
             # Проверяем бейдж первого объявления
-            properties_count = session.query(Property).filter(Property.user_id == user_id).count()
-            if properties_count >= 1 and not GamificationService.has_badge(user_id, 'first_property'):
-                GamificationService.award_badge(user_id, 'first_property')
+            properties_count = await session.scalar(
+                select(func.count(Property.id)).where(Property.user_id == user_id)
+            )
+            if properties_count >= 1 and not await GamificationService.has_badge(user_id, 'first_property'):
+                await GamificationService.award_badge(user_id, 'first_property')
                 awarded_badges.append('first_property')
             
             # Проверяем бейдж активного пользователя
-            if properties_count >= 10 and not GamificationService.has_badge(user_id, 'power_user'):
-                GamificationService.award_badge(user_id, 'power_user')
+            if properties_count >= 10 and not await GamificationService.has_badge(user_id, 'power_user'):
+                await GamificationService.award_badge(user_id, 'power_user')
                 awarded_badges.append('power_user')
             
             # Проверяем бейдж высокого рейтинга
-            if user.rating >= 4.5 and user.rating_count >= 10 and not GamificationService.has_badge(user_id, 'top_rated'):
-                GamificationService.award_badge(user_id, 'top_rated')
+            if user.rating >= 4.5 and user.rating_count >= 10 and not await GamificationService.has_badge(user_id, 'top_rated'):
+                await GamificationService.award_badge(user_id, 'top_rated')
                 awarded_badges.append('top_rated')
             
             return awarded_badges
-            
-        finally:
-            session.close()
     
     @staticmethod
-    def award_badge(user_id, badge_type):
+    async def award_badge(user_id, badge_type):
         """Награждает пользователя бейджем"""
-        session = Session()
-        try:
-            badge_info = GamificationService.BADGES.get(badge_type)
-            if not badge_info:
-                return False
-            
-            badge = Badge(
+        badge_info = GamificationService.BADGES.get(badge_type)
+        if not badge_info:
+            return False
+        
+        async def job(session):
+            session.add(Badge(
                 user_id=user_id,
                 badge_type=badge_type,
                 badge_name=badge_info['name'],
                 description=badge_info['description'],
                 awarded_at=datetime.now()
-            )
-            
-            session.add(badge)
-            session.commit()
+            ))
             return True
-            
+        
+        try:
+            return await run_write(job)
         except Exception as e:
-            session.rollback()
             return False
-        finally:
-            session.close()
     
     @staticmethod
-    def has_badge(user_id, badge_type):
+    async def has_badge(user_id, badge_type):
         """Проверяет, есть ли у пользователя бейдж"""
-        session = Session()
-        try:
-            badge = session.query(Badge).filter(
+        async with ReadSession() as session:
+            badge = await session.scalar(select(Badge).where(
                 Badge.user_id == user_id,
                 Badge.badge_type == badge_type,
                 Badge.is_active == True
-            ).first()
+            ))
             
             return badge is not None
-        finally:
-            session.close()
     
     @staticmethod
-    def get_user_badges(user_id):
+    async def get_user_badges(user_id):
         """Получает все бейджи пользователя"""
-        session = Session()
-        try:
-            badges = session.query(Badge).filter(
+        async with ReadSession() as session:
+            badges = await session.scalars(select(Badge).where(
                 Badge.user_id == user_id,
                 Badge.is_active == True
-            ).order_by(Badge.awarded_at.desc()).all()
+            ).order_by(Badge.awarded_at.desc()))
             
-            return badges
-        finally:
-            session.close()
+            return badges.all()
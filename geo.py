@@ -0,0 +1,113 @@
+"""Координаты объявлений: расстояния и районы Чирчика по координатам.
+
+Район определяется без внешнего геокодера - проверкой точки в полигонах
+районов из файла GeoJSON в репозитории (GEO_DISTRICTS_FILE, координаты в
+порядке [долгота, широта]). Полигон проверяется лучом (even-odd), дыры
+и MultiPolygon поддерживаются; сначала отсекаются полигоны, в рамку
+которых точка не попадает.
+"""
+import json
+import logging
+import math
+
+from config import GEO_DISTRICTS_FILE
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6_371_000
+# Метров в градусе широты
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def valid_location(latitude, longitude) -> bool:
+    """Координаты заданы и лежат в допустимых пределах"""
+    return (latitude is not None and longitude is not None
+            and -90 <= latitude <= 90 and -180 <= longitude <= 180)
+
+
+def location_from_message(message):
+    """(широта, долгота) из сообщения с геопозицией или местом (venue) или None"""
+    location = message.location or (message.venue.location if message.venue else None)
+    if location is None:
+        return None
+    return location.latitude, location.longitude
+
+
+def distance_m(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Расстояние между точками по поверхности Земли (haversine), в метрах"""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    half_phi = (phi2 - phi1) / 2
+    half_lambda = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_phi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_lambda) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_m: float):
+    """Рамка (юг, запад, север, восток), в которую целиком попадает круг радиуса radius_m"""
+    delta_latitude = radius_m / METERS_PER_DEGREE
+    cos_latitude = math.cos(math.radians(min(abs(latitude) + delta_latitude, 89.9)))
+    delta_longitude = min(radius_m / (METERS_PER_DEGREE * cos_latitude), 180)
+    return (max(latitude - delta_latitude, -90), longitude - delta_longitude,
+            min(latitude + delta_latitude, 90), longitude + delta_longitude)
+
+
+def _inside_ring(longitude: float, latitude: float, ring) -> bool:
+    inside = False
+    x2, y2 = ring[-1]
+    for x1, y1 in ring:
+        if (y1 > latitude) != (y2 > latitude) and longitude < (x2 - x1) * (latitude - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x2, y2 = x1, y1
+    return inside
+
+
+class DistrictMap:
+    """Полигоны районов: район по координатам"""
+
+    def __init__(self, features=()):
+        # (район, рамка (запад, юг, восток, север), кольца полигона)
+        self._polygons = []
+        for feature in features:
+            name = feature['properties']['district']
+            geometry = feature['geometry']
+            polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+            for rings in polygons:
+                rings = [[(float(x), float(y)) for x, y, *_ in ring] for ring in rings]
+                xs = [x for x, _ in rings[0]]
+                ys = [y for _, y in rings[0]]
+                self._polygons.append((name, (min(xs), min(ys), max(xs), max(ys)), rings))
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Полигоны из файла GeoJSON (FeatureCollection с properties.district)"""
+        try:
+            with open(path, encoding='utf-8') as file:
+                return cls(json.load(file)['features'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load district polygons from {path}: {e}")
+            return cls()
+
+    @property
+    def districts(self):
+        return list(dict.fromkeys(name for name, _, _ in self._polygons))
+
+    def district_of(self, latitude: float, longitude: float):
+        """Район, в полигон которого попадает точка, или None"""
+        for name, (west, south, east, north), rings in self._polygons:
+            if not (west <= longitude <= east and south <= latitude <= north):
+                continue
+            # Точка внутри, если она внутри внешнего кольца и не в дыре - нечетное число пересечений
+            if sum(_inside_ring(longitude, latitude, ring) for ring in rings) % 2:
+                return name
+        return None
+
+
+_district_map = None
+
+
+def district_of(latitude: float, longitude: float):
+    """Район Чирчика по координатам или None (полигоны читаются при первом вызове)"""
+    global _district_map
+    if _district_map is None:
+        _district_map = DistrictMap.from_file(GEO_DISTRICTS_FILE)
+    return _district_map.district_of(latitude, longitude)
@@ -0,0 +1,177 @@
+"""Сеточный индекс координат активных объявлений.
+
+Плоскость разбита на ячейки примерно GEO_CELL_SIZE_M x GEO_CELL_SIZE_M
+метров (размер ячейки по долготе рассчитан на широту Чирчика), для каждой
+непустой ячейки хранится множество id объявлений. Запрос по рамке или
+радиусу перебирает только ячейки, которые рамка задевает, и проверяет
+точно лишь объявления из них; поиск в радиусе сортирует найденные по
+расстоянию. Страницы задаются ключом (расстояние, id) последнего
+показанного объявления (см. pagination).
+
+Индекс обновляется обработчиками событий шины, как поисковый индекс.
+"""
+import logging
+import math
+from bisect import bisect_right
+
+from sqlalchemy import select
+
+from config import GEO_CELL_SIZE_M
+from database import ReadSession, Property
+from events import PROPERTY_CREATED, PROPERTY_LOCATION_CHANGED, PROPERTY_STATUS_CHANGED
+from geo import METERS_PER_DEGREE, bounding_box, distance_m, valid_location
+
+logger = logging.getLogger(__name__)
+
+# Широта Чирчика: на ней ячейки получаются квадратными
+CITY_LATITUDE = 41.47
+CELL_LATITUDE = GEO_CELL_SIZE_M / METERS_PER_DEGREE
+CELL_LONGITUDE = GEO_CELL_SIZE_M / (METERS_PER_DEGREE * math.cos(math.radians(CITY_LATITUDE)))
+
+
+def _cell(latitude: float, longitude: float):
+    return math.floor(latitude / CELL_LATITUDE), math.floor(longitude / CELL_LONGITUDE)
+
+
+class GeoIndex:
+    def __init__(self):
+        self._clear()
+        # События, пришедшие во время полного перечитывания
+        self._replay = None
+
+    def _clear(self):
+        # ячейка -> id объявлений
+        self._cells = {}
+        # id объявления -> (широта, долгота, ячейка)
+        self._points = {}
+
+    def register(self, bus):
+        """Подписывает индекс на события объявлений"""
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+        bus.subscribe(PROPERTY_LOCATION_CHANGED, self.on_property_location_changed)
+
+    def __len__(self):
+        return len(self._points)
+
+    # ========== ЗАГРУЗКА ==========
+
+    async def load(self):
+        """Перечитывает координаты всех активных объявлений"""
+        self._replay = []
+        try:
+            async with ReadSession() as session:
+                rows = (await session.execute(
+                    select(Property.id, Property.latitude, Property.longitude)
+                    .where(Property.status == 'active', Property.latitude.is_not(None),
+                           Property.longitude.is_not(None))
+                )).all()
+
+            self._clear()
+            for row in rows:
+                self._add(row.id, row.latitude, row.longitude)
+
+            # Изменения во время чтения новее прочитанного снимка
+            for handler, args in self._replay:
+                handler(*args)
+        finally:
+            self._replay = None
+
+        logger.info(f"Geo index loaded: {len(self)} listings")
+        return len(self)
+
+    # ========== ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ==========
+
+    async def on_property_created(self, property):
+        if property.status == 'active':
+            self._apply(self._add, property.id, property.latitude, property.longitude)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        if new_status == 'active':
+            self._apply(self._add, property.id, property.latitude, property.longitude)
+        elif old_status == 'active':
+            self._apply(self._remove, property.id)
+
+    async def on_property_location_changed(self, property):
+        if property.status == 'active':
+            self._apply(self._add, property.id, property.latitude, property.longitude)
+
+    def _apply(self, handler, *args):
+        if self._replay is not None:
+            self._replay.append((handler, args))
+        handler(*args)
+
+    def _add(self, property_id: int, latitude, longitude):
+        self._remove(property_id)
+        if not valid_location(latitude, longitude):
+            return
+        cell = _cell(latitude, longitude)
+        self._points[property_id] = (latitude, longitude, cell)
+        self._cells.setdefault(cell, set()).add(property_id)
+
+    def _remove(self, property_id: int):
+        point = self._points.pop(property_id, None)
+        if point is None:
+            return
+        cell = point[2]
+        ids = self._cells[cell]
+        ids.discard(property_id)
+        if not ids:
+            del self._cells[cell]
+
+    # ========== ЗАПРОСЫ ==========
+
+    def _candidates(self, south: float, west: float, north: float, east: float):
+        """id объявлений из ячеек, которые задевает рамка"""
+        first_row, first_column = _cell(south, west)
+        last_row, last_column = _cell(north, east)
+        cells = (last_row - first_row + 1) * (last_column - first_column + 1)
+        if cells > len(self._cells):
+            # Рамка больше занятой части сетки - дешевле пройти по непустым ячейкам
+            for (row, column), ids in self._cells.items():
+                if first_row <= row <= last_row and first_column <= column <= last_column:
+                    yield from ids
+            return
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                ids = self._cells.get((row, column))
+                if ids:
+                    yield from ids
+
+    def within(self, south: float, west: float, north: float, east: float, accept=None):
+        """id объявлений внутри рамки (accept(id) - дополнительный отбор)"""
+        result = []
+        for property_id in self._candidates(south, west, north, east):
+            latitude, longitude, _ = self._points[property_id]
+            if (south <= latitude <= north and west <= longitude <= east
+                    and (accept is None or accept(property_id))):
+                result.append(property_id)
+        return result
+
+    def nearby(self, latitude: float, longitude: float, radius_m: float, accept=None, after=None, limit: int = 10):
+        """Объявления в радиусе, ближние первыми: (id страницы, всего найдено, ключ последнего или None).
+
+        after - ключ (расстояние, id) последнего показанного объявления.
+        """
+        found = []
+        for property_id in self._candidates(*bounding_box(latitude, longitude, radius_m)):
+            point_latitude, point_longitude, _ = self._points[property_id]
+            distance = distance_m(latitude, longitude, point_latitude, point_longitude)
+            if distance <= radius_m and (accept is None or accept(property_id)):
+                found.append((distance, property_id))
+        found.sort()
+
+        start = bisect_right(found, tuple(after)) if after is not None else 0
+        page = found[start:start + limit]
+        next_key = page[-1] if page and start + limit < len(found) else None
+        return [property_id for _, property_id in page], len(found), next_key
+
+    def distances(self, latitude: float, longitude: float, ids):
+        """id -> расстояние в метрах до точки (для объявлений с координатами)"""
+        return {
+            property_id: distance_m(latitude, longitude, *self._points[property_id][:2])
+            for property_id in ids if property_id in self._points
+        }
+
+
+geo_index = GeoIndex()
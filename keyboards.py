@@ -7,6 +7,13 @@ from aiogram.types import (
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
 from locales import TEXTS
+from pagination import cursor_callback
+
+def _with_count(text: str, counts: dict, value) -> str:
+    """Текст кнопки фильтра с числом объявлений"""
+    if counts is None:
+        return text
+    return f"{text} ({counts.get(value, 0)})"
 
 # ========== REPLY KEYBOARDS ==========
 
@@ -113,8 +120,8 @@ def get_currency_keyboard(language: str) -> InlineKeyboardMarkup:
     builder.adjust(2)
     return builder.as_markup()
 
-def get_property_type_keyboard(language: str, include_any: bool = False) -> InlineKeyboardMarkup:
-    """Клавиатура выбора типа недвижимости"""
+def get_property_type_keyboard(language: str, include_any: bool = False, counts: dict = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора типа недвижимости (counts - число объявлений по типам для поиска)"""
     builder = InlineKeyboardBuilder()
     
     property_types = [
@@ -128,7 +135,7 @@ def get_property_type_keyboard(language: str, include_any: bool = False) -> Inli
     
     for text, prop_type in property_types:
         builder.add(InlineKeyboardButton(
-            text=text,
+            text=_with_count(text, counts, prop_type),
             callback_data=f"property_type_{prop_type}"
         ))
     
@@ -146,8 +153,8 @@ def get_property_type_keyboard(language: str, include_any: bool = False) -> Inli
     builder.adjust(2)
     return builder.as_markup()
 
-def get_district_keyboard(language: str, include_any: bool = False) -> InlineKeyboardMarkup:
-    """Клавиатура выбора района Чирчика"""
+def get_district_keyboard(language: str, include_any: bool = False, counts: dict = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора района Чирчика (counts - число объявлений по районам для поиска)"""
     builder = InlineKeyboardBuilder()
     
     districts = [
@@ -165,7 +172,7 @@ def get_district_keyboard(language: str, include_any: bool = False) -> InlineKey
     
     for district in districts:
         builder.add(InlineKeyboardButton(
-            text=district,
+            text=_with_count(district, counts, district),
             callback_data=f"district_{district}"
         ))
     
@@ -351,28 +358,26 @@ def get_chat_keyboard(language: str, user_id: int) -> InlineKeyboardMarkup:
     
     return builder.as_markup()
 
-def get_pagination_keyboard(page: int, total_pages: int, prefix: str) -> InlineKeyboardMarkup:
-    """Клавиатура пагинации"""
+def get_pagination_keyboard(prefix: str, next_cursor: str = None, first_page: bool = True) -> InlineKeyboardMarkup:
+    """Клавиатура курсорной пагинации: в начало списка и следующая страница.
+
+    callback_data - "<prefix>:<курсор>", разбирается pagination.parse_callback.
+    """
     builder = InlineKeyboardBuilder()
     
-    if page > 1:
+    if not first_page:
         builder.add(InlineKeyboardButton(
-            text="⬅ Назад",
-            callback_data=f"{prefix}page{page-1}"
+            text="⏮ В начало",
+            callback_data=cursor_callback(prefix)
         ))
     
-    builder.add(InlineKeyboardButton(
-        text=f"{page}/{total_pages}",
-        callback_data="current_page"
-    ))
-    
-    if page < total_pages:
+    if next_cursor:
         builder.add(InlineKeyboardButton(
             text="Вперед ➡",
-            callback_data=f"{prefix}page{page+1}"
+            callback_data=cursor_callback(prefix, next_cursor)
         ))
     
-    builder.adjust(3)
+    builder.adjust(2)
     return builder.as_markup()
 
 def get_confirmation_keyboard(language: str, action: str) -> InlineKeyboardMarkup:
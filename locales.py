@@ -175,6 +175,14 @@ TEXTS = {
         # Модерация
         "property_flagged": "🚨 Объявление помечено как подозрительное",
         "auto_moderation_failed": "❌ Объявление не прошло автоматическую модерацию",
+        
+        # Ограничения
+        "too_many_requests": "⏳ Слишком много запросов. Попробуйте через {seconds} сек.",
+        
+        # Оценка цены
+        "ai_price_enter_details": "📐 Введите через пробел: комнаты, площадь (м²), этаж и год постройки (необязательно).\nНапример: 2 54 3 2012",
+        "ai_price_result": "💰 Справедливая цена: <b>{price}</b>\n📊 Диапазон: {low} - {high}\n🏘 Аналогов: {comparables} (в том же районе: {same_district})",
+        "ai_price_no_data": "🤷 Недостаточно похожих объявлений для оценки"
     },
     
     "uz": {
@@ -353,6 +361,14 @@ TEXTS = {
         # Модерация
         "property_flagged": "🚨 E'lon shubhali deb belgilandi",
         "auto_moderation_failed": "❌ E'lon avtomatik moderatsiyadan o'tmadi",
+        
+        # Ограничения
+        "too_many_requests": "⏳ So'rovlar juda ko'p. {seconds} soniyadan keyin urinib ko'ring.",
+        
+        # Narxni baholash
+        "ai_price_enter_details": "📐 Bo'sh joy bilan kiriting: xonalar, maydon (m²), qavat va qurilgan yil (ixtiyoriy).\nMasalan: 2 54 3 2012",
+        "ai_price_result": "💰 Adolatli narx: <b>{price}</b>\n📊 Oraliq: {low} - {high}\n🏘 O'xshash e'lonlar: {comparables} (shu tumanda: {same_district})",
+        "ai_price_no_data": "🤷 Baholash uchun o'xshash e'lonlar yetarli emas"
     },
     
     "en": {
@@ -531,6 +547,14 @@ TEXTS = {
         # Модерация
         "property_flagged": "🚨 Property flagged as suspicious",
         "auto_moderation_failed": "❌ Property failed automatic moderation",
+        
+        # Ограничения
+        "too_many_requests": "⏳ Too many requests. Try again in {seconds} sec.",
+        
+        # Price estimation
+        "ai_price_enter_details": "📐 Enter separated by spaces: rooms, area (m²), floor and year built (optional).\nExample: 2 54 3 2012",
+        "ai_price_result": "💰 Fair price: <b>{price}</b>\n📊 Range: {low} - {high}\n🏘 Comparables: {comparables} (same district: {same_district})",
+        "ai_price_no_data": "🤷 Not enough similar listings for an estimate"
     }
 }
 
@@ -538,4 +562,4 @@ def get_text(key: str, lang: str = 'ru', **kwargs) -> str:
     text = TEXTS.get(lang, TEXTS['ru']).get(key, key)
     if kwargs:
         return text.format(**kwargs)
-    return text
+    return text
@@ -7,21 +7,40 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from config import TELEGRAM_TOKEN, ADMIN_IDS
+from config import (
+    TELEGRAM_TOKEN, ADMIN_IDS, CHANNEL_ID, RATE_LIMIT_STATE_FILE, SUBSCRIPTION_SWEEP_INTERVAL, BOT_MODE,
+    MARKET_TRENDS_RELOAD_INTERVAL, MODERATION_INTERVAL, SEARCH_INDEX_RELOAD_INTERVAL
+)
 from database import Database
+from events import bus
+from notification_service import NotificationService
+from channel_service import ChannelService
+from broadcast_service import BroadcastService
+from stats_service import StatsService
+from market_trends import market_trends
+from search_index import search_index
+from geo_index import geo_index
+from price_estimator import price_estimator
+from moderation_service import ModerationService
+from duplicate_index import duplicate_index
+from outbox import outbox
+from fsm_storage import SQLiteStorage
+from webhook import WebhookServer
+from rate_limiter import user_limiter
+from entitlements import entitlements
+from middlewares import ThrottlingMiddleware, UpdateScheduler
 from locales import TEXTS
-from states import PropertyStates, SearchStates, AdminStates, UserStates
+from states import PropertyStates, SearchStates, AdminStates, UserStates, AIPriceStates
 from keyboards import (
     get_role_keyboard, get_main_menu_keyboard, get_property_type_keyboard,
     get_district_keyboard, get_currency_keyboard, get_ai_features_keyboard,
     get_admin_keyboard, get_language_keyboard, get_rating_keyboard,
     get_back_to_main_keyboard, get_yes_no_keyboard, get_phone_keyboard
 )
-from utils import format_price, send_notification, check_subscription
+from utils import format_price, send_notification, check_subscription, run_periodically
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,7 +48,15 @@ logger = logging.getLogger(__name__)
 if not TELEGRAM_TOKEN:
     logger.error("TELEGRAM_TOKEN is not set. Set TELEGRAM_TOKEN environment variable.")
 bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+# Состояния FSM хранятся в БД и переживают перезапуск (закрывается диспетчером при остановке)
+dp = Dispatcher(storage=SQLiteStorage())
+
+# Планировщик: порядок обновлений пользователя, приоритеты, сброс нагрузки
+dp.update.outer_middleware(UpdateScheduler())
+
+# Ограничение частоты действий пользователей
+dp.message.middleware(ThrottlingMiddleware())
+dp.callback_query.middleware(ThrottlingMiddleware())
 
 # Инициализация базы данных
 db = Database()
@@ -92,6 +119,80 @@ async def show_language_selection(message: types.Message):
         reply_markup=keyboard
     )
 
+# ========== AI PRICE ESTIMATION ==========
+async def get_language(user_id: int) -> str:
+    user = await db.get_user(user_id)
+    return user.get('language', 'ru') if user else 'ru'
+
+@dp.callback_query(F.data == "ai_ai_price")
+async def ai_price_start(callback: types.CallbackQuery, state: FSMContext):
+    """Оценка цены: выбор типа недвижимости"""
+    language = await get_language(callback.from_user.id)
+    await state.set_state(AIPriceStates.entering_property_details)
+    await state.set_data({})
+    await callback.message.answer(
+        TEXTS[language]["choose_property_type"],
+        reply_markup=get_property_type_keyboard(language)
+    )
+    await callback.answer()
+
+@dp.callback_query(AIPriceStates.entering_property_details, F.data.startswith("property_type_"))
+async def ai_price_type(callback: types.CallbackQuery, state: FSMContext):
+    """Оценка цены: выбор района"""
+    language = await get_language(callback.from_user.id)
+    await state.update_data(property_type=callback.data[len("property_type_"):])
+    await callback.message.answer(
+        TEXTS[language]["choose_district"],
+        reply_markup=get_district_keyboard(language)
+    )
+    await callback.answer()
+
+@dp.callback_query(AIPriceStates.entering_property_details, F.data.startswith("district_"))
+async def ai_price_district(callback: types.CallbackQuery, state: FSMContext):
+    """Оценка цены: ввод комнат, площади, этажа и года постройки"""
+    language = await get_language(callback.from_user.id)
+    await state.update_data(district=callback.data[len("district_"):])
+    await callback.message.answer(TEXTS[language]["ai_price_enter_details"])
+    await callback.answer()
+
+@dp.message(AIPriceStates.entering_property_details, F.text)
+async def ai_price_details(message: types.Message, state: FSMContext):
+    """Оценка цены по аналогам"""
+    language = await get_language(message.from_user.id)
+    data = await state.get_data()
+    try:
+        # комнаты, площадь[, этаж[, год постройки]]
+        values = [value.replace(',', '.') for value in message.text.replace(';', ' ').replace(', ', ' ').split()]
+        rooms, area = int(values[0]), float(values[1])
+        floor = int(values[2]) if len(values) > 2 else None
+        year_built = int(values[3]) if len(values) > 3 else None
+    except (ValueError, IndexError):
+        await message.answer(TEXTS[language]["ai_price_enter_details"])
+        return
+
+    if 'property_type' not in data:
+        await state.clear()
+        await message.answer(TEXTS[language]["ai_price_no_data"])
+        return
+
+    await state.set_state(AIPriceStates.analyzing_market)
+    estimate = await price_estimator.estimate(
+        data['property_type'], data.get('district'), rooms, area, floor, year_built
+    )
+    await state.set_state(UserStates.main_menu)
+
+    if not estimate:
+        await message.answer(TEXTS[language]["ai_price_no_data"])
+        return
+
+    await message.answer(TEXTS[language]["ai_price_result"].format(
+        price=format_price(estimate['price'], 'UZS'),
+        low=format_price(estimate['low'], 'UZS'),
+        high=format_price(estimate['high'], 'UZS'),
+        comparables=estimate['comparables'],
+        same_district=estimate['same_district']
+    ), reply_markup=get_back_to_main_keyboard(language))
+
 # ========== ERROR HANDLER ==========
 @dp.errors()
 async def error_handler(update: types.Update, exception: Exception):
@@ -114,11 +215,88 @@ async def main():
     """Основная функция запуска бота"""
     logger.info("Starting bot...")
     
-    # Создаем таблицы в базе данных
-    await db.create_tables()
+    # Применяем миграции схемы базы данных
+    await db.migrate()
+
+    # Подписчики на события объявлений
+    notification_service = NotificationService(bot)
+    await notification_service.load_search_index()
+    notification_service.register(bus)
+    if CHANNEL_ID:
+        ChannelService(bot, CHANNEL_ID).register(bus)
+    StatsService().register(bus)
+    market_trends.register(bus)
+    search_index.register(bus)
+    geo_index.register(bus)
+    duplicate_index.register(bus)
+
+    # Догоняем объявления, появившиеся пока бот был остановлен
+    background_tasks = [asyncio.create_task(notification_service.check_saved_searches())]
+
+    # Кэш прав по подпискам и периодическое выключение истекших подписок
+    await entitlements.sweep()
+    background_tasks.append(asyncio.create_task(
+        run_periodically(SUBSCRIPTION_SWEEP_INTERVAL, entitlements.sweep, initial_delay=SUBSCRIPTION_SWEEP_INTERVAL)
+    ))
+
+    # Сводки дашборда: построение при первом запуске и ночной пересчет
+    await StatsService.ensure_built()
+    background_tasks.append(asyncio.create_task(
+        run_periodically(24 * 3600, StatsService.reconcile, initial_delay=StatsService.seconds_until_reconcile())
+    ))
+
+    # Снимок рыночных трендов: загрузка и периодическое перечитывание
+    await market_trends.load()
+    background_tasks.append(asyncio.create_task(
+        run_periodically(MARKET_TRENDS_RELOAD_INTERVAL, market_trends.load, initial_delay=MARKET_TRENDS_RELOAD_INTERVAL)
+    ))
+
+    # Поисковый индекс: загрузка и периодическое перестроение
+    await search_index.load()
+    background_tasks.append(asyncio.create_task(
+        run_periodically(SEARCH_INDEX_RELOAD_INTERVAL, search_index.load, initial_delay=SEARCH_INDEX_RELOAD_INTERVAL)
+    ))
+
+    # Индекс координат для поиска рядом: загрузка и перестроение вместе с поисковым
+    await geo_index.load()
+    background_tasks.append(asyncio.create_task(
+        run_periodically(SEARCH_INDEX_RELOAD_INTERVAL, geo_index.load, initial_delay=SEARCH_INDEX_RELOAD_INTERVAL)
+    ))
+
+    # Индекс дубликатов: подписи живых объявлений и досчет подписей старых объявлений
+    await duplicate_index.load()
+    background_tasks.append(asyncio.create_task(duplicate_index.backfill()))
+
+    # Автоматическая модерация объявлений в статусе pending
+    background_tasks.append(asyncio.create_task(
+        run_periodically(MODERATION_INTERVAL, ModerationService.moderate_pending)
+    ))
+
+    # Продолжаем рассылки, прерванные перезапуском
+    await BroadcastService(bot).resume_pending()
+
+    # Фоновая доставка уведомлений из outbox
+    outbox.start(bot)
+    
+    # Счетчики лимитов, сохраненные при прошлой остановке
+    if RATE_LIMIT_STATE_FILE:
+        user_limiter.load(RATE_LIMIT_STATE_FILE)
     
     # Запускаем бота
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == 'webhook':
+            await WebhookServer(dp, bot).run()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await bus.drain()
+        await outbox.stop()
+        await db.close()
+        if RATE_LIMIT_STATE_FILE:
+            user_limiter.save(RATE_LIMIT_STATE_FILE)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,359 @@
+"""Рыночные тренды по активным объявлениям.
+
+Активные объявления лежат в памяти колонками NumPy (цена, площадь, комнаты,
+район, тип, месяц публикации, этаж, год постройки). Статистика по месяцам - объем, средняя цена,
+медиана, p25/p75 и медианная цена за м² - считается векторно за один
+проход сразу для всех групп, без цикла по объявлениям.
+
+Снимок обновляется инкрементально обработчиками событий шины: новые
+объявления копятся в буфере и дописываются в колонки при следующем запросе,
+снятые с публикации помечаются удаленными, цена меняется на месте. Результаты
+запросов кэшируются до следующего изменения. Полное перечитывание (load)
+исправляет расхождения, как ночной пересчет сводок.
+
+Колонки снимка (columns) использует и оценка цены по аналогам (price_estimator).
+"""
+import asyncio
+import logging
+
+import numpy as np
+from sqlalchemy import select
+
+from database import ReadSession, Property
+from events import PROPERTY_CREATED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED
+
+logger = logging.getLogger(__name__)
+
+# Колонки снимка
+PRICE = 'price_uzs'
+AREA = 'area'
+ROOMS = 'rooms'
+DISTRICT = 'district'
+TYPE = 'property_type'
+MONTH = 'month'
+FLOOR = 'floor'
+YEAR_BUILT = 'year_built'
+
+# Нет значения в целочисленной колонке (комнаты, месяц, этаж, год)
+MISSING = -1
+
+
+class MarketTrends:
+    def __init__(self):
+        self._columns = _empty_columns()
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids = np.zeros(0, dtype=np.int64)
+        # id объявления -> строка в колонках
+        self._rows = {}
+        # Объявления, еще не дописанные в колонки: id -> значения в порядке _COLUMN_NAMES
+        self._pending = {}
+        # Справочники районов и типов: значение -> код
+        self._codes = {DISTRICT: {}, TYPE: {}}
+        self._results = {}
+        # Растет при каждом изменении снимка
+        self.version = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # События, пришедшие во время полного перечитывания
+        self._replay = None
+
+    def register(self, bus):
+        """Подписывает снимок на события объявлений"""
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+        bus.subscribe(PROPERTY_PRICE_CHANGED, self.on_property_price_changed)
+
+    def __len__(self):
+        return int(self._alive.sum()) + len(self._pending)
+
+    # ========== ЗАГРУЗКА ==========
+
+    async def load(self):
+        """Перечитывает все активные объявления"""
+        self._replay = []
+        try:
+            async with ReadSession() as session:
+                rows = (await session.execute(
+                    select(Property.id, Property.price_uzs, Property.area, Property.rooms,
+                           Property.district, Property.property_type, Property.created_at,
+                           Property.floor, Property.year_built)
+                    .where(Property.status == 'active')
+                )).all()
+
+            self._codes = {DISTRICT: {}, TYPE: {}}
+            self._pending = {row.id: self._make_row(row) for row in rows}
+            self._columns = _empty_columns()
+            self._alive = np.zeros(0, dtype=bool)
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._rows = {}
+            self._changed()
+            self._materialize()
+            self._loaded = True
+
+            # Изменения во время чтения новее прочитанного снимка
+            for handler, args in self._replay:
+                handler(*args)
+        finally:
+            self._replay = None
+
+        logger.info(f"Market trends snapshot loaded: {len(self)} listings")
+        return len(self)
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.load()
+
+    # ========== ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ==========
+
+    async def on_property_created(self, property):
+        if property.status == 'active':
+            self._apply(self._add, property)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        if new_status == 'active':
+            self._apply(self._add, property)
+        elif old_status == 'active':
+            self._apply(self._remove, property.id)
+
+    async def on_property_price_changed(self, property, old_price, new_price):
+        self._apply(self._set_price, property.id, new_price)
+
+    def _apply(self, handler, *args):
+        if self._replay is not None:
+            self._replay.append((handler, args))
+        handler(*args)
+
+    def _add(self, property):
+        row = self._make_row(property)
+        position = self._rows.get(property.id)
+        if position is None:
+            self._pending[property.id] = row
+            self._changed()
+            return
+
+        for name, value in zip(_COLUMN_NAMES, row):
+            self._columns[name][position] = value
+        self._alive[position] = True
+        self._changed()
+
+    def _remove(self, property_id: int):
+        self._pending.pop(property_id, None)
+        position = self._rows.get(property_id)
+        if position is not None:
+            self._alive[position] = False
+        self._changed()
+
+    def _set_price(self, property_id: int, price):
+        price = np.nan if price is None else float(price)
+        if property_id in self._pending:
+            self._pending[property_id] = (price,) + self._pending[property_id][1:]
+        elif property_id in self._rows:
+            self._columns[PRICE][self._rows[property_id]] = price
+        else:
+            return
+        self._changed()
+
+    def _changed(self):
+        self._results.clear()
+        self.version += 1
+
+    def _make_row(self, property):
+        created_at = property.created_at
+        return (
+            np.nan if property.price_uzs is None else float(property.price_uzs),
+            np.nan if not property.area else float(property.area),
+            MISSING if property.rooms is None else int(property.rooms),
+            self._code(DISTRICT, property.district),
+            self._code(TYPE, property.property_type),
+            created_at.year * 12 + created_at.month - 1 if created_at else MISSING,
+            MISSING if property.floor is None else int(property.floor),
+            MISSING if property.year_built is None else int(property.year_built),
+        )
+
+    def _code(self, column: str, value) -> int:
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(codes)
+        return codes[value]
+
+    def _materialize(self):
+        """Дописывает буфер в колонки и выбрасывает удаленные строки"""
+        dead = len(self._alive) - int(self._alive.sum())
+        if not self._pending and dead * 2 <= len(self._alive):
+            return
+
+        if dead * 2 > len(self._alive):
+            keep = self._alive
+            self._columns = {name: values[keep] for name, values in self._columns.items()}
+            self._ids = self._ids[keep]
+            self._alive = np.ones(len(self._ids), dtype=bool)
+            self._rows = {property_id: position for position, property_id in enumerate(self._ids.tolist())}
+
+        if self._pending:
+            offset = len(self._ids)
+            added = list(zip(*self._pending.values()))
+            for name, values in zip(_COLUMN_NAMES, added):
+                self._columns[name] = np.concatenate([self._columns[name], np.array(values, dtype=_DTYPES[name])])
+            self._ids = np.concatenate([self._ids, np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))])
+            self._alive = np.concatenate([self._alive, np.ones(len(self._pending), dtype=bool)])
+            self._rows.update((property_id, offset + index) for index, property_id in enumerate(self._pending))
+            self._pending = {}
+
+    # ========== ЧТЕНИЕ ==========
+
+    async def columns(self):
+        """Колонки активных объявлений и справочники кодов районов и типов (код -> значение)"""
+        await self._ensure_loaded()
+        self._materialize()
+        columns = {name: values[self._alive] for name, values in self._columns.items()}
+        return columns, {column: _names(codes) for column, codes in self._codes.items()}
+
+    async def get_trends(self, district=None, property_type=None, rooms=None):
+        """Статистика по месяцам для объявлений с заданным районом, типом и числом комнат"""
+        await self._ensure_loaded()
+        key = ('trends', district, property_type, rooms)
+        if key not in self._results:
+            self._materialize()
+            mask = self._alive.copy()
+            for column, value in ((DISTRICT, district), (TYPE, property_type)):
+                if value is not None:
+                    code = self._codes[column].get(value)
+                    mask &= self._columns[column] == (-2 if code is None else code)
+            if rooms is not None:
+                mask &= self._columns[ROOMS] == rooms
+
+            self._results[key] = [
+                {'period': _period(month), **stats}
+                for (month,), stats in self._aggregate(mask, (MONTH,))
+            ]
+        return self._results[key]
+
+    async def get_segments(self):
+        """Статистика по месяцам для каждой пары район/тип одним проходом"""
+        await self._ensure_loaded()
+        key = ('segments',)
+        if key not in self._results:
+            self._materialize()
+            districts = _names(self._codes[DISTRICT])
+            types = _names(self._codes[TYPE])
+            self._results[key] = [
+                {'district': districts[district], 'property_type': types[property_type],
+                 'period': _period(month), **stats}
+                for (district, property_type, month), stats in self._aggregate(self._alive, (DISTRICT, TYPE, MONTH))
+            ]
+        return self._results[key]
+
+    def _aggregate(self, mask, group_columns):
+        """Группирует выбранные строки по колонкам и считает статистику каждой группы"""
+        if not mask.any():
+            return []
+
+        # Составной ключ группы: колонки сдвинуты к нулю и упакованы в одно число
+        groups = [self._columns[name][mask].astype(np.int64) for name in group_columns]
+        lows = [int(values.min()) for values in groups]
+        sizes = [int(values.max()) - low + 1 for values, low in zip(groups, lows)]
+        key = np.ravel_multi_index([values - low for values, low in zip(groups, lows)], sizes)
+        if key.max() < 2 ** 15:
+            # Для коротких целых устойчивая сортировка - поразрядная
+            key = key.astype(np.int16)
+
+        price = self._columns[PRICE][mask]
+        area = self._columns[AREA][mask]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_per_m2 = np.where(area > 0, price / area, np.nan)
+
+        order = _group_order(key, price)
+        sorted_key = key[order]
+        changed = np.empty(len(order), dtype=bool)
+        changed[0] = True
+        changed[1:] = sorted_key[1:] != sorted_key[:-1]
+        starts = np.flatnonzero(changed)
+        counts = np.diff(np.append(starts, len(order)))
+
+        sorted_price = price[order]
+        priced = np.add.reduceat((~np.isnan(sorted_price)).astype(np.int64), starts)
+        price_sum = np.add.reduceat(np.nan_to_num(sorted_price), starts)
+
+        # Цена за м² сортируется отдельно; границы групп те же, т.к. ключ тот же
+        sorted_per_m2 = price_per_m2[_group_order(key, price_per_m2)]
+        with_area = np.add.reduceat((~np.isnan(sorted_per_m2)).astype(np.int64), starts)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats = {
+                'count': counts,
+                'avg_price': np.where(priced > 0, price_sum / np.maximum(priced, 1), np.nan),
+                'median_price': _quantile(sorted_price, starts, priced, 0.5),
+                'p25_price': _quantile(sorted_price, starts, priced, 0.25),
+                'p75_price': _quantile(sorted_price, starts, priced, 0.75),
+                'price_per_m2': _quantile(sorted_per_m2, starts, with_area, 0.5),
+            }
+
+        keys = zip(*(
+            (values + low).tolist() for values, low in zip(np.unravel_index(sorted_key[starts], sizes), lows)
+        ))
+        columns = {name: values.tolist() for name, values in stats.items()}
+        return [
+            (key, {name: _clean(columns[name][index]) for name in columns})
+            for index, key in enumerate(keys)
+        ]
+
+
+def _group_order(key, values):
+    """Порядок строк по группе, внутри группы по значению (NaN в конце)"""
+    order = np.argsort(values)
+    return order[np.argsort(key[order], kind='stable')]
+
+
+def _quantile(sorted_values, starts, valid, q: float):
+    """Квантиль (линейная интерполяция, как np.percentile) внутри каждой группы.
+
+    Значения групп отсортированы, NaN - в конце группы; valid - число не-NaN.
+    """
+    position = np.maximum(valid - 1, 0) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    fraction = position - low
+    low_values = sorted_values[starts + low]
+    high_values = sorted_values[starts + high]
+    return np.where(valid > 0, low_values + (high_values - low_values) * fraction, np.nan)
+
+
+def _clean(value):
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _period(month: int) -> str:
+    if month == MISSING:
+        return None
+    return f"{month % 12 + 1}/{month // 12}"
+
+
+def _names(codes: dict) -> list:
+    names = [None] * len(codes)
+    for value, code in codes.items():
+        names[code] = value
+    return names
+
+
+_COLUMN_NAMES = (PRICE, AREA, ROOMS, DISTRICT, TYPE, MONTH, FLOOR, YEAR_BUILT)
+_DTYPES = {
+    PRICE: np.float64,
+    AREA: np.float64,
+    ROOMS: np.int32,
+    DISTRICT: np.int32,
+    TYPE: np.int32,
+    MONTH: np.int32,
+    FLOOR: np.int32,
+    YEAR_BUILT: np.int32,
+}
+
+
+def _empty_columns():
+    return {name: np.zeros(0, dtype=_DTYPES[name]) for name in _COLUMN_NAMES}
+
+
+market_trends = MarketTrends()
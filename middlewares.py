@@ -0,0 +1,279 @@
+"""Middleware диспетчера.
+
+ThrottlingMiddleware - ограничение частоты действий пользователя. Действие
+берется из флага обработчика (flags={'rate_limit': 'search'}), иначе из группы
+текущего состояния FSM (поиск, заполнение объявления), иначе из типа события.
+Превысившему лимит раз в период отвечаем предупреждением, обновление отбрасываем.
+
+UpdateScheduler - планировщик обновлений (внешний middleware dp.update).
+Обновления одного пользователя выполняются строго по очереди, разных -
+параллельно, но не более чем в SCHEDULER_CONCURRENCY слотах. Свободный слот
+получает ожидающий с наивысшим приоритетом: действия администраторов, затем
+оплата, затем обычные, затем малоценные (пагинация, правки сообщений). Когда
+ожидающих больше SCHEDULER_SHED_THRESHOLD, малоценные обновления отбрасываются;
+повтор уже ожидающего малоценного нажатия отбрасывается всегда.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, types
+from aiogram.dispatcher.flags import get_flag
+
+from config import ADMIN_IDS, SCHEDULER_CONCURRENCY, SCHEDULER_SHED_THRESHOLD
+from locales import get_text
+from pagination import CURSOR_CALLBACK_RE
+from rate_limiter import user_limiter
+
+logger = logging.getLogger(__name__)
+
+# Группа состояний FSM -> действие для лимита
+STATE_ACTIONS = {
+    'SearchStates': 'search',
+    'PropertyStates': 'property',
+}
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, limiter=user_limiter, exempt_ids=ADMIN_IDS):
+        self.limiter = limiter
+        self.exempt_ids = set(exempt_ids)
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or user.id in self.exempt_ids:
+            return await handler(event, data)
+
+        action = self.resolve_action(event, data)
+        if self.limiter.check(user.id, action):
+            return await handler(event, data)
+
+        logger.info(f"User {user.id} throttled on {action}")
+        await self.warn(event, user, action)
+        return None
+
+    @staticmethod
+    def resolve_action(event: types.TelegramObject, data: Dict[str, Any]) -> str:
+        """Определяет действие, по которому считается лимит"""
+        action = get_flag(data, 'rate_limit')
+        if action:
+            return action
+
+        raw_state = data.get('raw_state')
+        if raw_state:
+            group = raw_state.split(':', 1)[0]
+            if group in STATE_ACTIONS:
+                return STATE_ACTIONS[group]
+
+        if isinstance(event, types.CallbackQuery):
+            return 'callback'
+        return 'message'
+
+    async def warn(self, event: types.TelegramObject, user: types.User, action: str):
+        """Предупреждает о превышении лимита не чаще раза за период 'notice'.
+
+        На нажатие кнопки отвечает всегда (без текста, если предупреждать
+        рано), иначе у кнопки не пропадает индикатор загрузки.
+        """
+        text = None
+        if self.limiter.check(user.id, 'notice'):
+            language = user.language_code if user.language_code in ('ru', 'uz', 'en') else 'ru'
+            seconds = max(1, round(self.limiter.retry_after(user.id, action)))
+            text = get_text('too_many_requests', language, seconds=seconds)
+
+        try:
+            if isinstance(event, types.CallbackQuery):
+                await event.answer(text, show_alert=False)
+            elif isinstance(event, types.Message) and text:
+                await event.answer(text)
+        except Exception as e:
+            logger.warning(f"Failed to warn throttled user {user.id}: {e}")
+
+
+# ========== ПЛАНИРОВЩИК ОБНОВЛЕНИЙ ==========
+
+PRIORITY_ADMIN = 0
+PRIORITY_PAYMENT = 1
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3
+
+# Префикс callback_data -> приоритет
+CALLBACK_PRIORITIES = (
+    ('admin_', PRIORITY_ADMIN),
+    ('approve_contact_', PRIORITY_ADMIN),
+    ('reject_contact_', PRIORITY_ADMIN),
+    ('subscription_', PRIORITY_PAYMENT),
+    ('confirm_', PRIORITY_PAYMENT),
+)
+
+# Группа состояний FSM -> приоритет
+STATE_PRIORITIES = {
+    'AdminStates': PRIORITY_ADMIN,
+    'SubscriptionStates': PRIORITY_PAYMENT,
+}
+
+
+class PrioritySlots:
+    """Семафор, отдающий освободившийся слот ожидающему с наименьшим приоритетом"""
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот успели отдать, но задачу отменили - передаем его дальше
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class UpdateScheduler(BaseMiddleware):
+    def __init__(self, concurrency: int = SCHEDULER_CONCURRENCY,
+                 shed_threshold: int = SCHEDULER_SHED_THRESHOLD, admin_ids=ADMIN_IDS):
+        self.slots = PrioritySlots(concurrency)
+        self.shed_threshold = shed_threshold
+        self.admin_ids = set(admin_ids)
+        # user_id -> [Lock, число обновлений пользователя в работе]
+        self._user_locks = {}
+        # (user_id, callback_data) малоценных нажатий, ожидающих выполнения
+        self._pending_low = set()
+        self.waiting = 0
+        self.stats = {'processed': 0, 'shed': 0, 'duplicates': 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        user_id = user.id if user else None
+        priority = self.resolve_priority(event, data)
+
+        low_key = None
+        if priority == PRIORITY_LOW:
+            if self.waiting >= self.shed_threshold:
+                self.stats['shed'] += 1
+                await self.answer_dropped(event)
+                return None
+            if event.callback_query is not None:
+                low_key = (user_id, event.callback_query.data)
+                if low_key in self._pending_low:
+                    self.stats['duplicates'] += 1
+                    await self.answer_dropped(event)
+                    return None
+                self._pending_low.add(low_key)
+
+        self.waiting += 1
+        started = False
+        try:
+            async with self._user_lock(user_id):
+                await self.slots.acquire(priority)
+                started = True
+                self.waiting -= 1
+                self._pending_low.discard(low_key)
+                try:
+                    # Состояние FSM прочитано до ожидания: предыдущие обновления пользователя могли его сменить
+                    if 'state' in data:
+                        data['raw_state'] = await data['state'].get_state()
+                    result = await handler(event, data)
+                    self.stats['processed'] += 1
+                    return result
+                finally:
+                    self.slots.release()
+        finally:
+            if not started:
+                self.waiting -= 1
+            self._pending_low.discard(low_key)
+            self._release_user_lock(user_id)
+
+    @staticmethod
+    async def answer_dropped(event: types.Update):
+        """Отвечает на отброшенное нажатие, чтобы у кнопки пропал индикатор загрузки"""
+        if event.callback_query is None:
+            return
+        try:
+            await event.callback_query.answer()
+        except Exception as e:
+            logger.warning(f"Failed to answer dropped callback {event.callback_query.id}: {e}")
+
+    def resolve_priority(self, event: types.Update, data: Dict[str, Any]) -> int:
+        """Приоритет обновления: админ, оплата, обычное или малоценное"""
+        user = data.get('event_from_user')
+        if user is not None and user.id in self.admin_ids:
+            return PRIORITY_ADMIN
+
+        if event.pre_checkout_query is not None or (
+            event.message is not None and event.message.successful_payment is not None
+        ):
+            return PRIORITY_PAYMENT
+
+        raw_state = data.get('raw_state')
+        if raw_state:
+            group = raw_state.split(':', 1)[0]
+            if group in STATE_PRIORITIES:
+                return STATE_PRIORITIES[group]
+
+        if event.callback_query is not None and event.callback_query.data:
+            callback_data = event.callback_query.data
+            for prefix, priority in CALLBACK_PRIORITIES:
+                if callback_data.startswith(prefix):
+                    return priority
+            if CURSOR_CALLBACK_RE.match(callback_data):
+                return PRIORITY_LOW
+
+        if event.edited_message is not None:
+            return PRIORITY_LOW
+
+        return PRIORITY_NORMAL
+
+    def _user_lock(self, user_id):
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            # Обновления без пользователя (каналы, опросы) не упорядочиваем
+            entry = self._user_locks[user_id] = [asyncio.Lock() if user_id is not None else _NoLock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_user_lock(self, user_id):
+        entry = self._user_locks[user_id]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._user_locks[user_id]
+
+
+class _NoLock:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
@@ -0,0 +1,264 @@
+"""Версионированные миграции схемы БД.
+
+Каждая миграция — функция над синхронным соединением, зарегистрированная
+декоратором @migration с возрастающим номером версии. Номера примененных
+миграций хранятся в таблице schema_version; run_migrations() применяет
+недостающие по порядку, каждую в своей транзакции.
+
+Миграции должны быть идемпотентными: базовая миграция создает схему по
+текущим моделям, поэтому более поздние шаги используют add_column() и
+create_indexes(), которые пропускают уже существующие объекты.
+"""
+import json
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from database import (
+    Base, BroadcastJob, NotificationOutbox, FSMState, DailyStat, PropertyFingerprint, Photo, PropertyPhoto, Chat
+)
+from config import MAX_PROPERTY_PHOTOS
+from fulltext import index_text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    """Регистрирует миграцию схемы"""
+    def decorator(func):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version: {version}")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return decorator
+
+
+# ========== ХЕЛПЕРЫ ==========
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """Добавляет колонку, если ее еще нет (ALTER TABLE ... ADD COLUMN)"""
+    columns = {info['name'] for info in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def create_tables(conn, *models):
+    """Создает таблицы моделей вместе с их индексами, если их еще нет"""
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def create_indexes(conn, *models):
+    """Создает объявленные в моделях индексы, которых еще нет в БД"""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# ========== МИГРАЦИИ ==========
+
+@migration(1, "Базовая схема")
+def initial_schema(conn):
+    Base.metadata.create_all(conn, checkfirst=True)
+
+
+@migration(2, "Индексы горячих таблиц")
+def hot_table_indexes(conn):
+    # Для баз, созданных до появления индексов: create_all пропускает существующие таблицы
+    create_indexes(conn, *[mapper.class_ for mapper in Base.registry.mappers])
+
+
+
+@migration(3, "Задания рассылок")
+def broadcast_jobs(conn):
+    create_tables(conn, BroadcastJob)
+
+
+
+@migration(4, "Outbox уведомлений")
+def notification_outbox(conn):
+    create_tables(conn, NotificationOutbox)
+
+
+@migration(5, "Хранилище состояний FSM")
+def fsm_states(conn):
+    create_tables(conn, FSMState)
+
+
+@migration(6, "Дневные сводки статистики")
+def daily_stats(conn):
+    create_tables(conn, DailyStat)
+
+
+@migration(7, "Отпечатки объявлений для поиска дубликатов")
+def property_fingerprints(conn):
+    create_tables(conn, PropertyFingerprint)
+
+
+def _legacy_file_ids(value: str):
+    """file_id из старой текстовой колонки photos: JSON-список или через запятую/пробел"""
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, list):
+        return [str(item) for item in parsed if item]
+    return [item for item in re.split(r'[\s,;]+', value) if item]
+
+
+@migration(8, "Фото объявлений в отдельных таблицах")
+def property_photos(conn):
+    create_tables(conn, Photo, PropertyPhoto)
+
+    rows = conn.execute(text(
+        "SELECT id, photos FROM properties WHERE photos IS NOT NULL AND photos != ''"
+    )).all()
+    photos, links, flags = [], [], []
+    for property_id, value in rows:
+        # file_unique_id старых фото неизвестен: ключом служит сам file_id
+        file_ids = list(dict.fromkeys(_legacy_file_ids(value)))[:MAX_PROPERTY_PHOTOS]
+        for position, file_id in enumerate(file_ids):
+            photos.append({'u': file_id, 'f': file_id, 't': datetime.now()})
+            links.append({'p': property_id, 'n': position, 'u': file_id})
+        flags.append({'has': bool(file_ids), 'id': property_id})
+
+    if photos:
+        conn.execute(text('INSERT OR IGNORE INTO photos (file_unique_id, file_id, created_at) VALUES (:u, :f, :t)'),
+                     photos)
+        conn.execute(text('INSERT OR IGNORE INTO property_photos (property_id, position, file_unique_id) '
+                          'VALUES (:p, :n, :u)'), links)
+    if flags:
+        conn.execute(text('UPDATE properties SET photos = NULL, has_photos = :has WHERE id = :id'), flags)
+    if rows:
+        logger.info(f"Moved photos of {len(rows)} properties to property_photos")
+
+
+@migration(9, "Индексы курсорной пагинации чатов")
+def chat_pagination_indexes(conn):
+    create_indexes(conn, Chat)
+
+
+@migration(10, "Полнотекстовый индекс объявлений (FTS5)")
+def property_fulltext(conn):
+    # Триггеры и заполнение индекса - в миграции 13
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS property_fts USING fts5("
+        "description, address, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+
+
+@migration(11, "Координаты объявлений")
+def property_coordinates(conn):
+    add_column(conn, 'properties', 'latitude', 'FLOAT')
+    add_column(conn, 'properties', 'longitude', 'FLOAT')
+
+
+@migration(12, "Индекс очереди уведомлений по чатам")
+def outbox_chat_index(conn):
+    create_indexes(conn, NotificationOutbox)
+
+
+@migration(13, "Нормализованный текст объявлений для FTS5")
+def property_search_text(conn, batch_size: int = 1000):
+    # Текст нормализуется в Python при записи (колонки search_*), триггеры только
+    # копируют его: SQL-функции, которая есть не на всех соединениях, они не вызывают.
+    # Строки, записанные в обход приложения с search_* = NULL, индексируются как есть
+    # (при правке описания вне приложения search_* нужно обнулить)
+    for trigger in ('properties_fts_insert', 'properties_fts_update', 'properties_fts_delete'):
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    add_column(conn, 'properties', 'search_description', 'TEXT')
+    add_column(conn, 'properties', 'search_address', 'TEXT')
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text('SELECT id, description, address FROM properties WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': batch_size}
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            text('UPDATE properties SET search_description = :description, search_address = :address WHERE id = :id'),
+            [{'id': row.id, 'description': index_text(row.description), 'address': index_text(row.address)}
+             for row in rows]
+        )
+        last_id = rows[-1].id
+
+    conn.execute(text("DELETE FROM property_fts"))
+    conn.execute(text(
+        "INSERT INTO property_fts (rowid, description, address) "
+        "SELECT id, coalesce(search_description, description), coalesce(search_address, address) FROM properties"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER properties_fts_insert AFTER INSERT ON properties BEGIN "
+        "INSERT INTO property_fts (rowid, description, address) VALUES "
+        "(new.id, coalesce(new.search_description, new.description), coalesce(new.search_address, new.address)); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER properties_fts_update "
+        "AFTER UPDATE OF description, address, search_description, search_address ON properties BEGIN "
+        "DELETE FROM property_fts WHERE rowid = old.id; "
+        "INSERT INTO property_fts (rowid, description, address) VALUES "
+        "(new.id, coalesce(new.search_description, new.description), coalesce(new.search_address, new.address)); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER properties_fts_delete AFTER DELETE ON properties BEGIN "
+        "DELETE FROM property_fts WHERE rowid = old.id; "
+        "END"
+    ))
+
+
+# ========== ЗАПУСК ==========
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, '
+        'description VARCHAR(200), '
+        'applied_at DATETIME)'
+    ))
+
+
+def _applied_versions(conn):
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+
+def _apply(conn, version: int, description: str, func):
+    func(conn)
+    conn.execute(
+        text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+        {'v': version, 'd': description, 't': datetime.now()}
+    )
+
+
+async def run_migrations(engine):
+    """Применяет недостающие миграции по порядку, возвращает список примененных версий"""
+    async with engine.begin() as conn:
+        await conn.run_sync(_ensure_version_table)
+        applied = await conn.run_sync(_applied_versions)
+
+    done = []
+    for version, description, func in MIGRATIONS:
+        if version in applied:
+            continue
+        async with engine.begin() as conn:
+            await conn.run_sync(_apply, version, description, func)
+        logger.info(f"Applied migration {version}: {description}")
+        done.append(version)
+
+    return done
+
+
+async def current_version(engine) -> int:
+    """Текущая версия схемы (0 для пустой БД)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(_ensure_version_table)
+        result = await conn.execute(text('SELECT MAX(version) FROM schema_version'))
+        return result.scalar() or 0
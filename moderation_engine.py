@@ -0,0 +1,170 @@
+"""Движок текстовой модерации объявлений.
+
+Все словарные правила (ru, uz латиница и кириллица, en) собраны в одно
+регулярное выражение по префиксному дереву шаблонов (в духе автомата
+Ахо-Корасик), скомпилированное один раз при импорте: описание
+просматривается за один проход, а не по разу на каждое правило.
+Телефоны ищутся заранее скомпилированным регулярным выражением.
+
+Шаблоны из букв совпадают только с целыми словами, шаблон со '*' на конце -
+с началом слова. Штраф категории - вес за каждое разное совпадение, но не
+больше максимума (MODERATION_WEIGHTS). Пачку описаний (check_many)
+выражение просматривает одним проходом по склеенному тексту.
+"""
+import bisect
+import re
+from collections import defaultdict
+
+from config import MODERATION_WEIGHTS
+
+# Апострофы узбекской латиницы приводятся к одному виду
+_REPLACEMENTS = (('ʻ', "'"), ('ʼ', "'"), ('‘', "'"), ('’', "'"), ('`', "'"), ('ё', 'е'))
+
+# Номер телефона: 10+ символов из цифр и разделителей. Необязательный '+' или '(' перед
+# номером не влияет на то, найдется ли он, а без него re быстрее пропускает позиции
+PHONE_RE = re.compile(r'[1-9][0-9 .\-\(\)]{8,}[0-9]')
+
+# Категория -> шаблоны. Шаблоны в нижнем регистре; '*' в конце - совпадение по началу слова
+RULES = {
+    'spam': [
+        # ru
+        'купить', 'продать', 'срочно', 'недорого', 'дешево', 'выгодно', 'акция', 'скидка',
+        'успейте', 'лучшая цена', 'спешите',
+        # uz
+        'shoshilinch', 'arzon', 'chegirma', 'aksiya', 'tez soting', 'eng yaxshi narx',
+        'шошилинч', 'арзон', 'чегирма',
+        # en
+        'urgent', 'cheap', 'discount', 'best price', 'hurry', 'limited offer',
+    ],
+    'contact': [
+        'whatsapp', 'вотсап', 'ватсап', 'viber', 'вайбер', 'telegram', 'телеграм*', 'телега',
+        'звоните', 'позвоните', 'пишите в личку', 'в лс',
+        "qo'ng'iroq*", "qo'ng'iroq qiling", 'yozing', 'қўнғироқ*',
+        'call me', 'dm me', 'text me',
+    ],
+    'link': [
+        'http://', 'https://', 'www.', 't.me/', 'wa.me/', 'instagram.com', '.uz/', '.com/', '.ru/',
+    ],
+    'scam': [
+        'предоплата', 'предоплату', 'без документов', 'переведите', 'залог вперед', 'на карту',
+        "oldindan to'lov", 'hujjatsiz', 'oldindan pul', 'kartaga',
+        'олдиндан тўлов', 'ҳужжатсиз',
+        'prepayment', 'advance payment', 'no documents', 'wire transfer', 'western union',
+    ],
+}
+
+
+def _trie_pattern(words) -> str:
+    """Регулярное выражение из префиксного дерева шаблонов.
+
+    Общие префиксы сливаются в одну ветку (ку(?:пить|...)), поэтому движок re
+    в каждой позиции проходит дерево, как автомат Ахо-Корасик, а не
+    перебирает шаблоны по одному. Лист дерева - проверка конца слова.
+    """
+    trie = {}
+    for word, whole in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # '' - конец шаблона; для целого слова после него не должно быть буквы
+        node[''] = r'(?!\w)' if whole else ''
+
+    def emit(node):
+        branches = []
+        end = None
+        for char, child in sorted(node.items()):
+            if char == '':
+                end = child
+            else:
+                branches.append(re.escape(char) + emit(child))
+        if end is not None:
+            # Сначала более длинные продолжения, затем сам шаблон
+            branches.append(end)
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return emit(trie)
+
+
+class ModerationEngine:
+    def __init__(self, rules=RULES, weights=MODERATION_WEIGHTS):
+        self.weights = weights
+        # шаблон -> категория
+        self.categories = {}
+        words = ([], [])
+        for category, patterns in rules.items():
+            for pattern in patterns:
+                prefix = pattern.endswith('*')
+                word = self.normalize(pattern.rstrip('*'))
+                self.categories[word] = category
+                whole = not prefix and word[-1].isalnum()
+                # Шаблоны, начинающиеся с буквы, ищутся только с начала слова
+                words[word[0].isalnum()].append((word, whole))
+
+        # Проверка начала слова идет первой: большинство позиций отсекается на ней
+        pattern = r'(?<!\w)' + _trie_pattern(words[True])
+        if words[False]:
+            pattern += '|' + _trie_pattern(words[False])
+        self.matcher = re.compile(pattern)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # str.replace быстрее str.translate на не-ASCII тексте
+        text = text.lower()
+        for old, new in _REPLACEMENTS:
+            if old in text:
+                text = text.replace(old, new)
+        return text
+
+    def scan(self, normalized: str):
+        """(начало, категория, шаблон) для каждого совпадения правил в нормализованном тексте"""
+        for match in self.matcher.finditer(normalized):
+            word = match.group()
+            yield match.start(), self.categories[word], word
+
+        for match in PHONE_RE.finditer(normalized):
+            yield match.start(), 'contact', 'phone'
+
+    def find(self, text: str) -> dict:
+        """Категория -> множество найденных шаблонов"""
+        hits = defaultdict(set)
+        for _, category, word in self.scan(self.normalize(text or '')):
+            hits[category].add(word)
+        return hits
+
+    def penalty(self, hits: dict) -> int:
+        """Суммарный штраф по найденным совпадениям"""
+        total = 0
+        for category, words in hits.items():
+            if words and category in self.weights:
+                weight, cap = self.weights[category]
+                total += min(weight * len(words), cap)
+        return total
+
+    def check_text(self, text: str):
+        """(штраф, совпадения) для текста"""
+        hits = self.find(text)
+        return self.penalty(hits), hits
+
+    def check_many(self, texts):
+        """Проверка пачки текстов за один проход: [(штраф, совпадения)]
+
+        Тексты склеиваются через '\\0' (не буква и не встречается в шаблонах),
+        совпадение относится к тексту по смещению его начала.
+        """
+        # Нормализуем по отдельности: lower() может менять длину, смещения считаются по результату
+        texts = [self.normalize(text or '') for text in texts]
+        offsets = []
+        position = 0
+        for text in texts:
+            offsets.append(position)
+            position += len(text) + 1
+
+        hits = [defaultdict(set) for _ in texts]
+        for start, category, word in self.scan('\0'.join(texts)):
+            hits[bisect.bisect_right(offsets, start) - 1][category].add(word)
+        return [(self.penalty(text_hits), text_hits) for text_hits in hits]
+
+
+moderation_engine = ModerationEngine()
@@ -1,85 +1,128 @@
-import re
-from database import Session, Property, User
+import logging
+from sqlalchemy import select, func
+from config import MODERATION_BATCH_SIZE, MODERATION_PASS_SCORE
+from database import ReadSession, Property, User, to_dict
+from duplicate_index import duplicate_index
+from events import bus, PROPERTY_STATUS_CHANGED
+from moderation_engine import moderation_engine
+from pagination import PAGE_SIZE, keyset_page
+from property_service import PropertyService
+from price_estimator import price_estimator
+from write_queue import run_write
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 class ModerationService:
     @staticmethod
-    def auto_moderate_property(property_data):
+    async def auto_moderate_property(property_data):
         """Автоматическая модерация объявления"""
-        score = 100  # Начальный score
-        
-        # Проверка описания
-        if property_data.get('description'):
-            description = property_data['description'].lower()
-            
-            # Проверка на спам
-            spam_keywords = ['купить', 'продать', 'срочно', 'недорого']
-            spam_count = sum(1 for keyword in spam_keywords if keyword in description)
-            if spam_count > 3:
-                score -= 20
-            
-            # Проверка на контактные данные в описании
-            phone_pattern = r'[\+\(]?[1-9][0-9 .\-\(\)]{8,}[0-9]'
-            if re.search(phone_pattern, property_data['description']):
-                score -= 15
-        
-        # Проверка цены
-        if property_data.get('price_uzs'):
-            avg_prices = {
-                'apartment': 200000000,  # Средняя цена квартиры
-                'house': 500000000,      # Средняя цена дома
-                'commercial': 300000000  # Средняя цена коммерции
-            }
-            
-            property_type = property_data.get('property_type')
-            if property_type in avg_prices:
-                avg_price = avg_prices[property_type]
-                user_price = property_data['price_uzs']
-                
-                # Если цена отличается более чем на 70% от средней
-                if user_price < avg_price * 0.3 or user_price > avg_price * 1.7:
-                    score -= 25
-        
-        return score >= 70  # Проходит модерацию если score >= 70
+        passed, _, _ = (await ModerationService.moderate_batch([property_data]))[0]
+        return passed
+
+    @staticmethod
+    async def moderate_batch(listings):
+        """Модерация пачки объявлений (словарей полей): [(прошло, балл, причины)]
+
+        Описания проверяются одним проходом движка правил, цены - сравнением
+        со справедливой ценой по аналогам, повторы - по индексу дубликатов.
+        """
+        checks = moderation_engine.check_many([listing.get('description') for listing in listings])
+
+        results = []
+        for listing, (_, hits) in zip(listings, checks):
+            if await ModerationService.has_outlier_price(listing):
+                hits['price_outlier'].add('price')
+            if duplicate_index.find_duplicates(listing):
+                hits['duplicate'].add('duplicate')
+            score = 100 - moderation_engine.penalty(hits)
+            reasons = sorted(category for category, words in hits.items() if words)
+            results.append((score >= MODERATION_PASS_SCORE, score, reasons))
+        return results
+
+    @staticmethod
+    async def has_outlier_price(listing):
+        """Цена далеко от оценки по аналогам (без аналогов проверка не проводится)"""
+        if not listing.get('price_uzs') or not listing.get('property_type'):
+            return False
+        estimate = await price_estimator.estimate(
+            listing['property_type'],
+            district=listing.get('district'),
+            rooms=listing.get('rooms'),
+            area=listing.get('area'),
+            floor=listing.get('floor'),
+            year_built=listing.get('year_built')
+        )
+        return bool(estimate) and ModerationService.is_price_outlier(listing['price_uzs'], estimate)
+
+    @staticmethod
+    async def moderate_pending(limit=MODERATION_BATCH_SIZE):
+        """Проверяет объявления в статусе pending: прошедшие публикуются, остальные
+        помечаются как подозрительные. Возвращает (опубликовано, отклонено)"""
+        async with ReadSession() as session:
+            pending = (await session.scalars(
+                select(Property).where(Property.status == 'pending').order_by(Property.id).limit(limit)
+            )).all()
+        if not pending:
+            return 0, 0
+
+        results = await ModerationService.moderate_batch([to_dict(property_obj) for property_obj in pending])
+        decisions = {
+            property_obj.id: 'active' if passed else 'suspicious'
+            for property_obj, (passed, _, _) in zip(pending, results)
+        }
+
+        async def job(session):
+            # Объявление могли изменить, пока шла проверка - трогаем только оставшиеся в pending
+            changed = (await session.scalars(
+                select(Property).where(Property.id.in_(decisions), Property.status == 'pending')
+            )).all()
+            for property_obj in changed:
+                property_obj.status = decisions[property_obj.id]
+            return changed
+
+        changed = await run_write(job)
+        for property_obj in changed:
+            await bus.publish(PROPERTY_STATUS_CHANGED, property=property_obj, old_status='pending',
+                              new_status=property_obj.status)
+
+        approved = sum(1 for property_obj in changed if property_obj.status == 'active')
+        logger.info(f"Moderated {len(changed)} pending properties: {approved} approved")
+        return approved, len(changed) - approved
+
+    @staticmethod
+    async def get_queue(status: str = 'suspicious', cursor: str = None, limit: int = PAGE_SIZE):
+        """Очередь модерации для админов, новые первыми: (объявления, курсор следующей страницы)"""
+        return await keyset_page(select(Property).where(Property.status == status), [Property.id], cursor, limit)
+
+    @staticmethod
+    def is_price_outlier(price, estimate):
+        """Цена отличается от справедливой более чем на 70%"""
+        return price < estimate['price'] * 0.3 or price > estimate['price'] * 1.7
     
     @staticmethod
-    def check_user_behavior(user_id):
+    async def check_user_behavior(user_id):
         """Проверяет поведение пользователя на подозрительность"""
-        session = Session()
-        try:
-            user = session.query(User).filter(User.telegram_id == user_id).first()
+        async with ReadSession() as session:
+            user = await session.scalar(select(User).where(User.telegram_id == user_id))
             if not user:
                 return False
             
             # Проверяем количество объявлений за последние 24 часа
             yesterday = datetime.now() - timedelta(days=1)
-            recent_properties = session.query(Property).filter(
+            recent_properties = await session.scalar(select(func.count(Property.id)).where(
                 Property.user_id == user_id,
                 Property.created_at >= yesterday
-            ).count()
+            ))
             
             # Если больше 5 объявлений за день - подозрительно
             if recent_properties > 5:
                 return True
             
             return False
-            
-        finally:
-            session.close()
     
     @staticmethod
-    def flag_suspicious_property(property_id, reason):
+    async def flag_suspicious_property(property_id, reason):
         """Помечает объявление как подозрительное"""
-        session = Session()
-        try:
-            property_obj = session.query(Property).filter(Property.id == property_id).first()
-            if property_obj:
-                property_obj.status = 'suspicious'
-                session.commit()
-                return True
-            return False
-        except Exception as e:
-            session.rollback()
-            return False
-        finally:
-            session.close()
+        success, _ = await PropertyService.change_status(property_id, 'suspicious')
+        return success
@@ -1,106 +1,208 @@
 import asyncio
+import logging
 from datetime import datetime, timedelta
-from database import Session, User, Property, SavedSearch, Favorite
+from sqlalchemy import select, update
+from database import ReadSession, User, Property, SavedSearch, Favorite
 from aiogram import Bot
+from write_queue import run_write
+from outbox import enqueue, outbox, queue_message
 from utils import format_property_message
+from saved_search_index import SavedSearchIndex
+from events import PROPERTY_CREATED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED
 from locales import get_text
 
+logger = logging.getLogger(__name__)
+
 class NotificationService:
-    def _init_(self, bot: Bot):
+    def __init__(self, bot: Bot = None):
         self.bot = bot
-    
+        self.search_index = None
+
+    def register(self, bus):
+        """Подписывает сервис на события объявлений"""
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_PRICE_CHANGED, self.on_property_price_changed)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+
+    async def on_property_created(self, property):
+        if property.status == 'active':
+            await self.notify_new_property(property)
+
+    async def on_property_price_changed(self, property, old_price, new_price):
+        if old_price and new_price < old_price:
+            await self.send_price_drop_notification(property, old_price, new_price)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        # Объявление прошло модерацию или вернулось в продажу
+        if new_status == 'active':
+            await self.notify_new_property(property)
+
+    async def save_search(self, user_id, search_name, filters):
+        """Сохраняет поиск пользователя и добавляет его в индекс"""
+        async def job(session):
+            search = SavedSearch(
+                user_id=user_id,
+                search_name=search_name,
+                filters=filters,
+                last_notified=datetime.now()
+            )
+            session.add(search)
+            await session.flush()
+            return search
+
+        search = await run_write(job)
+        if self.search_index is not None:
+            self.search_index.add(search)
+        return search
+
+    async def delete_search(self, user_id, search_id):
+        """Отключает сохраненный поиск пользователя"""
+        async def job(session):
+            result = await session.execute(
+                update(SavedSearch).where(
+                    SavedSearch.id == search_id,
+                    SavedSearch.user_id == user_id
+                ).values(is_active=False)
+            )
+            return result.rowcount > 0
+
+        deleted = await run_write(job)
+        if deleted and self.search_index is not None:
+            self.search_index.remove(search_id)
+        return deleted
+
+    async def load_search_index(self):
+        """Загружает активные сохраненные поиски в индекс"""
+        async with ReadSession() as session:
+            saved_searches = (await session.scalars(
+                select(SavedSearch).where(SavedSearch.is_active == True)
+            )).all()
+
+        self.search_index = SavedSearchIndex.build(saved_searches)
+        return self.search_index
+
     async def check_saved_searches(self):
-        """Проверяет новые объявления для сохраненных поисков"""
-        session = Session()
-        try:
-            saved_searches = session.query(SavedSearch).filter(
-                SavedSearch.is_active == True
-            ).all()
-            
-            for search in saved_searches:
-                await self.check_search_matches(search)
-                
-        except Exception as e:
-            print(f"Error in saved searches: {e}")
-        finally:
-            session.close()
-    
-    async def check_search_matches(self, search):
-        """Проверяет совпадения для конкретного поиска"""
-        session = Session()
+        """Проверяет новые объявления для сохраненных поисков.
+
+        Полный проход нужен только при запуске, чтобы догнать объявления,
+        появившиеся пока бот был остановлен; дальше уведомления идут по событиям.
+        """
         try:
-            filters = search.filters or {}
-            last_notified = search.last_notified or datetime.now() - timedelta(days=30)
-            
-            query = session.query(Property).filter(
-                Property.status == 'active',
-                Property.created_at > last_notified
-            )
-            
-            # Применяем фильтры
-            if filters.get('property_type'):
-                query = query.filter(Property.property_type == filters['property_type'])
-            if filters.get('district') and filters['district'] != 'any':
-                query = query.filter(Property.district == filters['district'])
-            if filters.get('min_price'):
-                query = query.filter(Property.price_uzs >= filters['min_price'])
-            if filters.get('max_price'):
-                query = query.filter(Property.price_uzs <= filters['max_price'])
-            if filters.get('rooms'):
-                query = query.filter(Property.rooms == filters['rooms'])
-            
-            new_properties = query.order_by(Property.created_at.desc()).limit(10).all()
-            
+            index = await self.load_search_index()
+            if not len(index):
+                return
+
+            default_since = datetime.now() - timedelta(days=30)
+            since = min(search.last_notified or default_since for search in index)
+
+            # Один запрос за всеми новыми объявлениями вместо запроса на каждый поиск
+            async with ReadSession() as session:
+                new_properties = (await session.scalars(
+                    select(Property).where(
+                        Property.status == 'active',
+                        Property.created_at > since
+                    ).order_by(Property.created_at.desc())
+                )).all()
+
+            matches = {}
             for prop in new_properties:
-                await self.send_search_notification(search.user_id, prop, search.search_name)
-            
-            if new_properties:
-                search.last_notified = datetime.now()
-                session.commit()
-                
-        except Exception as e:
-            print(f"Error checking search matches: {e}")
-        finally:
-            session.close()
-    
-    async def send_search_notification(self, user_id, property_obj, search_name):
-        """Отправляет уведомление о новом объекте"""
-        try:
-            message = (
-                f"🔔 <b>Новое объявление по вашему запросу \"{search_name}\"</b>\n\n"
-                f"{format_property_message(property_obj)}"
-            )
-            
-            await self.bot.send_message(user_id, message, parse_mode="HTML")
-            
+                for search in index.match(prop):
+                    if prop.created_at > (search.last_notified or default_since):
+                        found = matches.setdefault(search.id, [])
+                        if len(found) < 10:
+                            found.append(prop)
+
+            if matches:
+                await self.send_search_notifications(matches)
+
         except Exception as e:
-            print(f"Failed to send notification to {user_id}: {e}")
-    
+            logger.exception(f"Error in saved searches: {e}")
+
+    async def notify_new_property(self, property_obj):
+        """Уведомляет владельцев подходящих поисков о новом объявлении"""
+        if self.search_index is None:
+            await self.load_search_index()
+
+        matched = self.search_index.match(property_obj)
+        if matched:
+            await self.send_search_notifications({search.id: [property_obj] for search in matched})
+        return len(matched)
+
+    async def send_search_notifications(self, matches):
+        """Ставит в outbox уведомления по поискам и отмечает поиски одной транзакцией.
+
+        matches - {search_id: [объявления]}
+        """
+        now = datetime.now()
+
+        async def job(session):
+            notified = []
+            for search_id, properties in matches.items():
+                search = self.search_index.get(search_id)
+                if search is None:
+                    # Поиск удален (или индекс перечитан) после сопоставления
+                    logger.warning(f"Saved search {search_id} is gone, notifications skipped")
+                    continue
+                notified.append(search_id)
+                for prop in properties:
+                    await enqueue(
+                        session,
+                        search.user_id,
+                        self.search_notification_text(prop, search.search_name),
+                        dedupe_key=f"saved_search:{search_id}:{prop.id}"
+                    )
+
+            if notified:
+                await session.execute(
+                    update(SavedSearch).where(SavedSearch.id.in_(notified))
+                    .values(last_notified=now)
+                )
+            return notified
+
+        notified = await run_write(job)
+        outbox.wake()
+
+        for search_id in notified:
+            search = self.search_index.get(search_id)
+            if search is not None:
+                search.last_notified = now
+
+    @staticmethod
+    def search_notification_text(property_obj, search_name):
+        """Текст уведомления о новом объекте"""
+        return (
+            f"🔔 <b>Новое объявление по вашему запросу \"{search_name}\"</b>\n\n"
+            f"{format_property_message(property_obj)}"
+        )
+
     async def send_price_drop_notification(self, property_obj, old_price, new_price):
         """Уведомление о снижении цены"""
-        session = Session()
-        try:
-            favorites = session.query(Favorite).filter(
-                Favorite.property_id == property_obj.id
-            ).all()
-            
-            for fav in favorites:
-                try:
-                    message = (
-                        f"📉 <b>Цена снижена!</b>\n\n"
-                        f"🏠 {property_obj.property_type} в {property_obj.district}\n"
-                        f"💰 Было: {old_price:,.0f} сум\n"
-                        f"💰 Стало: {new_price:,.0f} сум\n"
-                        f"📉 Скидка: {((old_price - new_price) / old_price * 100):.1f}%"
-                    )
-                    
-                    await self.bot.send_message(fav.user_id, message, parse_mode="HTML")
-                except Exception as e:
-                    print(f"Failed to send price drop notification: {e}")
-                    
-        finally:
-            session.close()
-    
+        async with ReadSession() as session:
+            user_ids = (await session.scalars(
+                select(Favorite.user_id).where(Favorite.property_id == property_obj.id).distinct()
+            )).all()
+
+        if not user_ids:
+            return
+
+        message = (
+            f"📉 <b>Цена снижена!</b>\n\n"
+            f"🏠 {property_obj.property_type} в {property_obj.district}\n"
+            f"💰 Было: {old_price:,.0f} сум\n"
+            f"💰 Стало: {new_price:,.0f} сум\n"
+            f"📉 Скидка: {((old_price - new_price) / old_price * 100):.1f}%"
+        )
+
+        async def job(session):
+            for user_id in user_ids:
+                await enqueue(
+                    session, user_id, message,
+                    dedupe_key=f"price_drop:{property_obj.id}:{new_price:.0f}:{user_id}"
+                )
+
+        await run_write(job)
+        outbox.wake()
+
     async def send_subscription_expiry_notification(self, user_id, days_left):
         """Уведомление о скором окончании подписки"""
         try:
@@ -109,8 +211,11 @@ class NotificationService:
                     f"⏰ <b>Ваша подписка заканчивается через {days_left} дней</b>\n\n"
                     f"Для продления свяжитесь с администратором: @Jamastik"
                 )
-                
-                await self.bot.send_message(user_id, message, parse_mode="HTML")
-                
+
+                await queue_message(
+                    user_id, message,
+                    dedupe_key=f"subscription_expiry:{user_id}:{days_left}:{datetime.now().date()}"
+                )
+
         except Exception as e:
-            print(f"Failed to send subscription notification: {e}")
+            logger.exception(f"Failed to send subscription notification: {e}")
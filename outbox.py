@@ -0,0 +1,251 @@
+"""Transactional outbox для уведомлений.
+
+Уведомление записывается в таблицу notification_outbox в той же транзакции,
+что и бизнес-изменение (enqueue с сессией задания записи), поэтому
+обработчик возвращает ответ сразу, а уведомление не теряется при падении.
+
+OutboxWorker забирает готовые к отправке записи и раздает их воркерам по
+chat_id, соблюдая общий лимит бота и лимит на чат. Из каждого чата берется
+только самое старое неотправленное уведомление, поэтому порядок сообщений
+в чате сохраняется: пока оно ждет повтора, следующие уведомления чата тоже
+ждут. Ошибки доставки повторяются с экспоненциальной задержкой; доставка -
+"хотя бы один раз".
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import OUTBOX_WORKERS, OUTBOX_PER_CHAT_RATE, OUTBOX_MAX_ATTEMPTS
+from database import ReadSession, NotificationOutbox
+from rate_limiter import TokenBucket, telegram_limiter
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+
+def dump_markup(markup):
+    if markup is None:
+        return None
+    return {'type': type(markup).__name__, 'data': markup.model_dump(exclude_none=True)}
+
+
+def load_markup(data):
+    if not data:
+        return None
+    return getattr(types, data['type']).model_validate(data['data'])
+
+
+async def enqueue(session, chat_id: int, text: str, parse_mode: str = 'HTML',
+                  reply_markup=None, dedupe_key: str = None):
+    """Добавляет уведомление в outbox в транзакции вызывающего (сессия задания записи)"""
+    await session.execute(
+        sqlite_insert(NotificationOutbox).values(
+            chat_id=chat_id,
+            message_text=text,
+            parse_mode=parse_mode,
+            reply_markup=dump_markup(reply_markup),
+            dedupe_key=dedupe_key,
+            status='pending',
+            attempts=0,
+            next_attempt_at=datetime.now(),
+            created_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=['dedupe_key'])
+    )
+
+
+class OutboxWorker:
+    def __init__(self, workers: int = OUTBOX_WORKERS, per_chat_rate: float = OUTBOX_PER_CHAT_RATE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, batch_size: int = 100,
+                 poll_interval: float = 1.0, limiter=telegram_limiter, max_chats: int = 10000):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.limiter = limiter
+        self.max_chats = max_chats
+        self.bot = None
+        self._wake = None
+        self._queues = []
+        self._tasks = []
+        self._in_flight = set()
+        self._chat_buckets = OrderedDict()
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    def start(self, bot: Bot):
+        if self._tasks:
+            return
+        self.bot = bot
+        self._wake = asyncio.Event()
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._dispatch(), name='outbox-dispatcher')]
+        self._tasks += [
+            asyncio.create_task(self._work(queue), name=f'outbox-worker-{n}')
+            for n, queue in enumerate(self._queues)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._in_flight.clear()
+
+    def wake(self):
+        """Сообщает, что закоммичены новые уведомления"""
+        if self._wake is not None:
+            self._wake.set()
+
+    # ========== ВЫБОРКА ==========
+
+    async def _dispatch(self):
+        last_purge = datetime.now()
+        while True:
+            try:
+                rows = await self._due_rows()
+                for row in rows:
+                    self._in_flight.add(row.id)
+                    self._queues[row.chat_id % self.workers].put_nowait(row)
+
+                if datetime.now() - last_purge > timedelta(hours=1):
+                    await self.purge_sent()
+                    last_purge = datetime.now()
+            except Exception as e:
+                logger.exception(f"Outbox dispatch failed: {e}")
+                rows = []
+
+            if len(rows) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def _due_rows(self):
+        # Только первые неотправленные уведомления чатов: следующее уйдет после него
+        heads = (
+            select(func.min(NotificationOutbox.id))
+            .where(NotificationOutbox.status == 'pending')
+            .group_by(NotificationOutbox.chat_id)
+        )
+        async with ReadSession() as session:
+            rows = (await session.scalars(
+                select(NotificationOutbox).where(
+                    NotificationOutbox.status == 'pending',
+                    NotificationOutbox.next_attempt_at <= datetime.now(),
+                    NotificationOutbox.id.in_(heads)
+                ).order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+                .limit(self.batch_size + len(self._in_flight))
+            )).all()
+        return [row for row in rows if row.id not in self._in_flight][:self.batch_size]
+
+    # ========== ОТПРАВКА ==========
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, capacity=max(1.0, self.per_chat_rate))
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            row = await queue.get()
+            try:
+                await self._deliver(row)
+            except Exception as e:
+                logger.exception(f"Outbox delivery of {row.id} failed: {e}")
+            finally:
+                self._in_flight.discard(row.id)
+                queue.task_done()
+
+    async def _deliver(self, row):
+        bucket = self._chat_bucket(row.chat_id)
+        if not bucket.try_acquire():
+            # Лимит чата исчерпан - откладываем, не блокируя другие чаты воркера
+            await self._reschedule(row, delay=1 / self.per_chat_rate, count_attempt=False)
+            return
+
+        await self.limiter.acquire()
+        try:
+            await self.bot.send_message(
+                chat_id=row.chat_id,
+                text=row.message_text,
+                parse_mode=row.parse_mode,
+                reply_markup=load_markup(row.reply_markup)
+            )
+        except TelegramRetryAfter as e:
+            self.limiter.pause(e.retry_after)
+            await self._reschedule(row, delay=e.retry_after, count_attempt=False)
+            return
+        except PERMANENT_ERRORS as e:
+            await self._mark(row.id, status='failed', last_error=str(e), attempts=row.attempts + 1)
+            self.stats['failed'] += 1
+            return
+        except Exception as e:
+            if row.attempts + 1 >= self.max_attempts:
+                await self._mark(row.id, status='failed', last_error=str(e), attempts=row.attempts + 1)
+                self.stats['failed'] += 1
+            else:
+                await self._reschedule(row, delay=min(2 ** row.attempts, 600), error=str(e))
+                self.stats['retried'] += 1
+            return
+
+        await self._mark(row.id, status='sent', sent_at=datetime.now(), attempts=row.attempts + 1)
+        self.stats['sent'] += 1
+
+    async def _reschedule(self, row, delay: float, count_attempt: bool = True, error: str = None):
+        values = {'next_attempt_at': datetime.now() + timedelta(seconds=delay)}
+        if count_attempt:
+            values['attempts'] = row.attempts + 1
+        if error:
+            values['last_error'] = error
+        await self._mark(row.id, **values)
+
+    async def _mark(self, row_id: int, **values):
+        async def job(session):
+            await session.execute(
+                update(NotificationOutbox).where(NotificationOutbox.id == row_id).values(**values)
+            )
+
+        await run_write(job)
+
+    async def purge_sent(self, days: int = 7):
+        """Удаляет доставленные уведомления старше days дней"""
+        border = datetime.now() - timedelta(days=days)
+
+        async def job(session):
+            result = await session.execute(
+                delete(NotificationOutbox).where(
+                    NotificationOutbox.status == 'sent',
+                    NotificationOutbox.sent_at < border
+                )
+            )
+            return result.rowcount
+
+        return await run_write(job)
+
+
+outbox = OutboxWorker()
+
+
+async def queue_message(chat_id: int, text: str, parse_mode: str = 'HTML',
+                        reply_markup=None, dedupe_key: str = None):
+    """Ставит уведомление в outbox отдельной транзакцией"""
+    async def job(session):
+        await enqueue(session, chat_id, text, parse_mode, reply_markup, dedupe_key)
+
+    await run_write(job)
+    outbox.wake()
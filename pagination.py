@@ -0,0 +1,132 @@
+"""Курсорная (keyset) пагинация списков.
+
+Страница задается не номером, а ключом сортировки и id последнего
+показанного элемента: следующая страница - это элементы строго после
+этого ключа (WHERE (key, id) < (:key, :id) ORDER BY key DESC, id DESC LIMIT n).
+Стоимость страницы не зависит от глубины, а объявления, добавленные или
+снятые между страницами, не приводят к повторам и пропускам.
+
+Курсор кодируется в callback_data кнопки (не длиннее 64 байт):
+"<префикс>:<значение>~<id>", значения - с буквой типа (i - целое, f - число,
+d - дата, n - пусто). Пустой курсор - первая страница.
+"""
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from database import ReadSession
+
+# Ограничение Telegram на callback_data
+CALLBACK_DATA_LIMIT = 64
+PAGE_SIZE = 10
+
+_TOKEN = r'(?:n|[id]-?[0-9a-z]+|f[-+.0-9a-z]+)'
+# callback_data кнопок пагинации ("<префикс>:<курсор>", курсор может быть пустым)
+CURSOR_CALLBACK_RE = re.compile(rf'^\w+:(?:{_TOKEN}(?:~{_TOKEN})*)?$')
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _to_base36(number: int) -> str:
+    if number < 0:
+        return '-' + _to_base36(-number)
+    digits = ''
+    while True:
+        number, digit = divmod(number, 36)
+        digits = _DIGITS[digit] + digits
+        if not number:
+            return digits
+
+
+def _encode_value(value) -> str:
+    if value is None:
+        return 'n'
+    if isinstance(value, bool):
+        return 'i' + _to_base36(int(value))
+    if isinstance(value, int):
+        return 'i' + _to_base36(value)
+    if isinstance(value, float):
+        return 'f' + repr(value)
+    if isinstance(value, datetime):
+        return 'd' + _to_base36((value - _EPOCH) // timedelta(microseconds=1))
+    raise TypeError(f"Unsupported cursor value: {value!r}")
+
+
+def _decode_value(token: str):
+    kind, body = token[0], token[1:]
+    if kind == 'n':
+        return None
+    if kind == 'i':
+        return int(body, 36)
+    if kind == 'f':
+        return float(body)
+    if kind == 'd':
+        return _EPOCH + timedelta(microseconds=int(body, 36))
+    raise ValueError(f"Bad cursor value: {token!r}")
+
+
+def encode_cursor(key) -> str:
+    """Курсор из ключа последнего элемента (кортеж значений, последним - id)"""
+    return '~'.join(_encode_value(value) for value in key)
+
+
+def decode_cursor(cursor: str):
+    """Ключ из курсора; None для пустого курсора (первая страница)"""
+    if not cursor:
+        return None
+    return tuple(_decode_value(token) for token in cursor.split('~'))
+
+
+def cursor_callback(prefix: str, cursor: str = None) -> str:
+    """callback_data кнопки перехода к странице после курсора"""
+    data = f"{prefix}:{cursor or ''}"
+    if len(data.encode()) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data longer than {CALLBACK_DATA_LIMIT} bytes: {data}")
+    return data
+
+
+def parse_callback(data: str, prefix: str):
+    """Ключ курсора из callback_data (None - первая страница)"""
+    return decode_cursor(data[len(prefix) + 1:])
+
+
+def after_key(order, key, descending: bool = True):
+    """Условие "строка после ключа" для ORDER BY по колонкам order (последняя - уникальный id).
+
+    NULL считается меньше любого значения, как при сортировке в SQLite.
+    """
+    conditions = []
+    for index, (column, value) in enumerate(zip(order, key)):
+        equal = [
+            previous.is_(None) if previous_value is None else previous == previous_value
+            for previous, previous_value in zip(order[:index], key[:index])
+        ]
+        if descending:
+            if value is None:
+                continue
+            beyond = or_(column < value, column.is_(None))
+        else:
+            beyond = column.is_not(None) if value is None else column > value
+        conditions.append(and_(*equal, beyond))
+    return or_(*conditions)
+
+
+async def keyset_page(query, order, cursor: str = None, limit: int = PAGE_SIZE, descending: bool = True):
+    """Страница запроса одной сущности: (элементы, курсор следующей страницы или None).
+
+    order - колонки сортировки, последней - уникальный id.
+    """
+    key = decode_cursor(cursor)
+    if key is not None:
+        query = query.where(after_key(order, key, descending))
+    query = query.add_columns(*order).order_by(*[
+        column.desc() if descending else column.asc() for column in order
+    ]).limit(limit + 1)
+
+    async with ReadSession() as session:
+        rows = (await session.execute(query)).all()
+
+    next_cursor = encode_cursor(tuple(rows[limit - 1][1:])) if len(rows) > limit else None
+    return [row[0] for row in rows[:limit]], next_cursor
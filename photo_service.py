@@ -0,0 +1,155 @@
+"""Фото объявлений.
+
+Фото хранятся в двух таблицах: photos - одна строка на изображение (ключ -
+file_unique_id Telegram, с последним полученным file_id для отправки) и
+property_photos - упорядоченные ссылки объявлений на фото. Повторно
+загруженное изображение (тот же file_unique_id) не дублируется ни внутри
+объявления, ни между объявлениями, а в горячей таблице properties остается
+только флаг has_photos.
+
+Объявление с фото отправляется одной медиагруппой: один вызов API вместо
+сообщения на каждое фото.
+"""
+from aiogram import Bot
+from aiogram.types import InputMediaPhoto
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import MAX_PROPERTY_PHOTOS
+from database import ReadSession, Photo, PropertyPhoto, Property
+from write_queue import run_write
+
+# Максимальная длина подписи к фото в Telegram
+CAPTION_LIMIT = 1024
+
+
+def photo_from_message(message):
+    """(file_unique_id, file_id) самого крупного размера фото из сообщения или None"""
+    if not message.photo:
+        return None
+    largest = message.photo[-1]
+    return largest.file_unique_id, largest.file_id
+
+
+class PhotoService:
+    @staticmethod
+    async def attach(session, property_id: int, photos) -> int:
+        """Добавляет фото [(file_unique_id, file_id)] в конец объявления внутри задания записи.
+
+        Уже прикрепленные и повторяющиеся фото пропускаются, сверх
+        MAX_PROPERTY_PHOTOS - отбрасываются. Возвращает число добавленных.
+        """
+        rows = (await session.execute(
+            select(PropertyPhoto.position, PropertyPhoto.file_unique_id)
+            .where(PropertyPhoto.property_id == property_id)
+        )).all()
+        attached = {file_unique_id for _, file_unique_id in rows}
+        position = max((position for position, _ in rows), default=-1) + 1
+
+        # file_unique_id -> последний file_id: у одного изображения file_id со временем меняется
+        file_ids = dict(photos)
+        new = [file_unique_id for file_unique_id in file_ids if file_unique_id not in attached]
+        new = new[:max(MAX_PROPERTY_PHOTOS - len(attached), 0)]
+        kept = [file_unique_id for file_unique_id in file_ids if file_unique_id in attached] + new
+        if kept:
+            statement = sqlite_insert(Photo)
+            await session.execute(
+                statement.on_conflict_do_update(index_elements=['file_unique_id'],
+                                                set_={'file_id': statement.excluded.file_id}),
+                [{'file_unique_id': file_unique_id, 'file_id': file_ids[file_unique_id]} for file_unique_id in kept]
+            )
+        if not new:
+            return 0
+
+        session.add_all([
+            PropertyPhoto(property_id=property_id, position=position + offset, file_unique_id=file_unique_id)
+            for offset, file_unique_id in enumerate(new)
+        ])
+        await session.execute(update(Property).where(Property.id == property_id).values(has_photos=True))
+        return len(new)
+
+    @staticmethod
+    async def add_photos(property_id: int, photos) -> int:
+        """Добавляет фото к объявлению, возвращает число добавленных"""
+        async def job(session):
+            return await PhotoService.attach(session, property_id, photos)
+
+        return await run_write(job)
+
+    @staticmethod
+    async def remove_photo(property_id: int, file_unique_id: str) -> bool:
+        """Убирает фото из объявления; фото, которое больше нигде не используется, удаляется"""
+        async def job(session):
+            result = await session.execute(
+                delete(PropertyPhoto).where(PropertyPhoto.property_id == property_id,
+                                            PropertyPhoto.file_unique_id == file_unique_id)
+            )
+            if not result.rowcount:
+                return False
+
+            used = select(PropertyPhoto.property_id).where(PropertyPhoto.file_unique_id == file_unique_id)
+            if not await session.scalar(select(exists(used))):
+                await session.execute(delete(Photo).where(Photo.file_unique_id == file_unique_id))
+
+            left = select(PropertyPhoto.position).where(PropertyPhoto.property_id == property_id)
+            if not await session.scalar(select(exists(left))):
+                await session.execute(update(Property).where(Property.id == property_id).values(has_photos=False))
+            return True
+
+        return await run_write(job)
+
+    @staticmethod
+    async def get_file_ids(property_id: int):
+        """file_id фото объявления по порядку"""
+        return (await PhotoService.get_file_ids_many([property_id])).get(property_id, [])
+
+    @staticmethod
+    async def get_file_ids_many(property_ids):
+        """property_id -> file_id фото по порядку, одним запросом для списка объявлений"""
+        if not property_ids:
+            return {}
+        async with ReadSession() as session:
+            rows = (await session.execute(
+                select(PropertyPhoto.property_id, Photo.file_id)
+                .join(Photo, Photo.file_unique_id == PropertyPhoto.file_unique_id)
+                .where(PropertyPhoto.property_id.in_(list(property_ids)))
+                .order_by(PropertyPhoto.property_id, PropertyPhoto.position)
+            )).all()
+
+        result = {}
+        for property_id, file_id in rows:
+            result.setdefault(property_id, []).append(file_id)
+        return result
+
+    @staticmethod
+    async def send_property(bot: Bot, chat_id, property_obj, text: str, parse_mode: str = 'HTML',
+                            reply_markup=None, file_ids=None):
+        """Отправляет карточку объявления, возвращает отправленные сообщения.
+
+        Фото уходят одной медиагруппой с текстом в подписи первого фото.
+        Если текст не помещается в подпись или нужны кнопки (у медиагруппы
+        их не бывает), текст отправляется отдельным сообщением после фото.
+        """
+        if file_ids is None:
+            file_ids = await PhotoService.get_file_ids(property_obj.id) if property_obj.has_photos else []
+        fits = len(text) <= CAPTION_LIMIT
+
+        if not file_ids:
+            return [await bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)]
+        if len(file_ids) == 1 and fits:
+            return [await bot.send_photo(chat_id, file_ids[0], caption=text, parse_mode=parse_mode,
+                                         reply_markup=reply_markup)]
+
+        caption = text if fits and reply_markup is None else None
+        media = [
+            InputMediaPhoto(media=file_id, caption=caption, parse_mode=parse_mode) if position == 0 and caption
+            else InputMediaPhoto(media=file_id)
+            for position, file_id in enumerate(file_ids)
+        ]
+        if len(media) == 1:
+            messages = [await bot.send_photo(chat_id, file_ids[0])]
+        else:
+            messages = list(await bot.send_media_group(chat_id, media))
+        if caption is None:
+            messages.append(await bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup))
+        return messages
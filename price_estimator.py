@@ -0,0 +1,158 @@
+"""Оценка цены по аналогам (k ближайших соседей).
+
+Индекс строится из снимка активных объявлений market_trends: для каждого
+типа недвижимости - матрица нормированных признаков (логарифм площади,
+комнаты, этаж, год постройки), коды районов, цены и цены за м². Запрос
+ищет ESTIMATOR_NEIGHBORS ближайших объявлений того же типа; объявления из
+других районов тоже подходят, но со штрафом к расстоянию.
+
+Справедливая цена - медиана цен аналогов за м², умноженная на площадь
+(без площади - медиана цен), диапазон - p25..p75 аналогов.
+
+Индекс перестраивается при запросе после изменения снимка, но не чаще раза
+в ESTIMATOR_REBUILD_INTERVAL секунд.
+"""
+import logging
+import math
+import time
+import warnings
+
+import numpy as np
+
+from config import ESTIMATOR_NEIGHBORS, ESTIMATOR_MIN_COMPARABLES, ESTIMATOR_REBUILD_INTERVAL
+from market_trends import market_trends, PRICE, AREA, ROOMS, DISTRICT, TYPE, FLOOR, YEAR_BUILT, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Признаки и их веса в расстоянии (признаки нормированы разбросом внутри типа)
+FEATURE_WEIGHTS = {
+    AREA: 1.0,
+    ROOMS: 1.0,
+    FLOOR: 0.3,
+    YEAR_BUILT: 0.5,
+}
+# Штраф к квадрату расстояния за аналог из другого района
+DISTRICT_PENALTY = 1.0
+
+
+class _TypeIndex:
+    """Аналоги одного типа недвижимости"""
+
+    def __init__(self, columns, rows):
+        raw = np.column_stack([_feature(columns, name)[rows] for name in FEATURE_WEIGHTS])
+        # Пропуски заменяются медианой, разброс - межквартильный (устойчив к выбросам)
+        with warnings.catch_warnings():
+            # Признак может быть не заполнен ни у одного объявления типа
+            warnings.simplefilter('ignore', RuntimeWarning)
+            center = np.nanmedian(raw, axis=0)
+            q25, q75 = np.nanpercentile(raw, [25, 75], axis=0)
+        self.center = np.where(np.isnan(center), 0, center)
+        spread = (q75 - q25) / 1.349
+        self.scale = np.where(np.isnan(spread) | (spread <= 0), 1, spread)
+        self.weights = np.sqrt(np.array(list(FEATURE_WEIGHTS.values())))
+
+        self.features = self.normalize(raw)
+        self.district = columns[DISTRICT][rows]
+        self.price = columns[PRICE][rows]
+        area = columns[AREA][rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.price_per_m2 = np.where(area > 0, self.price / area, np.nan)
+
+    def normalize(self, raw):
+        filled = np.where(np.isnan(raw), self.center, raw)
+        return (filled - self.center) / self.scale * self.weights
+
+    def nearest(self, query, district: int, k: int):
+        """Номера k ближайших строк и число аналогов из того же района"""
+        distance = np.square(self.features - query).sum(axis=1)
+        distance += np.where(self.district == district, 0, DISTRICT_PENALTY)
+        if k < len(distance):
+            rows = np.argpartition(distance, k)[:k]
+        else:
+            rows = np.arange(len(distance))
+        return rows, int((self.district[rows] == district).sum())
+
+
+class PriceEstimator:
+    def __init__(self, neighbors: int = ESTIMATOR_NEIGHBORS, min_comparables: int = ESTIMATOR_MIN_COMPARABLES,
+                 rebuild_interval: float = ESTIMATOR_REBUILD_INTERVAL, snapshot=market_trends):
+        self.neighbors = neighbors
+        self.min_comparables = min_comparables
+        self.rebuild_interval = rebuild_interval
+        self.snapshot = snapshot
+        # тип недвижимости -> _TypeIndex
+        self._indexes = {}
+        # район -> код в снимке
+        self._districts = {}
+        self._version = None
+        self._built_at = 0.0
+
+    async def _ensure_index(self):
+        if self._version == self.snapshot.version:
+            return
+        if self._indexes and time.monotonic() - self._built_at < self.rebuild_interval:
+            return
+
+        columns, names = await self.snapshot.columns()
+        self._version = self.snapshot.version
+        self._built_at = time.monotonic()
+
+        # Аналогом может быть только объявление с ценой
+        priced = ~np.isnan(columns[PRICE])
+        types = columns[TYPE]
+        self._indexes = {
+            names[TYPE][code]: _TypeIndex(columns, np.flatnonzero(priced & (types == code)))
+            for code in np.unique(types[priced]).tolist()
+        }
+        self._districts = {district: code for code, district in enumerate(names[DISTRICT])}
+
+    async def estimate(self, property_type, district=None, rooms=None, area=None, floor=None, year_built=None):
+        """Справедливая цена по аналогам или None, если аналогов слишком мало.
+
+        Возвращает словарь: price, low, high (UZS), price_per_m2,
+        comparables (число аналогов), same_district (из них в том же районе).
+        """
+        await self._ensure_index()
+        index = self._indexes.get(property_type)
+        if index is None or len(index.price) < self.min_comparables:
+            return None
+
+        raw = np.array([[
+            math.log(area) if area and area > 0 else np.nan,
+            np.nan if rooms is None else rooms,
+            np.nan if floor is None else floor,
+            np.nan if year_built is None else year_built,
+        ]], dtype=np.float64)
+        rows, same_district = index.nearest(index.normalize(raw)[0], self._districts.get(district, -2), self.neighbors)
+
+        per_m2 = index.price_per_m2[rows]
+        per_m2 = per_m2[~np.isnan(per_m2)]
+        if area and area > 0 and len(per_m2) >= self.min_comparables:
+            low, price, high = np.percentile(per_m2, [25, 50, 75]) * area
+            price_per_m2 = float(np.median(per_m2))
+        else:
+            low, price, high = np.percentile(index.price[rows], [25, 50, 75])
+            price_per_m2 = None
+
+        return {
+            'price': float(price),
+            'low': float(low),
+            'high': float(high),
+            'price_per_m2': price_per_m2,
+            'comparables': len(rows),
+            'same_district': same_district,
+        }
+
+
+def _feature(columns, name):
+    """Колонка признака в float: площадь логарифмируется, пропуски - NaN"""
+    if name == AREA:
+        area = columns[AREA]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(area > 0, np.log(area), np.nan)
+    values = columns[name].astype(np.float64)
+    values[columns[name] == MISSING] = np.nan
+    return values
+
+
+price_estimator = PriceEstimator()
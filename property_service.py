@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime
+from sqlalchemy import select
+from database import ReadSession, Property, User, Favorite
+from pagination import PAGE_SIZE, keyset_page
+from rate_limiter import user_limiter
+from events import bus, PROPERTY_CREATED, PROPERTY_LOCATION_CHANGED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED
+from duplicate_index import duplicate_index
+from geo import district_of, valid_location
+from photo_service import PhotoService
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+# Поля объявления, которые можно задать при создании
+PROPERTY_FIELDS = {
+    'user_phone', 'property_type', 'district', 'address', 'price_uzs', 'price_usd',
+    'currency', 'rooms', 'area', 'description', 'floor', 'total_floors',
+    'year_built', 'is_daily_rent', 'available_from', 'available_to', 'status',
+    'latitude', 'longitude'
+}
+
+class PropertyService:
+    @staticmethod
+    async def create_property(user_id: int, data: dict):
+        """Создает объявление и публикует событие о нем.
+
+        data['photos'] - список (file_unique_id, file_id), фото сохраняются
+        в той же транзакции. Если заданы координаты, а район нет, район
+        определяется по координатам. Дубликат уже опубликованного объявления
+        сохраняется сразу как подозрительный (suspicious).
+        """
+        fields = {key: value for key, value in data.items() if key in PROPERTY_FIELDS}
+        latitude, longitude = fields.get('latitude'), fields.get('longitude')
+        if (latitude is not None or longitude is not None) and not valid_location(latitude, longitude):
+            return False, "Некорректные координаты"
+
+        if not user_limiter.check(user_id, 'property_create'):
+            return False, "Слишком много объявлений, попробуйте позже"
+
+        if latitude is not None and not fields.get('district'):
+            fields['district'] = district_of(latitude, longitude)
+
+        # Проверка до записи: событие о создании активного дубликата не публикуется
+        # (канал, уведомления, поисковые индексы); pending проверяет модерация
+        if fields.get('status', 'active') == 'active':
+            duplicates = duplicate_index.find_duplicates(fields)
+            if duplicates:
+                fields['status'] = 'suspicious'
+                logger.info(f"New property of user {user_id} is a duplicate of {duplicates[0][0]} "
+                            f"({duplicates[0][1]:.2f})")
+
+        async def job(session):
+            property_obj = Property(user_id=user_id, created_at=datetime.now(), **fields)
+            session.add(property_obj)
+
+            user = await session.scalar(select(User).where(User.telegram_id == user_id))
+            if user:
+                user.properties_count = (user.properties_count or 0) + 1
+
+            await session.flush()
+            if data.get('photos') and await PhotoService.attach(session, property_obj.id, data['photos']):
+                property_obj.has_photos = True
+            return property_obj
+
+        try:
+            property_obj = await run_write(job)
+        except Exception as e:
+            # Несостоявшаяся публикация не расходует лимит
+            user_limiter.refund(user_id, 'property_create')
+            return False, str(e)
+
+        await bus.publish(PROPERTY_CREATED, property=property_obj)
+        return True, property_obj.id
+
+    @staticmethod
+    async def update_price(property_id: int, new_price: float):
+        """Меняет цену объявления"""
+        async def job(session):
+            property_obj = await session.get(Property, property_id)
+            if not property_obj:
+                return None, None
+            old_price = property_obj.price_uzs
+            property_obj.price_uzs = new_price
+            return property_obj, old_price
+
+        try:
+            property_obj, old_price = await run_write(job)
+        except Exception as e:
+            return False, str(e)
+
+        if not property_obj:
+            return False, "Объект не найден"
+
+        if old_price != new_price:
+            await bus.publish(PROPERTY_PRICE_CHANGED, property=property_obj, old_price=old_price, new_price=new_price)
+        return True, "Цена обновлена"
+
+    @staticmethod
+    async def set_location(property_id: int, latitude: float, longitude: float):
+        """Задает координаты объявления (None, None - убирает их)"""
+        if (latitude is not None or longitude is not None) and not valid_location(latitude, longitude):
+            return False, "Некорректные координаты"
+
+        async def job(session):
+            property_obj = await session.get(Property, property_id)
+            if not property_obj:
+                return None, False
+            changed = (property_obj.latitude, property_obj.longitude) != (latitude, longitude)
+            property_obj.latitude, property_obj.longitude = latitude, longitude
+            return property_obj, changed
+
+        try:
+            property_obj, changed = await run_write(job)
+        except Exception as e:
+            return False, str(e)
+
+        if not property_obj:
+            return False, "Объект не найден"
+
+        if changed:
+            await bus.publish(PROPERTY_LOCATION_CHANGED, property=property_obj)
+        return True, "Координаты обновлены"
+
+    @staticmethod
+    async def change_status(property_id: int, status: str):
+        """Меняет статус объявления (active, sold, archived, suspicious...)"""
+        async def job(session):
+            property_obj = await session.get(Property, property_id)
+            if not property_obj:
+                return None, None
+            old_status = property_obj.status
+            property_obj.status = status
+            return property_obj, old_status
+
+        try:
+            property_obj, old_status = await run_write(job)
+        except Exception as e:
+            return False, str(e)
+
+        if not property_obj:
+            return False, "Объект не найден"
+
+        if old_status != status:
+            await bus.publish(PROPERTY_STATUS_CHANGED, property=property_obj, old_status=old_status, new_status=status)
+        return True, "Статус обновлен"
+
+    @staticmethod
+    async def get_property(property_id: int):
+        """Получает объявление по id"""
+        async with ReadSession() as session:
+            return await session.get(Property, property_id)
+
+    @staticmethod
+    async def get_user_properties(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+        """Страница объявлений пользователя, новые первыми: (объявления, курсор следующей страницы)"""
+        return await keyset_page(
+            select(Property).where(Property.user_id == user_id),
+            [Property.created_at, Property.id], cursor, limit
+        )
+
+    @staticmethod
+    async def get_favorites(user_id: int, cursor: str = None, limit: int = PAGE_SIZE):
+        """Страница избранного пользователя, последние добавленные первыми: (объявления, курсор)"""
+        return await keyset_page(
+            select(Property).join(Favorite, Favorite.property_id == Property.id).where(Favorite.user_id == user_id),
+            [Favorite.id], cursor, limit
+        )
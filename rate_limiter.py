@@ -0,0 +1,165 @@
+"""Ограничители частоты.
+
+TokenBucket - ведро токенов для исходящих запросов к Telegram:
+глобальный лимит бота (около 30 сообщений в секунду) и пауза по RetryAfter.
+
+UserRateLimiter - лимиты входящих действий пользователей: ведро токенов на
+каждую пару (user_id, action). Счетчики хранятся компактно (два числа на ключ)
+в LRU-словаре ограниченного размера; по желанию сохраняются в файл.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from config import TELEGRAM_GLOBAL_RATE, RATE_LIMITS, RATE_LIMIT_MAX_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Забирает токены, если они есть, не ожидая"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """Ждет, пока в ведре накопится нужное число токенов"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (ответ Telegram RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class UserRateLimiter:
+    def __init__(self, rules: dict = None, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rules = rules if rules is not None else RATE_LIMITS
+        self.max_keys = max_keys
+        # (user_id, action) -> [токены, время последнего обновления]
+        self._counters = OrderedDict()
+
+    def _rule(self, action: str, limit: int = None, period: float = None):
+        default_limit, default_period = self.rules.get(action, self.rules['message'])
+        return limit or default_limit, period or default_period
+
+    def _tokens(self, key, limit: int, period: float, now: float) -> float:
+        counter = self._counters.get(key)
+        if counter is None:
+            return float(limit)
+        tokens, updated_at = counter
+        return min(float(limit), tokens + (now - updated_at) * limit / period)
+
+    def check(self, user_id: int, action: str, cost: float = 1,
+              limit: int = None, period: float = None) -> bool:
+        """Засчитывает действие, если лимит не исчерпан"""
+        limit, period = self._rule(action, limit, period)
+        key = (user_id, action)
+        now = time.monotonic()
+        tokens = self._tokens(key, limit, period, now)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+
+        self._counters[key] = [tokens, now]
+        self._counters.move_to_end(key)
+        if len(self._counters) > self.max_keys:
+            # Вытесняем давно не активных: их ведра уже почти наверняка полные
+            self._counters.popitem(last=False)
+        return allowed
+
+    def refund(self, user_id: int, action: str, cost: float = 1,
+               limit: int = None, period: float = None):
+        """Возвращает засчитанное действие (оно не состоялось)"""
+        limit, period = self._rule(action, limit, period)
+        key = (user_id, action)
+        if key in self._counters:
+            now = time.monotonic()
+            self._counters[key] = [min(float(limit), self._tokens(key, limit, period, now) + cost), now]
+
+    def retry_after(self, user_id: int, action: str, cost: float = 1,
+                    limit: int = None, period: float = None) -> float:
+        """Через сколько секунд действие снова станет доступно"""
+        limit, period = self._rule(action, limit, period)
+        tokens = self._tokens((user_id, action), limit, period, time.monotonic())
+        return max(0.0, (cost - tokens) * period / limit)
+
+    def reset(self, user_id: int, action: str = None):
+        """Сбрасывает счетчики пользователя (все или по одному действию)"""
+        for key in [key for key in self._counters if key[0] == user_id and action in (None, key[1])]:
+            del self._counters[key]
+
+    def __len__(self):
+        return len(self._counters)
+
+    # ========== СОХРАНЕНИЕ ==========
+
+    def save(self, path: str):
+        """Сохраняет незаполненные ведра в файл (время переводится в абсолютное)"""
+        now, wall = time.monotonic(), time.time()
+        state = []
+        for (user_id, action), (tokens, updated_at) in self._counters.items():
+            limit, _ = self._rule(action)
+            if tokens < limit:
+                state.append([user_id, action, tokens, wall - (now - updated_at)])
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+        return len(state)
+
+    def load(self, path: str):
+        """Загружает ведра, сохраненные save()"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rate limiter state {path} is unreadable: {e}")
+            return 0
+
+        now, wall = time.monotonic(), time.time()
+        for user_id, action, tokens, saved_at in state[-self.max_keys:]:
+            self._counters[(user_id, action)] = [tokens, now - max(0.0, wall - saved_at)]
+        return len(state)
+
+
+# Общий лимит исходящих сообщений бота
+telegram_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE)
+
+# Лимиты действий пользователей
+user_limiter = UserRateLimiter()
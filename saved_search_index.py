@@ -0,0 +1,103 @@
+"""Инвертированный индекс сохраненных поисков.
+
+Поиски раскладываются по корзинам (тип, район, комнаты), где None означает
+"любой". Внутри корзины поиски отсортированы по нижней границе цены, поэтому
+новое объявление проверяется только против поисков из не более чем восьми
+подходящих корзин, а внутри корзины - бинарным поиском по цене.
+"""
+from bisect import bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+INF = float('inf')
+
+
+def search_key(filters: dict) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """Ключ корзины для фильтров сохраненного поиска"""
+    district = filters.get('district')
+    if district == 'any':
+        district = None
+    return (
+        filters.get('property_type') or None,
+        district or None,
+        filters.get('rooms') or None,
+    )
+
+
+def price_range(filters: dict) -> Tuple[float, float]:
+    return (filters.get('min_price') or 0, filters.get('max_price') or INF)
+
+
+class _PriceBucket:
+    """Поиски одной корзины, отсортированные по минимальной цене"""
+
+    def __init__(self):
+        self.entries = []  # (min_price, max_price, search_id)
+
+    def add(self, min_price: float, max_price: float, search_id: int):
+        insort(self.entries, (min_price, max_price, search_id))
+
+    def remove(self, search_id: int):
+        self.entries = [entry for entry in self.entries if entry[2] != search_id]
+
+    def match(self, price: float) -> List[int]:
+        # Кандидаты - поиски с min_price <= price; отсекаем по max_price
+        end = bisect_right(self.entries, (price, INF, INF))
+        return [search_id for _, max_price, search_id in self.entries[:end] if price <= max_price]
+
+
+class SavedSearchIndex:
+    def __init__(self):
+        self._buckets: Dict[tuple, _PriceBucket] = {}
+        self._searches: Dict[int, object] = {}
+        self._keys: Dict[int, tuple] = {}
+
+    def __len__(self):
+        return len(self._searches)
+
+    def __iter__(self):
+        return iter(self._searches.values())
+
+    @classmethod
+    def build(cls, searches):
+        index = cls()
+        for search in searches:
+            index.add(search)
+        return index
+
+    def add(self, search):
+        """Добавляет (или обновляет) сохраненный поиск"""
+        if search.id in self._searches:
+            self.remove(search.id)
+
+        filters = search.filters or {}
+        key = search_key(filters)
+        min_price, max_price = price_range(filters)
+
+        self._buckets.setdefault(key, _PriceBucket()).add(min_price, max_price, search.id)
+        self._searches[search.id] = search
+        self._keys[search.id] = key
+
+    def remove(self, search_id: int):
+        key = self._keys.pop(search_id, None)
+        self._searches.pop(search_id, None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.remove(search_id)
+        if not bucket.entries:
+            del self._buckets[key]
+
+    def get(self, search_id: int):
+        return self._searches.get(search_id)
+
+    def match(self, property_obj) -> list:
+        """Сохраненные поиски, которым соответствует объявление"""
+        price = property_obj.price_uzs or 0
+        matched = []
+        for property_type in dict.fromkeys((property_obj.property_type, None)):
+            for district in dict.fromkeys((property_obj.district, None)):
+                for rooms in dict.fromkeys((property_obj.rooms, None)):
+                    bucket = self._buckets.get((property_type, district, rooms))
+                    if bucket:
+                        matched.extend(self._searches[search_id] for search_id in bucket.match(price))
+        return matched
@@ -0,0 +1,390 @@
+"""Фасетный индекс активных объявлений для поиска.
+
+Каждое активное объявление занимает позицию (бит) в индексе, позиции
+выдаются по порядку публикации. Для каждого значения фасета (тип, район,
+комнаты) хранится битовая маска - целое число Python, так что фильтр по
+нескольким фасетам - это AND нескольких чисел, а число результатов -
+bit_count().
+
+Цена и площадь хранятся отсортированными границами корзин (квантили при
+построении) и маской для каждой корзины. Диапазон - bisect по границам:
+корзины целиком внутри диапазона объединяются OR, и только объявления двух
+крайних корзин проверяются по значению. Сортировка обходит корзины по
+порядку и упорядочивает внутри корзины лишь нужные объявления; новизна -
+такая же колонка по id. Страницы задаются ключом (значение, id) последнего
+показанного объявления (см. pagination), обход начинается с его корзины.
+
+Индекс обновляется обработчиками событий шины; освободившиеся позиции
+собираются перестроением, когда их становится больше половины.
+"""
+import logging
+from bisect import bisect_right
+
+from sqlalchemy import select
+
+from config import SEARCH_RANGE_BINS
+from database import ReadSession, Property
+from events import PROPERTY_CREATED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED
+
+logger = logging.getLogger(__name__)
+
+# Фасеты: поле объявления и фильтра
+FACETS = ('property_type', 'district', 'rooms')
+SORTS = ('newest', 'price_asc', 'price_desc', 'area_asc', 'area_desc')
+
+
+def _iter_bits(mask: int, descending: bool = False):
+    """Номера установленных битов маски по возрастанию (или убыванию)"""
+    digits = bin(mask)
+    top = len(digits) - 1
+    if descending:
+        index = digits.find('1', 2)
+        while index != -1:
+            yield top - index
+            index = digits.find('1', index + 1)
+    else:
+        index = digits.rfind('1', 2)
+        while index != -1:
+            yield top - index
+            index = digits.rfind('1', 2, index)
+
+
+def _mask_of(positions, size: int) -> int:
+    """Маска из списка позиций (через bytearray: без промежуточных больших чисел)"""
+    if not positions:
+        return 0
+    buffer = bytearray((size >> 3) + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class _RangeColumn:
+    """Числовая колонка (цена, площадь): маски корзин по отсортированным границам"""
+
+    def __init__(self, values, bins: int = SEARCH_RANGE_BINS):
+        # позиция -> значение (None - не указано)
+        self.values = dict(values)
+        known = sorted(value for value in values.values() if value is not None)
+        # Нижние границы корзин - квантили значений
+        self.bounds = sorted({known[i * len(known) // bins] for i in range(bins)}) if known else [0.0]
+
+        size = max(values, default=0) + 1
+        grouped = [[] for _ in self.bounds]
+        missing = []
+        for position, value in values.items():
+            if value is None:
+                missing.append(position)
+            else:
+                grouped[self._bin(value)].append(position)
+        self.bins = [_mask_of(positions, size) for positions in grouped]
+        # Объявления без значения: в диапазон не попадают, в сортировке идут последними
+        self.missing = _mask_of(missing, size)
+
+    def _bin(self, value) -> int:
+        return max(bisect_right(self.bounds, value) - 1, 0)
+
+    def add(self, position: int, value):
+        self.values[position] = value
+        if value is None:
+            self.missing |= 1 << position
+        else:
+            self.bins[self._bin(value)] |= 1 << position
+
+    def remove(self, position: int):
+        value = self.values.pop(position, None)
+        if value is None:
+            self.missing &= ~(1 << position)
+        else:
+            self.bins[self._bin(value)] &= ~(1 << position)
+
+    def mask(self, candidates: int, low=None, high=None) -> int:
+        """Кандидаты со значением в [low, high]"""
+        first = self._bin(low) if low is not None else 0
+        last = self._bin(high) if high is not None else len(self.bins) - 1
+        # Корзины на границах диапазона проверяются по значениям
+        edges = {index for index, bound in ((first, low), (last, high)) if bound is not None}
+
+        inner = 0
+        for index in range(first, last + 1):
+            if index not in edges:
+                inner |= self.bins[index]
+        matched = [
+            position
+            for index in edges
+            for position in _iter_bits(self.bins[index] & candidates)
+            if (low is None or self.values[position] >= low) and (high is None or self.values[position] <= high)
+        ]
+        return inner & candidates | _mask_of(matched, candidates.bit_length())
+
+    def ordered(self, mask: int, ids, descending: bool = False, after=None):
+        """Позиции маски по ключу (значение, id); без значения - в конце, новые первыми.
+
+        after - ключ последнего показанного объявления: обход начинается сразу
+        после него, с его корзины, а не с начала.
+        """
+        def key(position):
+            return self.values[position], ids[position]
+
+        if after is None or after[0] is not None:
+            start = self._bin(after[0]) if after is not None else None
+            if descending:
+                indexes = range(len(self.bins) - 1 if start is None else start, -1, -1)
+            else:
+                indexes = range(start or 0, len(self.bins))
+            for index in indexes:
+                selected = self.bins[index] & mask
+                if not selected:
+                    continue
+                positions = sorted(_iter_bits(selected), key=key, reverse=descending)
+                if after is not None and index == start:
+                    positions = [p for p in positions if (key(p) < after if descending else key(p) > after)]
+                yield from positions
+
+        missing = sorted(_iter_bits(self.missing & mask), key=ids.__getitem__, reverse=True)
+        if after is not None and after[0] is None:
+            missing = [position for position in missing if ids[position] < after[1]]
+        yield from missing
+
+
+class SearchIndex:
+    def __init__(self):
+        self._clear()
+        # События, пришедшие во время полного перечитывания
+        self._replay = None
+
+    def _clear(self):
+        # позиция -> id объявления (None - позиция освобождена)
+        self._ids = []
+        # id объявления -> (позиция, значения фасетов)
+        self._entries = {}
+        self._alive = 0
+        # фасет -> значение -> маска
+        self._facets = {name: {} for name in FACETS}
+        self._price = _RangeColumn({})
+        self._area = _RangeColumn({})
+        # Новизна - порядок id
+        self._newest = _RangeColumn({})
+
+    def register(self, bus):
+        """Подписывает индекс на события объявлений"""
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+        bus.subscribe(PROPERTY_PRICE_CHANGED, self.on_property_price_changed)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ========== ЗАГРУЗКА ==========
+
+    async def load(self):
+        """Перечитывает все активные объявления"""
+        self._replay = []
+        try:
+            async with ReadSession() as session:
+                rows = (await session.execute(
+                    select(Property.id, Property.property_type, Property.district, Property.rooms,
+                           Property.price_uzs, Property.area)
+                    .where(Property.status == 'active')
+                    .order_by(Property.created_at, Property.id)
+                )).all()
+
+            self._build([(row.id, _facet_values(row), row.price_uzs, row.area) for row in rows])
+
+            # Изменения во время чтения новее прочитанного снимка
+            for handler, args in self._replay:
+                handler(*args)
+        finally:
+            self._replay = None
+
+        logger.info(f"Search index loaded: {len(self)} listings")
+        return len(self)
+
+    def _build(self, listings):
+        """Строит индекс заново по списку (id, фасеты, цена, площадь) в порядке публикации"""
+        self._clear()
+        prices, areas = {}, {}
+        # Маски собираются из списков позиций: OR по одному биту на больших числах квадратичен
+        grouped = {name: {} for name in FACETS}
+        for position, (property_id, facets, price, area) in enumerate(listings):
+            self._ids.append(property_id)
+            self._entries[property_id] = (position, facets)
+            for name, value in zip(FACETS, facets):
+                grouped[name].setdefault(value, []).append(position)
+            prices[position] = price
+            areas[position] = area
+        size = len(self._ids)
+        self._facets = {
+            name: {value: _mask_of(positions, size) for value, positions in values.items()}
+            for name, values in grouped.items()
+        }
+        self._alive = (1 << size) - 1
+        self._price = _RangeColumn(prices)
+        self._area = _RangeColumn(areas)
+        self._newest = _RangeColumn(dict(enumerate(self._ids)))
+
+    def _compact(self):
+        """Перестраивает индекс без освободившихся позиций"""
+        self._build([
+            (property_id, self._entries[property_id][1], self._price.values[position], self._area.values[position])
+            for position, property_id in enumerate(self._ids) if property_id is not None
+        ])
+
+    # ========== ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ==========
+
+    async def on_property_created(self, property):
+        if property.status == 'active':
+            self._apply(self._add, property.id, _facet_values(property), property.price_uzs, property.area)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        if new_status == 'active':
+            self._apply(self._add, property.id, _facet_values(property), property.price_uzs, property.area)
+        elif old_status == 'active':
+            self._apply(self._remove, property.id)
+
+    async def on_property_price_changed(self, property, old_price, new_price):
+        self._apply(self._set_price, property.id, new_price)
+
+    def _apply(self, handler, *args):
+        if self._replay is not None:
+            self._replay.append((handler, args))
+        handler(*args)
+
+    def _add(self, property_id: int, facets, price, area):
+        if property_id in self._entries:
+            self._remove(property_id)
+
+        position = len(self._ids)
+        bit = 1 << position
+        self._ids.append(property_id)
+        self._entries[property_id] = (position, facets)
+        self._alive |= bit
+        for name, value in zip(FACETS, facets):
+            values = self._facets[name]
+            values[value] = values.get(value, 0) | bit
+        self._price.add(position, price)
+        self._area.add(position, area)
+        self._newest.add(position, property_id)
+
+    def _remove(self, property_id: int):
+        entry = self._entries.pop(property_id, None)
+        if entry is None:
+            return
+
+        position, facets = entry
+        bit = ~(1 << position)
+        self._ids[position] = None
+        self._alive &= bit
+        for name, value in zip(FACETS, facets):
+            values = self._facets[name]
+            values[value] &= bit
+            if not values[value]:
+                del values[value]
+        self._price.remove(position)
+        self._area.remove(position)
+        self._newest.remove(position)
+
+        if len(self._entries) * 2 < len(self._ids):
+            self._compact()
+
+    def _set_price(self, property_id: int, price):
+        entry = self._entries.get(property_id)
+        if entry is not None:
+            self._price.remove(entry[0])
+            self._price.add(entry[0], price)
+
+    # ========== ЗАПРОСЫ ==========
+
+    def _mask(self, filters: dict) -> int:
+        """Маска объявлений под фильтры"""
+        return self._range_mask(filters, self._facet_mask(filters, self._alive))
+
+    def _facet_mask(self, filters: dict, mask: int, skip: str = None) -> int:
+        """Маска после фильтров фасетов (skip - фасет, фильтр по которому не применяется)"""
+        for name in FACETS:
+            value = _filter_value(filters, name)
+            if name != skip and value is not None:
+                mask &= self._facets[name].get(value, 0)
+                if not mask:
+                    return 0
+        return mask
+
+    def _range_mask(self, filters: dict, mask: int) -> int:
+        """Маска после фильтров цены и площади"""
+        if mask and (filters.get('min_price') or filters.get('max_price')):
+            mask = self._price.mask(mask, filters.get('min_price') or None, filters.get('max_price') or None)
+        if mask and (filters.get('min_area') or filters.get('max_area')):
+            mask = self._area.mask(mask, filters.get('min_area') or None, filters.get('max_area') or None)
+        return mask
+
+    def count(self, filters: dict) -> int:
+        return self._mask(filters).bit_count()
+
+    def matcher(self, filters: dict):
+        """Проверка accept(id) "объявление подходит под фильтры" для отбора кандидатов других индексов"""
+        # Маска переводится в байты один раз: проверка бита в большом числе копирует его
+        bits = self._mask(filters).to_bytes((len(self._ids) >> 3) + 1, 'little')
+        entries = self._entries
+
+        def accept(property_id):
+            entry = entries.get(property_id)
+            return entry is not None and bits[entry[0] >> 3] >> (entry[0] & 7) & 1 == 1
+
+        return accept
+
+    def search(self, filters: dict, sort: str = 'newest', after=None, limit: int = 10):
+        """Страница под фильтры: (id объявлений, всего найдено, ключ для следующей страницы или None).
+
+        Ключ - (значение сортировки, id) последнего объявления страницы.
+        """
+        mask = self._mask(filters)
+        if sort == 'newest':
+            column, descending = self._newest, True
+        elif sort in ('price_asc', 'price_desc'):
+            column, descending = self._price, sort == 'price_desc'
+        elif sort in ('area_asc', 'area_desc'):
+            column, descending = self._area, sort == 'area_desc'
+        else:
+            raise ValueError(f"Unknown sort: {sort}")
+
+        page = []
+        next_key = None
+        for position in column.ordered(mask, self._ids, descending, after):
+            if len(page) == limit:
+                # Есть следующая страница: она начнется после последнего показанного
+                last = self._entries[page[-1]][0]
+                next_key = (column.values[last], page[-1])
+                break
+            page.append(self._ids[position])
+        return page, mask.bit_count(), next_key
+
+    def facets(self, filters: dict):
+        """Число объявлений для каждой кнопки фильтра: фасет -> значение -> число.
+
+        Для фасета учитываются все фильтры, кроме его собственного, - столько
+        объявлений будет найдено, если выбрать это значение.
+        """
+        ranged = self._range_mask(filters, self._alive)
+        result = {}
+        for name in FACETS:
+            mask = self._facet_mask(filters, ranged, skip=name)
+            result[name] = {
+                value: count for value, values in self._facets[name].items()
+                if (count := (values & mask).bit_count())
+            }
+        return result
+
+
+def _facet_values(property):
+    return tuple(getattr(property, name) for name in FACETS)
+
+
+def _filter_value(filters: dict, name: str):
+    """Значение фасета в фильтрах; None и 'any' - любое"""
+    value = filters.get(name)
+    if value in (None, '', 'any'):
+        return None
+    return int(value) if name == 'rooms' else value
+
+
+search_index = SearchIndex()
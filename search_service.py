@@ -0,0 +1,117 @@
+from sqlalchemy import column, func, literal_column, select, table, text
+from config import GEO_MAX_RADIUS_M
+from database import ReadSession, Property
+from fulltext import fts_query
+from geo_index import geo_index
+from pagination import PAGE_SIZE, decode_cursor, encode_cursor, keyset_page
+from search_index import FACETS, search_index
+
+# Полнотекстовый индекс описания и адреса (миграция 10)
+property_fts = table('property_fts', column('rowid'))
+# Вес совпадения в описании и в адресе для bm25
+FTS_WEIGHTS = (1.0, 1.5)
+# Знаков после запятой в ранге (доле от bm25 лучшего совпадения), по которому идут страницы
+FTS_RANK_DIGITS = 2
+
+class SearchService:
+    @staticmethod
+    async def search(filters: dict, sort: str = 'newest', cursor: str = None, per_page: int = PAGE_SIZE):
+        """Ищет активные объявления по фильтрам: (объявления страницы, всего найдено, курсор следующей).
+
+        Фильтры: property_type, district, rooms ('any' - любой), min_price,
+        max_price, min_area, max_area. Фильтрация и сортировка идут по индексу
+        в памяти, из БД читаются только объявления страницы. cursor - курсор
+        из предыдущего вызова (None - первая страница).
+        """
+        ids, total, next_key = search_index.search(filters, sort, after=decode_cursor(cursor), limit=per_page)
+        next_cursor = encode_cursor(next_key) if next_key is not None else None
+        return await SearchService.get_properties(ids), total, next_cursor
+
+    @staticmethod
+    async def search_text(query: str, filters: dict = None, cursor: str = None, per_page: int = PAGE_SIZE):
+        """Полнотекстовый поиск по описанию и адресу: (объявления страницы, курсор следующей).
+
+        Слова запроса ищутся по префиксу после нормализации (fulltext), на
+        русском, узбекском (кириллица и латиница) и английском. Результаты
+        упорядочены по релевантности bm25, фильтры - те же, что у search.
+
+        bm25 зависит от всего индекса (IDF, средняя длина) и меняется с каждым
+        новым объявлением, поэтому страницы идут не по нему, а по доле от bm25
+        лучшего совпадения, округленной до FTS_RANK_DIGITS знаков, и id внутри
+        равной доли. Для запроса из одного слова IDF в доле сокращается, для
+        нескольких слов - почти. Объявление все же может повториться или
+        пропасть между страницами, если новое объявление стало лучшим
+        совпадением или доля перешла через границу округления, - это
+        осознанный компромисс.
+        """
+        match = fts_query(query)
+        if match is None:
+            return [], None
+
+        # Совпадения выбираются из индекса отдельно (MATERIALIZED): иначе SQLite может
+        # пойти от индекса по району или цене и проверять MATCH для каждой строки
+        matches = (
+            select(property_fts.c.rowid.label('id'),
+                   func.bm25(literal_column('property_fts'), *FTS_WEIGHTS).label('score'))
+            .where(text("property_fts MATCH :match").bindparams(match=match))
+            .cte('matches')
+            .prefix_with('MATERIALIZED')
+        )
+        # bm25 отрицателен и тем меньше, чем релевантнее объявление: у лучшего ранг 0
+        best = select(func.min(matches.c.score)).scalar_subquery()
+        ranked = (
+            select(matches.c.id, func.round(1 - matches.c.score / best, FTS_RANK_DIGITS).label('rank'))
+            .cte('ranked')
+        )
+        statement = (
+            select(Property)
+            .join(ranked, ranked.c.id == Property.id)
+            .where(Property.status == 'active', *_filter_conditions(filters or {}))
+        )
+        return await keyset_page(statement, [ranked.c.rank, Property.id], cursor, per_page, descending=False)
+
+    @staticmethod
+    async def search_nearby(latitude: float, longitude: float, radius_m: float, filters: dict = None,
+                            cursor: str = None, per_page: int = PAGE_SIZE):
+        """Активные объявления в радиусе от точки, ближние первыми: (объявления, всего найдено, курсор).
+
+        Радиус ограничен GEO_MAX_RADIUS_M, фильтры - те же, что у search.
+        Учитываются только объявления с координатами.
+        """
+        accept = search_index.matcher(filters) if filters else None
+        ids, total, next_key = geo_index.nearby(
+            latitude, longitude, min(radius_m, GEO_MAX_RADIUS_M), accept,
+            after=decode_cursor(cursor), limit=per_page
+        )
+        next_cursor = encode_cursor(next_key) if next_key is not None else None
+        return await SearchService.get_properties(ids), total, next_cursor
+
+    @staticmethod
+    async def get_properties(ids):
+        """Объявления по списку id в том же порядке"""
+        if not ids:
+            return []
+        async with ReadSession() as session:
+            properties = (await session.scalars(select(Property).where(Property.id.in_(ids)))).all()
+        by_id = {property_obj.id: property_obj for property_obj in properties}
+        return [by_id[property_id] for property_id in ids if property_id in by_id]
+
+    @staticmethod
+    def get_facets(filters: dict):
+        """Число объявлений для кнопок фильтров: {'property_type': {...}, 'district': {...}, 'rooms': {...}}"""
+        return search_index.facets(filters)
+
+
+def _filter_conditions(filters: dict):
+    """Фильтры поиска в виде условий SQL (та же семантика, что у search_index)"""
+    conditions = []
+    for name in FACETS:
+        value = filters.get(name)
+        if value not in (None, '', 'any'):
+            conditions.append(getattr(Property, name) == (int(value) if name == 'rooms' else value))
+    for name, attribute in (('price', Property.price_uzs), ('area', Property.area)):
+        if filters.get(f'min_{name}'):
+            conditions.append(attribute >= filters[f'min_{name}'])
+        if filters.get(f'max_{name}'):
+            conditions.append(attribute <= filters[f'max_{name}'])
+    return conditions
@@ -1,5 +1,11 @@
 from aiogram.fsm.state import State, StatesGroup
 
+class UserStates(StatesGroup):
+    """Основные состояния пользователя"""
+    choosing_language = State()
+    choosing_role = State()
+    main_menu = State()
+
 class PropertyStates(StatesGroup):
     """Состояния для добавления объявления"""
     choosing_property_type = State()
@@ -73,4 +79,4 @@ class UserProfileStates(StatesGroup):
     """Состояния для управления профилем"""
     editing_profile = State()
     changing_phone = State()
-    updating_preferences = State()
+    updating_preferences = State()
@@ -0,0 +1,186 @@
+"""Сводки статистики для дашборда администратора.
+
+Таблица daily_stats хранит две группы строк:
+- period = 'YYYY-MM-DD': дневные потоки (новые пользователи, новые объявления);
+- period = 'total': текущие итоги (пользователи по ролям, активные объявления
+  по районам, сумма и число цен для средней цены).
+
+Строки обновляются инкрементально обработчиками событий шины после коммита
+изменений; reconcile() раз в сутки пересчитывает все строки из исходных
+таблиц, исправляя расхождения (падение между коммитом и обработчиком,
+правки в обход сервисов).
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import STATS_RECONCILE_HOUR
+from database import ReadSession, DailyStat, User, Property
+from events import (
+    PROPERTY_CREATED, PROPERTY_PRICE_CHANGED, PROPERTY_STATUS_CHANGED, USER_CREATED, USER_ROLE_CHANGED
+)
+from write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+TOTAL = 'total'
+
+# Метрики сводки
+USERS = 'users'                         # разрез: роль ('' - без роли)
+USERS_NEW = 'users_new'                 # за день
+PROPERTIES = 'properties'
+PROPERTIES_NEW = 'properties_new'       # за день
+ACTIVE_PROPERTIES = 'active_properties'  # разрез: район
+ACTIVE_PRICE_SUM = 'active_price_sum'
+ACTIVE_PRICE_COUNT = 'active_price_count'
+
+
+class StatsService:
+    def register(self, bus):
+        """Подписывает сводки на события пользователей и объявлений"""
+        bus.subscribe(USER_CREATED, self.on_user_created)
+        bus.subscribe(USER_ROLE_CHANGED, self.on_user_role_changed)
+        bus.subscribe(PROPERTY_CREATED, self.on_property_created)
+        bus.subscribe(PROPERTY_STATUS_CHANGED, self.on_property_status_changed)
+        bus.subscribe(PROPERTY_PRICE_CHANGED, self.on_property_price_changed)
+
+    # ========== ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ==========
+
+    async def on_user_created(self, user):
+        await self.apply([
+            (TOTAL, USERS, user.role or '', 1),
+            (_day(user.created_at), USERS_NEW, '', 1),
+        ])
+
+    async def on_user_role_changed(self, telegram_id, old_role, new_role):
+        await self.apply([
+            (TOTAL, USERS, old_role or '', -1),
+            (TOTAL, USERS, new_role or '', 1),
+        ])
+
+    async def on_property_created(self, property):
+        deltas = [
+            (TOTAL, PROPERTIES, '', 1),
+            (_day(property.created_at), PROPERTIES_NEW, '', 1),
+        ]
+        if property.status == 'active':
+            deltas += _active_deltas(property.district, property.price_uzs, 1)
+        await self.apply(deltas)
+
+    async def on_property_status_changed(self, property, old_status, new_status):
+        deltas = []
+        if old_status == 'active':
+            deltas += _active_deltas(property.district, property.price_uzs, -1)
+        if new_status == 'active':
+            deltas += _active_deltas(property.district, property.price_uzs, 1)
+        await self.apply(deltas)
+
+    async def on_property_price_changed(self, property, old_price, new_price):
+        if property.status != 'active':
+            return
+        await self.apply(
+            _active_deltas(property.district, old_price, -1) + _active_deltas(property.district, new_price, 1)
+        )
+
+    @staticmethod
+    async def apply(deltas):
+        """Прибавляет изменения к строкам сводки: [(period, metric, dimension, delta)]"""
+        merged = {}
+        for period, metric, dimension, delta in deltas:
+            key = (period, metric, dimension)
+            merged[key] = merged.get(key, 0) + delta
+
+        rows = [
+            {'period': period, 'metric': metric, 'dimension': dimension, 'value': delta}
+            for (period, metric, dimension), delta in merged.items() if delta
+        ]
+        if not rows:
+            return
+
+        async def job(session):
+            statement = sqlite_insert(DailyStat)
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=['period', 'metric', 'dimension'],
+                    set_={'value': DailyStat.value + statement.excluded.value}
+                ),
+                rows
+            )
+
+        await run_write(job)
+
+    # ========== ПОЛНЫЙ ПЕРЕСЧЕТ ==========
+
+    @staticmethod
+    async def reconcile():
+        """Пересчитывает всю сводку из таблиц users и properties одной транзакцией"""
+        active = Property.status == 'active'
+        sources = union_all(
+            select(literal(TOTAL), literal(USERS), func.coalesce(User.role, ''), func.count())
+            .group_by(func.coalesce(User.role, '')),
+            select(func.date(User.created_at), literal(USERS_NEW), literal(''), func.count())
+            .where(User.created_at.is_not(None))
+            .group_by(func.date(User.created_at)),
+            select(literal(TOTAL), literal(PROPERTIES), literal(''), func.count())
+            .select_from(Property),
+            select(func.date(Property.created_at), literal(PROPERTIES_NEW), literal(''), func.count())
+            .where(Property.created_at.is_not(None))
+            .group_by(func.date(Property.created_at)),
+            select(literal(TOTAL), literal(ACTIVE_PROPERTIES), func.coalesce(Property.district, ''), func.count())
+            .where(active)
+            .group_by(func.coalesce(Property.district, '')),
+            select(literal(TOTAL), literal(ACTIVE_PRICE_SUM), literal(''), func.coalesce(func.sum(Property.price_uzs), 0))
+            .where(active),
+            select(literal(TOTAL), literal(ACTIVE_PRICE_COUNT), literal(''), func.count(Property.price_uzs))
+            .where(active),
+        )
+
+        async def job(session):
+            await session.execute(delete(DailyStat))
+            await session.execute(
+                sqlite_insert(DailyStat).from_select(['period', 'metric', 'dimension', 'value'], sources)
+            )
+
+        await run_write(job)
+        logger.info("Daily stats reconciled")
+
+    @staticmethod
+    async def ensure_built():
+        """Строит сводку, если таблица пуста (первый запуск после миграции)"""
+        async with ReadSession() as session:
+            exists = await session.scalar(select(DailyStat.metric).limit(1))
+        if exists is None:
+            await StatsService.reconcile()
+
+    @staticmethod
+    def seconds_until_reconcile(now: datetime = None) -> float:
+        """Секунды до ближайшего ночного пересчета (STATS_RECONCILE_HOUR)"""
+        now = now or datetime.now()
+        run_at = now.replace(hour=STATS_RECONCILE_HOUR, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return (run_at - now).total_seconds()
+
+    # ========== ЧТЕНИЕ ==========
+
+    @staticmethod
+    async def get_rows(since: str):
+        """Итоговые строки и дневные строки начиная с даты since ('YYYY-MM-DD')"""
+        async with ReadSession() as session:
+            return (await session.execute(
+                select(DailyStat.period, DailyStat.metric, DailyStat.dimension, DailyStat.value)
+                .where((DailyStat.period == TOTAL) | (DailyStat.period >= since))
+            )).all()
+
+
+def _day(moment: datetime) -> str:
+    return (moment or datetime.now()).date().isoformat()
+
+
+def _active_deltas(district, price, sign: int):
+    deltas = [(TOTAL, ACTIVE_PROPERTIES, district or '', sign)]
+    if price is not None:
+        deltas += [(TOTAL, ACTIVE_PRICE_SUM, '', sign * price), (TOTAL, ACTIVE_PRICE_COUNT, '', sign)]
+    return deltas
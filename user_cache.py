@@ -0,0 +1,105 @@
+"""Кэш профилей пользователей по telegram_id.
+
+Почти каждое обновление читает пользователя (язык, роль) несколько раз.
+Кэш хранит небольшой профиль в LRU-словаре ограниченного размера с TTL;
+сервисы, меняющие эти поля, вызывают invalidate() после коммита.
+
+    user = await user_cache.get(telegram_id)   # dict или None
+    user_cache.invalidate(telegram_id)
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database import ReadSession, User
+
+# Поля профиля, которые держим в кэше
+USER_CACHE_FIELDS = (
+    'id', 'telegram_id', 'username', 'full_name', 'phone', 'role', 'currency',
+    'language', 'role_locked', 'free_period_used', 'rating', 'rating_count'
+)
+
+
+class UserCache:
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # telegram_id -> (профиль или None, время загрузки)
+        self._entries = OrderedDict()
+        # Загрузки в процессе: одновременные промахи по одному ключу ждут один запрос
+        self._loading = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    async def get(self, telegram_id: int):
+        """Профиль пользователя (dict) или None, если пользователя нет"""
+        entry = self._entries.get(telegram_id)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self._entries.move_to_end(telegram_id)
+            self.stats['hits'] += 1
+            return entry[0]
+
+        self.stats['misses'] += 1
+        future = self._loading.get(telegram_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[telegram_id] = future
+        try:
+            profile = await self._load(telegram_id)
+        except Exception as e:
+            if self._loading.get(telegram_id) is future:
+                del self._loading[telegram_id]
+            future.set_exception(e)
+            future.exception()
+            raise
+
+        # Если пока шла загрузка ключ инвалидировали, результат мог устареть
+        if self._loading.get(telegram_id) is future:
+            del self._loading[telegram_id]
+            self.put(telegram_id, profile)
+        future.set_result(profile)
+        return profile
+
+    @staticmethod
+    async def _load(telegram_id: int):
+        async with ReadSession() as session:
+            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
+            return profile_of(user)
+
+    def put(self, telegram_id: int, profile):
+        self._entries[telegram_id] = (profile, time.monotonic())
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, telegram_id: int):
+        """Сбрасывает профиль после изменения роли, языка, телефона и т.п."""
+        self._entries.pop(telegram_id, None)
+        self._loading.pop(telegram_id, None)
+        self.stats['invalidations'] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+
+    def hit_rate(self) -> float:
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def profile_of(user):
+    """Профиль для кэша из ORM-объекта User"""
+    if user is None:
+        return None
+    return {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+
+
+user_cache = UserCache()
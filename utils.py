@@ -6,7 +6,7 @@ from aiogram import Bot
 from aiogram.types import Message
 from database import Database
 
-logger = logging.getLogger(_name_)
+logger = logging.getLogger(__name__)
 
 # Курсы валют (в реальном приложении нужно брать из API)
 EXCHANGE_RATES = {
@@ -51,19 +51,29 @@ def format_price(price: float, currency: str, target_currency: str = None) -> st
         logger.error(f"Ошибка форматирования цены: {e}")
         return f"{price} {currency}"
 
-async def check_subscription(user_id: int, db: Database) -> bool:
-    """Проверка активной подписки пользователя"""
+def format_property_message(property_obj, target_currency: str = None) -> str:
+    """Форматирование карточки объявления"""
+    lines = [f"🏠 <b>{property_obj.property_type}</b> — {property_obj.district}"]
+    if property_obj.address:
+        lines.append(f"📌 {sanitize_text(property_obj.address, 300)}")
+    if property_obj.price_uzs:
+        lines.append(f"💰 {format_price(property_obj.price_uzs, 'UZS', target_currency)}")
+    if property_obj.rooms:
+        lines.append(f"🚪 Комнат: {property_obj.rooms}")
+    if property_obj.area:
+        lines.append(f"📐 Площадь: {property_obj.area:g} м²")
+    if property_obj.description:
+        lines.append("")
+        lines.append(sanitize_text(property_obj.description, 1000))
+    return "\n".join(lines)
+
+async def check_subscription(user_id: int, db: Database = None) -> bool:
+    """Проверка активной подписки пользователя (по кэшу прав, без запроса к БД)"""
+    from entitlements import entitlements
+    
     try:
-        subscription = await db.get_user_subscription(user_id)
-        if not subscription:
-            return False
-            
-        # Проверяем срок действия подписки
-        if subscription['end_date'] < datetime.now():
-            await db.deactivate_subscription(user_id)
-            return False
-            
-        return True
+        # Истекшие подписки выключает периодический проход entitlements.sweep()
+        return await entitlements.is_active(user_id)
         
     except Exception as e:
         logger.error(f"Ошибка проверки подписки: {e}")
@@ -84,31 +94,42 @@ async def send_notification(bot: Bot, user_id: int, message: str,
         logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
         return False
 
+async def queue_notification(user_id: int, message: str, keyboard=None,
+                             parse_mode: str = 'HTML', dedupe_key: str = None) -> bool:
+    """Постановка уведомления в очередь outbox (доставка в фоне с повторами)"""
+    from outbox import queue_message
+    
+    try:
+        await queue_message(user_id, message, parse_mode, keyboard, dedupe_key)
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка постановки уведомления пользователю {user_id} в очередь: {e}")
+        return False
+
 async def broadcast_message(bot: Bot, user_ids: list, message: str, 
                           keyboard=None, parse_mode: str = 'HTML') -> Dict[str, int]:
-    """Массовая рассылка сообщений"""
-    results = {
-        'success': 0,
-        'failed': 0,
+    """Массовая рассылка сообщений с общим лимитом Telegram и учетом RetryAfter"""
+    from broadcast_service import BroadcastService
+    
+    success, failed = await BroadcastService(bot).send_many(user_ids, message, keyboard, parse_mode)
+    return {
+        'success': success,
+        'failed': failed,
         'total': len(user_ids)
     }
-    
-    for user_id in user_ids:
+
+async def run_periodically(interval: float, job, *args, initial_delay: float = 0):
+    """Периодический запуск корутинной функции (для asyncio.create_task)"""
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+    while True:
         try:
-            success = await send_notification(bot, user_id, message, keyboard, parse_mode)
-            if success:
-                results['success'] += 1
-            else:
-                results['failed'] += 1
-                
-            # Задержка чтобы не превысить лимиты Telegram
-            await asyncio.sleep(0.1)
-            
+            await job(*args)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка рассылки пользователю {user_id}: {e}")
-            results['failed'] += 1
-    
-    return results
+            logger.error(f"Ошибка периодической задачи {getattr(job, '__qualname__', job)}: {e}")
+        await asyncio.sleep(interval)
 
 def validate_phone_number(phone: str) -> bool:
     """Валидация номера телефона"""
@@ -229,10 +250,7 @@ def format_stats(stats: Dict[str, Any], language: str = 'ru') -> str:
 async def notify_admins(bot: Bot, admin_ids: list, message: str, db: Database = None):
     """Уведомление администраторов"""
     for admin_id in admin_ids:
-        try:
-            await send_notification(bot, admin_id, message)
-        except Exception as e:
-            logger.error(f"Ошибка уведомления администратора {admin_id}: {e}")
+        await queue_notification(admin_id, message)
 
 def sanitize_text(text: str, max_length: int = 4000) -> str:
     """Очистка текста от опасных символов и обрезка длины"""
@@ -260,17 +278,17 @@ def is_valid_date_range(check_in: datetime, check_out: datetime) -> bool:
     now = datetime.now()
     return check_in >= now and check_out > check_in
 
-async def rate_limit_check(user_id: int, action: str, db: Database, 
-                          limit: int = 10, period: int = 3600) -> bool:
-    """Проверка ограничения частоты запросов"""
+async def rate_limit_check(user_id: int, action: str, db: Database = None, 
+                          limit: int = None, period: int = None) -> bool:
+    """Проверка ограничения частоты запросов (засчитывает действие, если лимит не исчерпан).
+
+    Без limit и period действует правило из config.RATE_LIMITS.
+    """
+    from rate_limiter import user_limiter
+    
     try:
-        key = f"rate_limit:{user_id}:{action}"
-        now = datetime.now().timestamp()
-        
-        # В реальной реализации здесь будет работа с Redis
-        # Для простоты используем in-memory кэш
-        return True
+        return user_limiter.check(user_id, action, limit=limit, period=period)
         
     except Exception as e:
         logger.error(f"Ошибка проверки лимита запросов: {e}")
-        return True
+        return True
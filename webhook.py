@@ -0,0 +1,128 @@
+"""Режим webhook на aiohttp.
+
+Сервер принимает обновления от Telegram, проверяет секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token, сразу отвечает 200 и запускает обработку
+в отдельной задаче, как при polling. Порядок обновлений одного пользователя,
+параллельность и приоритеты обеспечивает middlewares.UpdateScheduler.
+Число принятых, но не обработанных обновлений ограничено: сверх
+WEBHOOK_MAX_PENDING отвечаем 503 и Telegram повторит доставку позже.
+
+Эндпоинты здоровья для балансировщика:
+    GET /healthz - процесс жив;
+    GET /readyz  - есть место для новых обновлений (503 иначе).
+"""
+import asyncio
+import hmac
+import logging
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_MAX_PENDING
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH,
+                 max_pending: int = WEBHOOK_MAX_PENDING, **workflow_data):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.max_pending = max_pending
+        self.workflow_data = workflow_data
+        self._pending = set()
+        self.stats = {'received': 0, 'processed': 0, 'failed': 0, 'rejected': 0, 'unauthorized': 0}
+
+    # ========== HTTP ==========
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/readyz', self.handle_ready)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            self.stats['unauthorized'] += 1
+            return web.Response(status=401)
+
+        try:
+            update = types.Update.model_validate(await request.json(), context={'bot': self.bot})
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        if len(self._pending) >= self.max_pending:
+            # Telegram повторит доставку; так перегрузка не копится в памяти
+            self.stats['rejected'] += 1
+            return web.Response(status=503)
+
+        task = asyncio.create_task(self._process(update, time.monotonic()))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        self.stats['received'] += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        ready = len(self._pending) < self.max_pending
+        return web.json_response(
+            {'status': 'ok' if ready else 'busy', 'pending': len(self._pending), **self.stats},
+            status=200 if ready else 503
+        )
+
+    # ========== ОБРАБОТКА ==========
+
+    async def _process(self, update: types.Update, received_at: float):
+        try:
+            await self.dp.feed_update(self.bot, update, **self.workflow_data)
+            self.stats['processed'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.exception(f"Update {update.update_id} failed: {e}")
+
+        waited = time.monotonic() - received_at
+        if waited > 5:
+            logger.warning(f"Update {update.update_id} processed {waited:.1f}s after receipt")
+
+    async def drain(self):
+        """Дожидается обработки принятых обновлений"""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    # ========== ЗАПУСК ==========
+
+    async def run(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                  base_url: str = WEBHOOK_BASE_URL, set_webhook: bool = True):
+        """Запускает сервер и работает до отмены задачи"""
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+        await self.dp.emit_startup(bot=self.bot, **self.workflow_data)
+        if set_webhook and base_url:
+            await self.bot.set_webhook(
+                url=base_url.rstrip('/') + self.path,
+                secret_token=self.secret or None,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            # Сначала перестаем принимать запросы, затем дорабатываем принятые
+            await runner.cleanup()
+            await self.drain()
+            await self.dp.emit_shutdown(bot=self.bot, **self.workflow_data)
+            await self.bot.session.close()
@@ -0,0 +1,135 @@
+"""Очередь записи с групповым коммитом.
+
+SQLite допускает только одного писателя, поэтому все изменения БД проходят
+через одну задачу: она забирает из очереди накопившиеся за несколько
+миллисекунд задания, выполняет их в одной транзакции и делает один COMMIT
+на всю пачку. Если какое-то задание падает, пачка откатывается и выполняется
+повторно, каждое задание в своей точке сохранения (SAVEPOINT): ошибка
+одного задания не затрагивает остальные. Поэтому задания должны быть
+безопасны для повторного запуска - только работа с переданной сессией.
+
+Задание - корутинная функция, принимающая сессию записи:
+
+    async def job(session):
+        session.add(obj)
+        await session.flush()
+        return obj.id
+
+    result = await write_queue.submit(job)
+"""
+import asyncio
+import logging
+import time
+
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self, session_factory=Session, max_batch: int = 128, max_delay: float = 0.005):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = None
+        self._task = None
+        self.stats = {'jobs': 0, 'batches': 0, 'failed': 0}
+
+    async def submit(self, job):
+        """Ставит задание в очередь и ждет результата после коммита"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future))
+        return await future
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name='write-queue')
+
+    async def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        """Дожидается выполнения поставленных заданий и останавливает задачу"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+
+            # Добираем задания, пришедшие в окне группового коммита
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.exception(f"Write batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch):
+        batch = [(job, future) for job, future in batch if not future.cancelled()]
+        if not batch:
+            return
+
+        try:
+            # Быстрый путь: все задания в одной транзакции без точек сохранения
+            results = await self._run_batch(batch, isolated=False)
+        except Exception:
+            # Задание или коммит упали - повторяем пачку, изолируя каждое задание
+            results = await self._run_batch(batch, isolated=True)
+
+        self.stats['jobs'] += len(batch)
+        self.stats['batches'] += 1
+
+        # Результаты отдаем только после успешного коммита всей пачки
+        for future, result in results:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, batch, isolated: bool):
+        results = []
+        async with self.session_factory() as session:
+            async with session.begin():
+                for job, future in batch:
+                    if not isolated:
+                        results.append((future, await job(session)))
+                        continue
+
+                    try:
+                        async with session.begin_nested():
+                            result = await job(session)
+                        results.append((future, result))
+                    except Exception as e:
+                        self.stats['failed'] += 1
+                        future.set_exception(e)
+        return results
+
+
+write_queue = WriteQueue()
+
+
+async def run_write(job):
+    """Выполняет задание записи через общую очередь"""
+    return await write_queue.submit(job)